@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Compare wall time and peak memory of a full versus a header-only
+repack.Process.DICOMfile_read() over a set of synthetic DICOM files
+with a large PixelData payload.
+
+    python3 benchmarks/bench_DICOMfile_read.py [--files N] [--size PIXELS]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pypx import repack
+from pypx.tests.test_repack import DICOMfile_write
+
+
+def DICOMfiles_read(l_files, **kwargs) -> dict:
+    tracemalloc.start()
+    t_start = time.perf_counter()
+    for str_file in l_files:
+        d_read = repack.Process.DICOMfile_read(file=str_file, **kwargs)
+        # The fields every caller in the repo actually looks at
+        d_read["d_DICOM"]["d_dicomSimple"]
+        d_read["d_DICOM"]["l_tagRaw"]
+    f_elapsed = time.perf_counter() - t_start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": f_elapsed, "peakMB": peak / 1024**2}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size", type=int, default=1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as str_dir:
+        l_files = [
+            DICOMfile_write(
+                os.path.join(str_dir, "%04d.dcm" % i), rows=args.size, cols=args.size
+            )
+            for i in range(args.files)
+        ]
+        for str_mode, d_kwargs in [
+            ("full", {}),
+            ("headerOnly", {"headerOnly": True}),
+        ]:
+            d_result = DICOMfiles_read(l_files, **d_kwargs)
+            print(
+                "%-12s %4d files  %8.3f s  %8.1f files/s  peak %8.2f MB"
+                % (
+                    str_mode,
+                    len(l_files),
+                    d_result["seconds"],
+                    len(l_files) / d_result["seconds"],
+                    d_result["peakMB"],
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Time the placement of a series of files into a storage tree: one at a
+time with shutil.copyfile() (creating the destination directory for
+each file), and with repack.files_place() in a pool of threads, for a
+fresh tree and again for a tree that is already up to date.
+
+    python3 benchmarks/bench_filePlace.py [--files N] [--size KB]
+                                          [--threads N] [--placement P]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pypx import repack
+
+
+def files_copySerially(l_source: list, l_destination: list) -> None:
+    for str_source, str_destination in zip(l_source, l_destination):
+        Path(str_destination).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(str_source, str_destination)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--size", type=int, default=512, help="file size (KB)")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--placement", default="reflink")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as str_tmp:
+        l_source: list = []
+        for i in range(args.files):
+            str_source: str = os.path.join(str_tmp, "series", "%05d.dcm" % i)
+            os.makedirs(os.path.dirname(str_source), exist_ok=True)
+            with open(str_source, "wb") as fp:
+                fp.write(os.urandom(args.size * 1024))
+            l_source.append(str_source)
+
+        for str_method in ["copyfile", "files_place"]:
+            l_destination: list = [
+                str_source.replace(str_tmp, os.path.join(str_tmp, str_method))
+                for str_source in l_source
+            ]
+            for str_run in ["fresh", "again"]:
+                t_start: float = time.perf_counter()
+                if str_method == "copyfile":
+                    files_copySerially(l_source, l_destination)
+                else:
+                    repack.files_place(
+                        l_source, l_destination, args.placement, args.threads
+                    )
+                print(
+                    "%-12s %-6s %8.3f s"
+                    % (str_method, str_run, time.perf_counter() - t_start)
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Time the discovery of the files of a study tree: with os.walk() and a
+filter over the complete list, with PfStorage.filesFind(), and the time
+to the first file of PfStorage.filesFind_iter().
+
+    python3 benchmarks/bench_filesFind.py [--series N] [--files N]
+                                          [--threads N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pypx.pfstorage import fileStorage
+
+
+def filesFind_walk(str_root: str, str_fileSubStr: str) -> list:
+    l_file: list = []
+    for str_dir, l_dirs, l_files in os.walk(str_root):
+        l_file += [os.path.join(str_dir, f) for f in l_files]
+    return [f for f in l_file if str_fileSubStr in f]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--series", type=int, default=200)
+    parser.add_argument("--files", type=int, default=200, help="files per series")
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as str_tmp:
+        for s in range(args.series):
+            str_series: str = os.path.join(str_tmp, "study", "series%04d" % s)
+            os.makedirs(str_series)
+            for i in range(args.files):
+                open(os.path.join(str_series, "%05d.dcm" % i), "w").close()
+        store = fileStorage(
+            {
+                "str_swiftIP": "",
+                "str_swiftPort": "",
+                "str_swiftLogin": "",
+                "str_storeBaseLocation": os.path.join(str_tmp, "store"),
+                "verbosity": 0,
+                "swiftThreads": args.threads,
+            }
+        )
+
+        t_start: float = time.perf_counter()
+        count: int = len(filesFind_walk(str_tmp, ".dcm"))
+        print(
+            "%-22s %8.3f s  %d files"
+            % ("os.walk", time.perf_counter() - t_start, count)
+        )
+
+        t_start = time.perf_counter()
+        count = store.filesFind(root=str_tmp, fileSubStr=".dcm")["numFiles"]
+        print(
+            "%-22s %8.3f s  %d files"
+            % ("filesFind", time.perf_counter() - t_start, count)
+        )
+
+        t_start = time.perf_counter()
+        next(store.filesFind_iter(root=str_tmp, fileSubStr=".dcm"))
+        print("%-22s %8.3f s" % ("filesFind_iter first", time.perf_counter() - t_start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Time when a downstream 'then' operation gets to start on the studies of
+a Find: on the complete report after all the SERIES queries, or on each
+study as it is streamed. The SERIES queries of the PACS are simulated
+with a random latency.
+
+    python3 benchmarks/bench_findStream.py [--studies N] [--latency S]
+                                           [--maxConcurrentQueries N]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pypx.find import Find
+
+
+def find_create(args) -> Find:
+    find = Find(
+        {
+            "StudyOnly": False,
+            "then": "",
+            "withFeedBack": False,
+            "maxConcurrentQueries": args.maxConcurrentQueries,
+            "verbosity": 0,
+        }
+    )
+    random.seed(1)
+    d_latency: dict = {
+        "1.%d" % i: random.uniform(0.5, 1.5) * args.latency for i in range(args.studies)
+    }
+
+    async def systemlevel_runasync(opt, d_params, f_record=None):
+        if d_params["QueryRetrieveLevel"] == "STUDY":
+            return {
+                "status": "success",
+                "command": "findscu STUDY",
+                "data": [
+                    {"StudyInstanceUID": {"value": "1.%d" % i}}
+                    for i in range(args.studies)
+                ],
+            }
+        await asyncio.sleep(d_latency[d_params["StudyInstanceUID"]])
+        return {
+            "status": "success",
+            "command": "findscu SERIES",
+            "data": [{"SeriesInstanceUID": {"value": "1"}}],
+        }
+
+    find.systemlevel_runasync = systemlevel_runasync
+    return find
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--studies", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--maxConcurrentQueries", type=int, default=8)
+    args = parser.parse_args()
+
+    # The report: everything is there once run() returns
+    t_start: float = time.perf_counter()
+    asyncio.run(find_create(args).run({"SeriesInstanceUID": ""}))
+    seconds: float = time.perf_counter() - t_start
+    print("%-8s first study %8.3f s  last study %8.3f s" % ("report", seconds, seconds))
+
+    # The stream: the 'then' operation gets each study as it completes
+    l_arrival: list = []
+
+    async def then_run(opt: dict) -> dict:
+        async for study in opt["studies"]:
+            l_arrival.append(time.perf_counter() - t_start)
+        return {}
+
+    find = find_create(args)
+    find.arg["then"] = "report"
+    find.then.run = then_run
+    t_start = time.perf_counter()
+    asyncio.run(find.run({"SeriesInstanceUID": ""}))
+    print(
+        "%-8s first study %8.3f s  last study %8.3f s"
+        % ("stream", l_arrival[0], l_arrival[-1])
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Compare the wall time of px-find queries (one STUDY pass plus one
+SERIES pass per study) against a local pynetdicom PACS stand-in,
+using the DCMTK 'findscu' subprocess engine and the in-process
+pynetdicom engine.
+
+    python3 benchmarks/bench_find_engine.py [--queries N] [--findscu PATH]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pypx
+from pypx import netdicom
+from pypx.tests.test_netdicom import PACS
+
+
+def queries_run(d_arg: dict, queries: int) -> dict:
+    t_start = time.perf_counter()
+    for i in range(queries):
+        d_find = asyncio.run(pypx.find(dict(d_arg)))
+    return {
+        "seconds": time.perf_counter() - t_start,
+        "status": d_find["status"],
+        "studies": len(d_find["data"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--findscu", default=shutil.which("findscu") or "")
+    args = parser.parse_args()
+
+    pacs = PACS()
+    d_arg: dict = {
+        "aet": "CHRIS",
+        "aec": "TESTPACS",
+        "serverIP": "127.0.0.1",
+        "serverPort": str(pacs.port),
+        "findscu": args.findscu,
+        "StudyOnly": False,
+        "then": "",
+        "withFeedBack": False,
+        "verbosity": 0,
+        "SeriesInstanceUID": "",
+    }
+    l_engine: list = ["pynetdicom"]
+    if args.findscu:
+        l_engine.insert(0, "dcmtk")
+    else:
+        print("No 'findscu' found, only timing the pynetdicom engine")
+    try:
+        for str_engine in l_engine:
+            pacs.associations = 0
+            d_result = queries_run({**d_arg, "engine": str_engine}, args.queries)
+            print(
+                "%-12s %4d queries  %8.3f s  %8.1f ms/query  %3d associations  (%s, %d studies)"
+                % (
+                    str_engine,
+                    args.queries,
+                    d_result["seconds"],
+                    1000 * d_result["seconds"] / args.queries,
+                    pacs.associations,
+                    d_result["status"],
+                    d_result["studies"],
+                )
+            )
+    finally:
+        netdicom.engines_release()
+        pacs.shutdown()
+
+
+if __name__ == "__main__":
+    main()
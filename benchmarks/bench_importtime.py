@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Time the cold start of the px-* tools: the (cumulative) import time of
+their pypx modules as reported by `python -X importtime`, and the wall
+time of `px-<tool> --version`, each the best of a number of runs.
+
+    python3 benchmarks/bench_importtime.py [--runs N] [--budget MS]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+str_root: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+l_module: list = ["pypx", "pypx.repack", "pypx.smdb", "pypx.find", "pypx.pfstorage"]
+l_tool: list = ["px-repack", "px-smdb", "px-find"]
+
+
+def importtime_get(str_module: str) -> float:
+    """
+    Return the cumulative import time of <str_module> in ms.
+    """
+    str_err: str = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % str_module],
+        cwd=str_root,
+        capture_output=True,
+        text=True,
+    ).stderr
+    for str_line in str_err.splitlines():
+        l_field: list = str_line.split("|")
+        if len(l_field) == 3 and l_field[2].strip() == str_module:
+            us: int = int(l_field[1])
+    return us / 1000
+
+
+def toolTime_get(str_tool: str) -> float:
+    """
+    Return the wall time of `<str_tool> --version` in ms.
+    """
+    t_start: float = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(str_root, "bin", str_tool), "--version"],
+        cwd=str_root,
+        capture_output=True,
+    )
+    return (time.perf_counter() - t_start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget", type=float, default=400, help="cold start budget of px-repack (ms)"
+    )
+    args = parser.parse_args()
+
+    for str_module in l_module:
+        ms: float = min(importtime_get(str_module) for i in range(args.runs))
+        print("import %-20s %8.1f ms" % (str_module, ms))
+    for str_tool in l_tool:
+        ms = min(toolTime_get(str_tool) for i in range(args.runs))
+        print("%-27s %8.1f ms" % (str_tool + " --version", ms))
+        if str_tool == "px-repack":
+            repack: float = ms
+    print(
+        "px-repack cold start %s the %.0f ms budget"
+        % ("is within" if repack <= args.budget else "EXCEEDS", args.budget)
+    )
+
+
+if __name__ == "__main__":
+    main()
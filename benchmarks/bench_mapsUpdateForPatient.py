@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Time the repair of the smdb catalog of a patient: the previous one
+mapsUpdateForFile_do() per image, and the batch SMDB.mapsUpdateForPatient_do()
+for a range of header reading processes. Before each run the image logs
+of all the series are cut back to their first image.
+
+    python3 benchmarks/bench_mapsUpdateForPatient.py [--series N] [--images N]
+                                                     [--jobs 1,2,4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from argparse import Namespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pydicom.uid import generate_uid
+
+from pypx import repack, smdb
+from pypx.tests.test_repack import DICOMfile_write
+
+
+def logs_truncate(str_logDir: str) -> None:
+    str_seriesDataDir: str = os.path.join(str_logDir, "seriesData")
+    for str_file in os.listdir(str_seriesDataDir):
+        if str_file.endswith("-images.log"):
+            str_log: str = os.path.join(str_seriesDataDir, str_file)
+            with open(str_log) as fp:
+                str_first: str = fp.readline()
+            with open(str_log, "w") as fp:
+                fp.write(str_first)
+
+
+def perFile_run(str_logDir: str, str_PatientID: str) -> dict:
+    db = smdb.SMDB(Namespace(str_logDir=str_logDir, str_xcrdirfile=""))
+    d_imageInfo: dict = db.imageDirs_getOnPatientID(str_PatientID)
+    for study in d_imageInfo["d_imageDirs"]:
+        for str_seriesDir in d_imageInfo["d_imageDirs"][study]:
+            for f in os.listdir(str_seriesDir):
+                db.args.str_xcrdirfile = "%s/%s" % (str_seriesDir, f)
+                db.mapsUpdateForFile_do()
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--series", type=int, default=4)
+    parser.add_argument("--images", type=int, default=100, help="images per series")
+    parser.add_argument("--jobs", default="1,2,4")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as str_dir:
+        str_xcrDir: str = os.path.join(str_dir, "incoming")
+        str_logDir: str = os.path.join(str_dir, "log")
+        os.makedirs(str_xcrDir)
+        str_StudyInstanceUID: str = generate_uid()
+        for series in range(args.series):
+            str_SeriesInstanceUID: str = generate_uid()
+            for i in range(args.images):
+                DICOMfile_write(
+                    os.path.join(str_xcrDir, "%02d-%05d.dcm" % (series, i)),
+                    StudyInstanceUID=str_StudyInstanceUID,
+                    SeriesInstanceUID=str_SeriesInstanceUID,
+                    InstanceNumber=i + 1,
+                )
+        repack_args, unknown = repack.parser_interpret(
+            repack.parser_setup("bench"),
+            [
+                "--xcrdir",
+                str_xcrDir,
+                "--parseAllFilesWithSubStr",
+                "dcm",
+                "--logdir",
+                str_logDir,
+                "--datadir",
+                os.path.join(str_dir, "data"),
+                "--verbosity",
+                "0",
+            ],
+        )
+        repack.Process(repack_args).run()
+
+        images: int = args.series * args.images
+        logs_truncate(str_logDir)
+        t_start = time.perf_counter()
+        perFile_run(str_logDir, "1234567")
+        seconds: float = time.perf_counter() - t_start
+        print(
+            "%-10s %6d images  %8.3f s  %8.1f images/s"
+            % ("per file", images, seconds, images / seconds)
+        )
+        for jobs in [int(n) for n in args.jobs.split(",")]:
+            logs_truncate(str_logDir)
+            db = smdb.SMDB(Namespace(str_logDir=str_logDir, jobs=jobs))
+            d_timings: dict = db.mapsUpdateForPatient_do("1234567")["timings"]
+            print(
+                "%-10s %6d images  %8.3f s  %8.1f images/s  (%s)"
+                % (
+                    "%d jobs" % jobs,
+                    images,
+                    d_timings["total"],
+                    images / d_timings["total"],
+                    ", ".join(
+                        "%s %.3f s" % (k, v)
+                        for k, v in d_timings.items()
+                        if k != "total"
+                    ),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
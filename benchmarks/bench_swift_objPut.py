@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Measure the throughput of swiftStorage.objPut() against a local swift
+(auth v1.0) stand-in, for a range of worker thread counts, and for the
+previous whole-file read, one-file-at-a-time put.
+
+    python3 benchmarks/bench_swift_objPut.py [--files N] [--size KB]
+                                              [--latency MS] [--threads 1,2,4,8]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pypx.tests.test_pfstorage import Swift, swiftStorage_create
+
+
+def objPut_serialRead(store, l_file: list, str_dir: str) -> dict:
+    """
+    The objPut() loop before streaming: read each file into memory
+    and put it, one file at a time.
+    """
+    d_conn = store.connect()
+    for str_file in l_file:
+        with open(str_file, "rb") as fp:
+            d_conn["conn"].put_object(
+                d_conn["container_name"],
+                str_file.replace(str_dir, "bench"),
+                contents=fp.read(),
+            )
+    return {"status": True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=512, help="file size in KB")
+    parser.add_argument(
+        "--latency", type=float, default=5, help="per-PUT server latency in ms"
+    )
+    parser.add_argument("--threads", default="1,2,4,8")
+    args = parser.parse_args()
+
+    swift = Swift(delay=args.latency / 1000)
+    with tempfile.TemporaryDirectory() as str_dir:
+        l_file: list = []
+        for i in range(args.files):
+            str_file = os.path.join(str_dir, "file%05d.dcm" % i)
+            with open(str_file, "wb") as fp:
+                fp.write(os.urandom(args.size * 1024))
+            l_file.append(str_file)
+        megabytes: float = args.files * args.size / 1024
+
+        l_run: list = [("serial read", None)] + [
+            ("%d threads" % int(n), int(n)) for n in args.threads.split(",")
+        ]
+        try:
+            for str_label, threads in l_run:
+                store = swiftStorage_create(swift)
+                swift.auths = 0
+                swift.maxInFlight = 0
+                t_start = time.perf_counter()
+                if threads is None:
+                    d_put = objPut_serialRead(store, l_file, str_dir)
+                else:
+                    d_put = store.objPut(
+                        fileList=l_file,
+                        toLocation="bench",
+                        mapLocationOver=str_dir,
+                        threads=threads,
+                    )
+                seconds: float = time.perf_counter() - t_start
+                print(
+                    "%-12s %5d files  %8.3f s  %8.1f MB/s  %3d auths  %3d max in flight  (%s)"
+                    % (
+                        str_label,
+                        args.files,
+                        seconds,
+                        megabytes / seconds,
+                        swift.auths,
+                        swift.maxInFlight,
+                        d_put["status"],
+                    )
+                )
+        finally:
+            swift.shutdown()
+            swift.server_close()
+
+
+if __name__ == "__main__":
+    main()
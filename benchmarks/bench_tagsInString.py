@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Time the '%'-tag template substitution of repack: compiling a template,
+evaluating a compiled template, and a full Process.packPath_resolve()
+(the four default pack path templates) for one file's tags.
+
+    python3 benchmarks/bench_tagsInString.py [--calls N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from argparse import Namespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pypx import repack
+from pypx.tests.test_repack import d_tags
+
+
+def timeit(f, calls: int) -> float:
+    """
+    Return the mean microseconds per call of f().
+    """
+    t_start = time.perf_counter()
+    for i in range(calls):
+        f()
+    return 1e6 * (time.perf_counter() - t_start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    process = repack.Process.__new__(repack.Process)
+    process.args = repack.args_impedanceMatch(Namespace())
+    str_template: str = process.args.str_seriesDirTemplate
+    d_DICOMfile_read: dict = {
+        "d_DICOM": {"l_tagRaw": sorted(d_tags), "d_dicomSimple": dict(d_tags)}
+    }
+    template = repack.template_compile(str_template)
+
+    for str_label, f in [
+        ("compile", lambda: repack.Template(str_template)),
+        ("evaluate", lambda: template.evaluate(d_DICOMfile_read["d_DICOM"])),
+        (
+            "tagsInString",
+            lambda: process.tagsInString_process(
+                d_DICOMfile_read["d_DICOM"], str_template
+            ),
+        ),
+        ("packPath", lambda: process.packPath_resolve(d_DICOMfile_read)),
+    ]:
+        print(
+            "%-14s %8d calls  %8.2f us/call"
+            % (str_label, args.calls, timeit(f, args.calls))
+        )
+
+
+if __name__ == "__main__":
+    main()
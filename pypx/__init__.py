@@ -1,53 +1,122 @@
-from .echo import Echo
-from .find import Find
-from .listen import Listen
-from .move import Move
-from .report import Report
-from .nxstatus import Status
-from .do import Do
-from .push import Push
-from .register import Register
-from .pfstorage import swiftStorage, fileStorage
+"""
+The pypx package. The classes (and the modules they live in) are only
+imported when first used (PEP 562), so that a short-lived command like
+px-repack, which runs once per received DICOM file, does not pay for
+importing e.g. aiohttp, dask, or swiftclient.
+"""
+
+import os
+import sys
+import types
+import importlib
+
+# The class names (and modules) of the package
+d_classModule: dict = {
+    "Echo": "echo",
+    "Find": "find",
+    "Listen": "listen",
+    "Move": "move",
+    "Report": "report",
+    "Status": "nxstatus",
+    "Do": "do",
+    "Push": "push",
+    "Register": "register",
+    "swiftStorage": "pfstorage",
+    "fileStorage": "pfstorage",
+}
+
+
+def __getattr__(name: str):
+    if name in d_classModule:
+        value = getattr(
+            importlib.import_module("." + d_classModule[name], __name__), name
+        )
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__() -> list:
+    return sorted(list(globals()) + list(d_classModule))
+
+
+def debugger_attach():
+    """
+    Break into the pudb debugger if the PYPX_DEBUGGER environment
+    variable is set: to '1' for a debugger on the terminal, or to
+    '<host>:<port>' for a remote (telnet) debugger. Only then is the
+    debugger imported.
+    """
+    str_debugger: str = os.environ.get("PYPX_DEBUGGER", "")
+    if not str_debugger:
+        return
+    if ":" in str_debugger:
+        from pudb.remote import set_trace
+
+        str_host, str_port = str_debugger.rsplit(":", 1)
+        set_trace(host=str_host, port=int(str_port), term_size=(252, 63))
+    else:
+        import pudb
+
+        pudb.set_trace()
 
 
 def echo(opt={}):
-    return Echo(opt).run()
+    return __getattr__("Echo")(opt).run()
 
 
 async def find(opt={}):
-    return await Find(opt).run(opt)
+    return await __getattr__("Find")(opt).run(opt)
 
 
 def listen(opt={}):
-    return Listen(opt).run()
+    return __getattr__("Listen")(opt).run()
 
 
 def move(opt={}):
-    return Move(opt).run(opt)
+    return __getattr__("Move")(opt).run(opt)
 
 
 def report(opt={}):
-    return Report(opt).run(opt)
+    return __getattr__("Report")(opt).run(opt)
 
 
 def do(opt={}):
-    return Do(opt).run(opt)
+    return __getattr__("Do")(opt).run(opt)
 
 
 async def status(opt={}):
-    return await Status(opt).run(opt)
+    return await __getattr__("Status")(opt).run(opt)
 
 
 def push(opt={}):
-    return Push(opt).run(opt)
+    return __getattr__("Push")(opt).run(opt)
 
 
 def register(opt={}):
-    return Register(opt).run(opt)
+    return __getattr__("Register")(opt).run(opt)
 
 
 def swiftStore(opt={}):
     if opt.get("str_storeBaseLocation"):
-        return fileStorage(opt).run(opt)
+        return __getattr__("fileStorage")(opt).run(opt)
     else:
-        return swiftStorage(opt).run(opt)
+        return __getattr__("swiftStorage")(opt).run(opt)
+
+
+class Package(types.ModuleType):
+    """
+    Importing a submodule sets it as an attribute of its package. The
+    functions above share their names with the submodules, and (as when
+    the submodules were all imported up front) must keep them.
+    """
+
+    def __setattr__(self, name: str, value):
+        if isinstance(value, types.ModuleType) and isinstance(
+            self.__dict__.get(name), types.FunctionType
+        ):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = Package
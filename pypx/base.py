@@ -1,7 +1,6 @@
 import subprocess, re, collections, codecs
 import asyncio
 import pfmisc
-import pudb
 from pfmisc._colors import Colors
 
 
@@ -19,6 +18,91 @@ def slashescape(err):
 
 codecs.register_error("slashescape", slashescape)
 
+# Patterns for the DICOM tag and value in a line of DCMTK output like
+#
+#   I: (0020,000d) UI [1.2.3.4]                 #  8, 1 StudyInstanceUID
+#
+re_tag = re.compile(r"\((.*?)\)")
+re_value = re.compile(r"\[(.*?)\]")
+
+
+class ResponseParser:
+    """
+    An incremental parser of the text output of the DCMTK executables.
+
+    Lines are fed one at a time to line_parse(), which returns a record
+    as soon as it is complete, i.e. when the "I: -----" delimiter that
+    starts the next record is seen (the last record is returned by
+    close()). Records have the form
+
+        {
+            'uid':      {'tag': 0, 'value': <n>, 'label': 'uid'},
+            '<label>':  {'tag': '<gggg,eeee>', 'value': <value>, 'label': <label>},
+            ...
+        }
+
+    The overall success/error status of the output is tracked as the
+    lines go by.
+    """
+
+    def __init__(self, b_lines: bool = False):
+        # If <b_lines>, then also return the non-record "I: " lines
+        # (used for the echoscu output)
+        self.b_lines: bool = b_lines
+        self.uid: int = 0
+        self.d_record: dict = None
+        self.info_count: int = 0
+        self.error_count: int = 0
+
+    def status(self) -> str:
+        return "success" if not self.error_count else "error"
+
+    def line_parse(self, line: str):
+        """
+        Parse one <line>, and return a completed record (or output line)
+        or None.
+        """
+        d_done = None
+        if line.startswith("I: "):
+            self.info_count += 1
+        elif line.startswith("E: ") or "error" in line.lower():
+            self.error_count += 1
+
+        if line.startswith("I: ---------------------------"):
+            d_done = self.d_record
+            self.d_record = {"uid": {"tag": 0, "value": self.uid, "label": "uid"}}
+            self.uid += 1
+
+        elif line.startswith("I: "):
+            lineSplit = line.split()
+            match = re_tag.search(lineSplit[1]) if len(lineSplit) >= 8 else None
+            if match and self.d_record is not None:
+                # extract DICOM tag
+                tag = match.group(1).strip().replace("\x00", "")
+
+                # extract value
+                value = re_value.search(line)
+                if value != None:
+                    value = value.group(1).strip().replace("\x00", "")
+                else:
+                    value = "no value provided for %s" % tag
+
+                # extract label
+                label = lineSplit[-1].strip()
+
+                self.d_record[label] = {"tag": tag, "value": value, "label": label}
+            elif self.b_lines:
+                d_done = line
+        return d_done
+
+    def close(self):
+        """
+        Return the last record (if any).
+        """
+        d_done = self.d_record
+        self.d_record = None
+        return d_done
+
 
 class Base:
     """
@@ -73,6 +157,7 @@ class Base:
                 "verbosity": 1,
                 "retrieve": False,
                 "move": False,
+                "engine": "dcmtk",
             }
         )
 
@@ -80,6 +165,18 @@ class Base:
 
         self.dp = pfmisc.debug(verbosity=self.verbosity, within="Base", syslog=False)
 
+    def engine_get(self):
+        """
+        Return the in-process pynetdicom engine for the PACS if the
+        'pynetdicom' engine has been selected, else None, in which
+        case requests are run through the DCMTK executables.
+        """
+        if self.engine != "pynetdicom":
+            return None
+        from pypx import netdicom
+
+        return netdicom.engine_get(self.aet, self.aec, self.serverIP, self.serverPort)
+
     def systemlevel_run(self, opt, d_params):
         """
         Run the system command, based on the passed parameter dictionary
@@ -107,11 +204,17 @@ class Base:
 
         return d_ret
 
-    async def systemlevel_runasync(self, opt, d_params):
+    async def systemlevel_runasync(self, opt, d_params, f_record=None):
         """
         Run the system command asynchronously, based on the passed parameter
-        dictionary. Avoid using if large amounts of stdout data is generated!
-        Output is assumed to be UTF-8 text.
+        dictionary. Output is assumed to be UTF-8 text.
+
+        The output is parsed line by line as it is read from the pipe, and
+        each record is passed to the optional <f_record> callable as soon
+        as it is complete. The raw output text is not kept; if the output
+        signals an error, the returned 'data' is the text of the lines that
+        are not part of a record. Note the 'status' is only known at the
+        end, so the records passed may be of a query that then fails.
         """
         b_commandGen = False
         str_cmd = ""
@@ -127,21 +230,55 @@ class Base:
                 opt[k] = v
 
         if b_commandGen:
-            str_cmd = f_commandGen(opt) + " | strings "
+            str_cmd = f_commandGen(opt)
             self.dp.qprint("\n%s" % str_cmd, level=5, type="status")
             raw_response = await asyncio.create_subprocess_shell(
-                str_cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                str_cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=2**20,
             )
-
-            stdout, stderr = await raw_response.communicate()
-
+            parser = ResponseParser(type(self).__name__ == "Echo")
+            l_data: list = []
+            l_log: list = []
+
+            def lines_parse(l_lines) -> None:
+                for line in l_lines:
+                    line = line.decode("utf-8", "slashescape").rstrip("\r\n")
+                    record = parser.line_parse(line)
+                    if record is None:
+                        if not line.startswith("I: ("):
+                            l_log.append(line)
+                        continue
+                    l_data.append(record)
+                    if f_record:
+                        f_record(record)
+
+            stderr = asyncio.ensure_future(raw_response.stderr.read())
+            b_stdout: bool = False
+            async for line in raw_response.stdout:
+                b_stdout = True
+                lines_parse([line])
             # if only stderr and not stdout, then equate the two...
-            if not stdout and stderr:
-                stdout = stderr
-
-            d_ret = self.__formatResponseHelper(
-                stdout, str_cmd, raw_response.returncode
-            )
+            if not b_stdout:
+                lines_parse((await stderr).splitlines(keepends=True))
+            else:
+                await stderr
+            record = parser.close()
+            if record is not None:
+                l_data.append(record)
+                if f_record:
+                    f_record(record)
+            await raw_response.wait()
+
+            d_ret = {
+                "status": parser.status(),
+                "data": l_data,
+                "command": str_cmd,
+                "returncode": raw_response.returncode,
+            }
+            if d_ret["status"] == "error":
+                d_ret["data"] = "\n".join(l_log)
 
         return d_ret
 
@@ -181,49 +318,14 @@ class Base:
 
     def parseResponse(self, response):
         data = []
-
-        uid = 0
-        std_split = response.split("\n")
-
-        for line in std_split:
-            if line.startswith("I: ---------------------------"):
-                data.append({})
-                data[-1]["uid"] = {}
-                data[-1]["uid"]["tag"] = 0
-                data[-1]["uid"]["value"] = uid
-                data[-1]["uid"]["label"] = "uid"
-                uid += 1
-
-            elif line.startswith("I: "):
-                lineSplit = line.split()
-                if len(lineSplit) >= 8 and re.search("\((.*?)\)", lineSplit[1]) != None:
-                    # extract DICOM tag
-                    tag = (
-                        re.search("\((.*?)\)", lineSplit[1])
-                        .group(0)[1:-1]
-                        .strip()
-                        .replace("\x00", "")
-                    )
-
-                    # extract value
-                    value = re.search("\[(.*?)\]", line)
-                    if value != None:
-                        value = value.group(0)[1:-1].strip().replace("\x00", "")
-                    else:
-                        value = "no value provided for %s" % tag
-
-                    # extract label
-                    label = lineSplit[-1].strip()
-
-                    data[-1][label] = {}
-                    data[-1][label]["tag"] = tag
-                    data[-1][label]["value"] = value
-                    data[-1][label]["label"] = label
-                else:
-                    # Only append the line output for the echo command
-                    if type(self).__name__ == "Echo":
-                        data.append(line)
-
+        parser = ResponseParser(type(self).__name__ == "Echo")
+        for line in response.split("\n"):
+            record = parser.line_parse(line)
+            if record is not None:
+                data.append(record)
+        record = parser.close()
+        if record is not None:
+            data.append(record)
         return data
 
     def formatResponse(self, raw_response):
@@ -2,7 +2,6 @@
 # import  argparse
 # import  subprocess, re, collections
 from pfmisc.other import list_removeDuplicates
-import pudb
 import json
 
 import asyncio
@@ -23,7 +22,8 @@ from .base import Base
 from .move import Move
 import pypx
 from pypx import smdb
-from pypx import report
+from pypx import nxstatus
+from .report import Report
 from pypx.push import parser_setup as pushParser_setup
 from pypx.push import parser_JSONinterpret as pushParser_JSONinterpret
 from pypx.register import parser_setup as registerParser_setup
@@ -91,6 +91,30 @@ def parser_setup(str_desc):
         default="0",
         help="If specified, then wait specified seconds between retrieve series loops",
     )
+    parser.add_argument(
+        "--maxRetrieveSeries",
+        action="store",
+        dest="maxRetrieveSeries",
+        type=int,
+        default=1,
+        help="Maximum number of series C-MOVEs to have in flight at once",
+    )
+    parser.add_argument(
+        "--maxRetrieveImages",
+        action="store",
+        dest="maxRetrieveImages",
+        type=int,
+        default=0,
+        help="If non-zero, the maximum number of retrieved images not yet repacked before further C-MOVEs are held back",
+    )
+    parser.add_argument(
+        "--maxConcurrentCUBEqueries",
+        action="store",
+        dest="maxConcurrentCUBEqueries",
+        type=int,
+        default=8,
+        help="Maximum number of CUBE API requests of a status to have in flight at once",
+    )
 
     parser.add_argument(
         "--move",
@@ -179,6 +203,88 @@ def parser_JSONinterpret(parser, d_JSONargs):
     return parser_interpret(parser, l_args)
 
 
+class RetrieveScheduler:
+    """
+    Schedule the C-MOVE requests of a retrieve so that several series
+    are pulled from the PACS at once without overrunning the receiving
+    side (storescp/repack).
+
+    At most <maxSeries> C-MOVEs are in flight at any time. If <maxImages>
+    is non-zero, a C-MOVE is furthermore only started when the number of
+    images that have been requested but not yet repacked, as reported by
+    <f_pending>(SeriesInstanceUID), plus the images of the new series
+    does not exceed <maxImages>. A series that is by itself larger than
+    <maxImages> is started once nothing else is outstanding.
+
+    A series whose pending count has not changed for <stallTimeout>
+    seconds (for instance if the PACS sent fewer images than it announced)
+    no longer holds back the others.
+    """
+
+    def __init__(
+        self,
+        maxSeries: int = 1,
+        maxImages: int = 0,
+        f_pending=None,
+        pollInterval: float = 1.0,
+        stallTimeout: float = 60.0,
+    ):
+        self.maxSeries: int = max(1, int(maxSeries))
+        self.maxImages: int = max(0, int(maxImages)) if f_pending else 0
+        self.f_pending = f_pending
+        self.pollInterval: float = pollInterval
+        self.stallTimeout: float = stallTimeout
+        self.seriesInFlight: int = 0
+        # SeriesInstanceUID -> [<pending images>, <time of last change>]
+        self.d_outstanding: dict = {}
+        self.condition: asyncio.Condition = None
+
+    def outstanding_update(self) -> int:
+        """
+        Refresh, and return, the number of images that have been requested
+        but not yet repacked.
+        """
+        now: float = time.monotonic()
+        for str_seriesUID, l_pending in list(self.d_outstanding.items()):
+            pending: int = max(0, int(self.f_pending(str_seriesUID)))
+            if pending != l_pending[0]:
+                l_pending[:] = [pending, now]
+            if not pending or now - l_pending[1] > self.stallTimeout:
+                del self.d_outstanding[str_seriesUID]
+        return sum([l_pending[0] for l_pending in self.d_outstanding.values()])
+
+    def admit(self, images: int) -> bool:
+        if self.seriesInFlight >= self.maxSeries:
+            return False
+        if not self.maxImages:
+            return True
+        outstanding: int = self.outstanding_update()
+        return not outstanding or outstanding + images <= self.maxImages
+
+    async def series_retrieve(self, str_seriesUID: str, images: int, f_move) -> dict:
+        """
+        Wait until the series of <images> can be retrieved, and then run
+        the (blocking) <f_move>() in a worker thread.
+        """
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            while not self.admit(images):
+                try:
+                    await asyncio.wait_for(self.condition.wait(), self.pollInterval)
+                except asyncio.TimeoutError:
+                    pass
+            self.seriesInFlight += 1
+            if self.maxImages:
+                self.d_outstanding[str_seriesUID] = [images, time.monotonic()]
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, f_move)
+        finally:
+            async with self.condition:
+                self.seriesInFlight -= 1
+                self.condition.notify_all()
+
+
 class Do(Base):
     """
     The Do module provides a convient and centralised location
@@ -263,6 +369,17 @@ class Do(Base):
         multiple series (each with multiple DICOM files) in multiple studies
         all at once could result in thousands of `storescp` being spawned
         to try and handle the flood.
+
+        A retrieve is therefore run through a RetrieveScheduler: at most
+        <maxRetrieveSeries> C-MOVEs are in flight at once, and if
+        <maxRetrieveImages> is set, new C-MOVEs are held back while that
+        many requested images have not yet been repacked. All the C-MOVEs
+        of a retrieve complete before the next 'then' operation starts.
+
+        The studies are those of the <reportData>, or, if an (async)
+        iterable of <studies> is passed in the <opt>, those it yields
+        (see pypx.stream). The first 'then' operation then starts on
+        each study as it arrives, and adds it to the <reportData>.
         """
 
         def countDownTimer_do(f_time):
@@ -291,6 +408,9 @@ class Do(Base):
             Delay can be a simple fixed interval in (float) seconds,
             or if the delay is the string "dynamic" then delay by
             a function of the number of images retrieved.
+
+            The count down is only shown if series are retrieved one
+            at a time.
             """
             factor = 1
             f_sleep = 0.0
@@ -304,11 +424,74 @@ class Do(Base):
                     l_words = str_line.split()
                     images = int(l_words[1])
                     f_sleep = float(images) / factor
-                countDownTimer_do(f_sleep)
+                if scheduler.maxSeries == 1:
+                    countDownTimer_do(f_sleep)
+                else:
+                    time.sleep(f_sleep)
+
+        def seriesPending(str_seriesUID) -> int:
+            """
+            The number of images of a series that have been requested
+            but not yet repacked.
+            """
+            requested: int = db.series_requestedFilesCount(str_seriesUID)["count"]
+            if requested <= 0:
+                return 0
+            return requested - db.series_receivedFilesCount(str_seriesUID)["count"]
 
-        def retrieve_do() -> dict:
+        async def seriesMove_do(series, str_studyUID, str_seriesUID, str_line) -> dict:
             """
-            Nested retrieve handler
+            Nested scheduled C-MOVE of a series, followed by the
+            optional intra series delay.
+            """
+            d_arg: dict = {
+                **self.arg,
+                "StudyInstanceUID": str_studyUID,
+                "SeriesInstanceUID": str_seriesUID,
+            }
+
+            def move_do() -> dict:
+                d_then: dict = {}
+                if self.move:
+                    d_then = pypx.move(d_arg)
+                elif self.engine_get():
+                    d_then = self.engine_get().move(
+                        {
+                            "QueryRetrieveLevel": "SERIES",
+                            "StudyInstanceUID": str_studyUID,
+                            "SeriesInstanceUID": str_seriesUID,
+                        },
+                        self.aet,
+                    )
+                else:
+                    d_then = self.systemlevel_run(
+                        d_arg,
+                        {
+                            "f_commandGen": self.movescu_command,
+                            "series_uid": str_seriesUID,
+                            "study_uid": str_studyUID,
+                        },
+                    )
+                if "intraSeriesRetrieveDelay" in self.arg.keys():
+                    if self.arg["intraSeriesRetrieveDelay"]:
+                        seriesRetrieveDelay_do(str_line)
+                return d_then
+
+            d_then: dict = await scheduler.series_retrieve(
+                str_seriesUID,
+                int(series["NumberOfSeriesRelatedInstances"]["value"]),
+                move_do,
+            )
+            series["PACS_retrieve"] = {"requested": "%s" % datetime.now()}
+            db.d_DICOM["SeriesInstanceUID"] = str_seriesUID
+            db.seriesData("retrieve", "command", d_then)
+            return d_then
+
+        def retrieve_do():
+            """
+            Nested retrieve handler. This returns either the (error)
+            dictionary of the DB update, or the scheduled C-MOVE task
+            of the series.
             """
             nonlocal series, studyIndex, seriesIndex
             seriesInstances: int = series["NumberOfSeriesRelatedInstances"]["value"]
@@ -328,47 +511,23 @@ class Do(Base):
                     "value": str_line,
                     "label": "inlineRetrieveText",
                 }
-                if self.move:
-                    d_then = pypx.move(
-                        {
-                            **self.arg,
-                        }
-                    )
-                else:
-                    d_then = self.systemlevel_run(
-                        self.arg,
-                        {
-                            "f_commandGen": self.movescu_command,
-                            "series_uid": str_seriesUID,
-                            "study_uid": str_studyUID,
-                        },
-                    )
-                if "intraSeriesRetrieveDelay" in self.arg.keys():
-                    if self.arg["intraSeriesRetrieveDelay"]:
-                        seriesRetrieveDelay_do(str_line)
-                series["PACS_retrieve"] = {"requested": "%s" % datetime.now()}
-                d_db = db.seriesData("retrieve", "command", d_then)
+                return asyncio.ensure_future(
+                    seriesMove_do(series, str_studyUID, str_seriesUID, str_line)
+                )
             else:
                 if self.arg["withFeedBack"]:
                     self.log(d_db["error"])
                 d_then = d_db
             return d_then
 
-        async def status_do() -> dict:
+        async def seriesStatus_do(opt, series, studyIndex, seriesIndex, prior) -> dict:
             """
-            Nested status handler
+            Get the status of one series, and once the status of the
+            <prior> series is shown, show it.
             """
-            # pudb.set_trace()
-            nonlocal series, seriesIndex
-            d_then: dict = {}
-
-            self.arg["verifySeriesInStudy"] = True
-            self.arg["series"] = series
-            d_then = await pypx.status(
-                {
-                    **self.arg,
-                }
-            )
+            d_then: dict = await pypx.status(opt)
+            if prior is not None:
+                await prior
 
             str_line = presenter.seriesStatus_print(
                 studyIndex=studyIndex, seriesIndex=seriesIndex, status=d_then
@@ -384,6 +543,34 @@ class Do(Base):
 
             return d_then
 
+        def status_do() -> asyncio.Future:
+            """
+            Nested status handler. The smdb side of the status is
+            answered from the <d_statusIndex> of the whole study, and
+            the statuses of the series of a study are scheduled to run
+            concurrently (their CUBE queries share one client, see
+            nxstatus.CUBEclient).
+            """
+            # pudb.set_trace()
+            nonlocal series, seriesIndex, statusPrior
+
+            self.arg["verifySeriesInStudy"] = True
+            self.arg["series"] = series
+            statusPrior = asyncio.ensure_future(
+                seriesStatus_do(
+                    {
+                        **self.arg,
+                        "statusIndex": d_statusIndex,
+                        "CUBEstudy": d_CUBEstudy,
+                    },
+                    series,
+                    studyIndex,
+                    seriesIndex,
+                    statusPrior,
+                )
+            )
+            return statusPrior
+
         def report_do() -> dict:
             """
             Nested simple "echo/show" handler -- can be used as a 'then' in lieu
@@ -483,18 +670,40 @@ class Do(Base):
 
         db = smdb.SMDB(Namespace(str_logDir=self.arg["dblogbasepath"]))
         db.housingDirs_create()
-        d_filteredHits = self.arg["reportData"]
+        scheduler = RetrieveScheduler(
+            maxSeries=self.arg.get("maxRetrieveSeries", 1),
+            maxImages=self.arg.get("maxRetrieveImages", 0),
+            f_pending=seriesPending,
+        )
+        d_filteredHits = opt.get("reportData", self.arg.get("reportData"))
+        studies = opt.get("studies")
 
         # In the case of in-line updates on the progress of the
         # postprocess, we need to create a presentation/report object
         # which we can use for the reporting.
         # pudb.set_trace()
-        presenter = report.Report({"colorize": "dark", "reportData": d_filteredHits})
+        presenter = Report({"colorize": "dark", "reportData": d_filteredHits})
         presenter.run()
+
+        async def studies_get(thenIndex: int):
+            """
+            Nested study iterator: the first 'then' operation pulls the
+            studies from the stream (if any), the others the <reportData>.
+            """
+            if studies is None or thenIndex:
+                for study in d_filteredHits["data"]:
+                    yield study
+            else:
+                async for study in studies:
+                    presenter.study_add(study)
+                    yield study
+
         l_run = []
         d_ret = {"do": False}
         b_status: bool = False
 
+        d_statusIndex: dict = {}
+        d_CUBEstudy: dict = {}
         l_then = self.arg["then"].split(",")
         l_thenArgs = self.arg["thenArgs"].split(";")
         d_then: dict = {}
@@ -511,10 +720,25 @@ class Do(Base):
                 d_thenArgs = {}
             thenIndex += 1
             studyIndex = 0
+            # The (l_run, index) slots of scheduled retrieves
+            l_scheduled: list = []
             d_ret["%02d-%s" % (thenIndex, then)] = {"study": []}
-            for study in d_filteredHits["data"]:
+            async for study in studies_get(thenIndex):
                 l_run = []
                 seriesIndex = 0
+                if then == "status":
+                    # Read the smdb tables, and the CUBE records, of all the
+                    # series of the study at once
+                    d_statusIndex = db.study_seriesIndexGet(
+                        study["StudyInstanceUID"]["value"],
+                        [
+                            d_series["SeriesInstanceUID"]["value"]
+                            for d_series in study["series"]
+                        ],
+                    )
+                    d_CUBEstudy = await nxstatus.Status(self.arg).CUBEstudy_get(
+                        study["StudyInstanceUID"]["value"]
+                    )
                 if self.arg["withFeedBack"]:
                     print("")
                     print(
@@ -532,6 +756,7 @@ class Do(Base):
                         + "[ SERIES %s ]" % then
                         + Colors.NO_COLOUR
                     )
+                statusPrior: asyncio.Future = None
                 for series in study["series"]:
                     str_seriesDescription = series["SeriesDescription"]["value"]
                     str_seriesUID = series["SeriesInstanceUID"]["value"]
@@ -544,7 +769,7 @@ class Do(Base):
                     if then == "retrieve":
                         d_then = retrieve_do()
                     if then == "status":
-                        d_then = await status_do()
+                        d_then = status_do()
                     if then == "push":
                         d_then = push_do(d_thenArgs)
                     if then == "register":
@@ -552,6 +777,10 @@ class Do(Base):
                     if then == "report":
                         d_then = report_do()
                     l_run.append(d_then)
+                    if isinstance(d_then, asyncio.Future):
+                        l_scheduled.append((l_run, len(l_run) - 1))
+                        seriesIndex += 1
+                        continue
                     if "status" in d_then:
                         if not d_then["status"] and then != "status":
                             break
@@ -560,11 +789,21 @@ class Do(Base):
                                 if self.arg["withFeedBack"]:
                                     print(json.dumps(d_then, indent=4))
                     seriesIndex += 1
+                if then == "status":
+                    # Show all the series of a study before the next study
+                    for l_slot, index in l_scheduled:
+                        l_slot[index] = await l_slot[index]
+                    l_scheduled = []
                 d_ret["%02d-%s" % (thenIndex, then)]["study"].append(
                     {study["StudyInstanceUID"]["value"]: l_run}
                 )
                 studyIndex += 1
                 d_ret["do"] = True
+            # Wait for all the scheduled retrieves before the next 'then'
+            for l_slot, index in l_scheduled:
+                l_slot[index] = await l_slot[index]
+            if then == "status":
+                await nxstatus.CUBEclients_close()
         return d_ret
 
     def xinetd_command(self, opt={}):
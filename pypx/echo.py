@@ -1,6 +1,5 @@
 # Global modules
 import  subprocess
-import  pudb
 import  json
 import  pfmisc
 from    pfmisc._colors      import  Colors
@@ -41,10 +40,14 @@ class Echo(Base):
 
     def run(self, opt={}):
 
-        d_echoRun = self.systemlevel_run(self.arg, 
+        engine      = self.engine_get()
+        if engine:
+            d_echoRun = engine.echo()
+        else:
+            d_echoRun = self.systemlevel_run(self.arg,
                 {
                     'f_commandGen':         self.echoscu_command
                 }
-        )
+            )
 
         return d_echoRun
@@ -3,7 +3,6 @@ import subprocess, re, collections
 import asyncio
 from typing import Dict, TypedDict
 
-import pudb
 import json
 import os
 import sys
@@ -13,6 +12,7 @@ from terminaltables import SingleTable
 from argparse import Namespace, ArgumentParser
 from argparse import RawTextHelpFormatter
 import time
+import threading
 
 import pfmisc
 from pfmisc._colors import Colors
@@ -24,9 +24,8 @@ from .base import Base
 from .move import Move
 import pypx
 from pypx import smdb
-from pypx import report
-from pypx import do
-import copy
+from .do import Do
+from pypx import stream
 
 
 def parser_setup(str_desc):
@@ -127,6 +126,14 @@ def parser_setup(str_desc):
         default="/usr/bin/movescu",
         help='"movescu" executable absolute location',
     )
+    parser.add_argument(
+        "--engine",
+        action="store",
+        dest="engine",
+        type=str,
+        default="dcmtk",
+        help="DICOM network engine: 'dcmtk' (executables) or 'pynetdicom'",
+    )
 
     # Query settings
     parser.add_argument(
@@ -295,6 +302,38 @@ def parser_setup(str_desc):
         default="0",
         help="If specified, then wait specified seconds between retrieve series loops",
     )
+    parser.add_argument(
+        "--maxConcurrentQueries",
+        action="store",
+        dest="maxConcurrentQueries",
+        type=int,
+        default=8,
+        help="Maximum number of SERIES level queries to run concurrently",
+    )
+    parser.add_argument(
+        "--maxConcurrentCUBEqueries",
+        action="store",
+        dest="maxConcurrentCUBEqueries",
+        type=int,
+        default=8,
+        help="Maximum number of CUBE API requests of a status to have in flight at once",
+    )
+    parser.add_argument(
+        "--maxRetrieveSeries",
+        action="store",
+        dest="maxRetrieveSeries",
+        type=int,
+        default=1,
+        help="Maximum number of series C-MOVEs to have in flight at once",
+    )
+    parser.add_argument(
+        "--maxRetrieveImages",
+        action="store",
+        dest="maxRetrieveImages",
+        type=int,
+        default=0,
+        help="If non-zero, the maximum number of retrieved images not yet repacked before further C-MOVEs are held back",
+    )
     parser.add_argument(
         "--move",
         action="store_true",
@@ -311,6 +350,22 @@ def parser_setup(str_desc):
         help="If specified, dump the JSON structure relating to the query",
     )
 
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        dest="ndjson",
+        default=False,
+        help="If specified, print each STUDY/SERIES record as a line of JSON as soon as it is received",
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        dest="stream",
+        default=False,
+        help="If specified, print the result as a stream of JSON lines, one per STUDY as soon as its SERIES are known (see pypx.stream)",
+    )
+
     parser.add_argument(
         "-v",
         "--verbosity",
@@ -428,7 +483,13 @@ class Find(Base):
         super(Find, self).__init__(arg)
         self.dp = pfmisc.debug(verbosity=self.verbosity, within="Find", syslog=False)
         self.log = self.dp.qprint
-        self.then = do.Do(self.arg)
+        self.then = Do(self.arg)
+        self.ndjson: bool = bool(self.arg.get("ndjson", False))
+        self.ndjsonLock = threading.Lock()
+        self.stream: bool = bool(self.arg.get("stream", False))
+        self.maxConcurrentQueries: int = max(
+            1, int(self.arg.get("maxConcurrentQueries", 8))
+        )
 
     def queryCustom_create(self) -> dict:
         parameters: dict = {}
@@ -440,7 +501,11 @@ class Find(Base):
             self.arg["StudyOnly"] = False
         return parameters
 
-    def query(self, opt={}):
+    def queryParameters_get(self, opt={}) -> collections.OrderedDict:
+        """
+        Return the (sorted) query keys and their values, where an empty
+        value is a return key.
+        """
         custom: dict = {}
         parameters = (
             {
@@ -475,16 +540,20 @@ class Find(Base):
             else custom
         )
 
-        query = ""
         # we use a sorted dictionary so we can test generated command
         # more easily
         ordered = collections.OrderedDict(
             sorted(parameters.items(), key=lambda t: t[0])
         )
-        for key, value in ordered.items():
+        for key in ordered.keys():
             # update value if provided
             if key in opt:
-                value = opt[key]
+                ordered[key] = opt[key]
+        return ordered
+
+    def query(self, opt={}):
+        query = ""
+        for key, value in self.queryParameters_get(opt).items():
             # update query
             if value != "":
                 query += ' -k "' + key + "=" + value + '"'
@@ -506,6 +575,68 @@ class Find(Base):
         )
         return str_cmd
 
+    def record_ndjsonPrint(self, str_level: str, d_record: dict) -> None:
+        """
+        Print a single STUDY/SERIES record as one line of JSON.
+        """
+        str_line: str = json.dumps(
+            {"QueryRetrieveLevel": str_level, "record": d_record}
+        )
+        with self.ndjsonLock:
+            sys.stdout.write(str_line + "\n")
+            sys.stdout.flush()
+
+    def ndjson_statusPrint(self, d_response: dict, d_fields: dict) -> None:
+        """
+        Print the status of a query (or the final one of the run, with
+        the number of its studies) as one line of JSON. A record line
+        precedes the status of its query, which may still be an error.
+        """
+        str_line: str = json.dumps(
+            {
+                **d_fields,
+                "status": d_response["status"],
+                "command": d_response["command"],
+            }
+        )
+        with self.ndjsonLock:
+            sys.stdout.write(str_line + "\n")
+            sys.stdout.flush()
+
+    def record_callback(self, d_params: dict):
+        """
+        Return the per-record callable for a query at the level in
+        <d_params>, or None if records are not streamed.
+        """
+        if not self.ndjson:
+            return None
+        str_level: str = d_params["QueryRetrieveLevel"]
+        return lambda d_record: self.record_ndjsonPrint(str_level, d_record)
+
+    async def query_runasync(self, opt, d_params) -> dict:
+        """
+        Run a query, either in-process on the pynetdicom engine or
+        through a findscu subprocess. Records are streamed (if so
+        requested) as they are parsed.
+        """
+        f_record = self.record_callback(d_params)
+        engine = self.engine_get()
+        if engine is None:
+            d_response: dict = await self.systemlevel_runasync(opt, d_params, f_record)
+        else:
+            for k, v in d_params.items():
+                if k != "f_commandGen":
+                    opt[k] = v
+            d_response = await asyncio.get_running_loop().run_in_executor(
+                None, engine.find, self.queryParameters_get(opt), f_record
+            )
+        if self.ndjson:
+            d_query: dict = {"QueryRetrieveLevel": d_params["QueryRetrieveLevel"]}
+            if d_params["QueryRetrieveLevel"] == "SERIES":
+                d_query["StudyInstanceUID"] = d_params["StudyInstanceUID"]
+            self.ndjson_statusPrint(d_response, d_query)
+        return d_response
+
     async def run(self, opt={}):
         """
         Main entry method.
@@ -518,6 +649,25 @@ class Find(Base):
             * Then, given each STUDY, run at the SERIES level to
               receive the set of SeriesUID information
 
+        The SERIES level queries are run concurrently, with at most
+        <maxConcurrentQueries> in flight at any time. Results are
+        collected in STUDY order.
+
+        With <ndjson>, each STUDY and SERIES record is also printed as a
+        line of JSON as soon as it is parsed, i.e. while the query is
+        still running. Each query ends in a line with its status, and
+        the run in a line with the final status: a record that has been
+        printed may still be of a query that then fails.
+
+        With <stream>, each STUDY (with its SERIES) is printed as a line
+        of JSON as soon as its SERIES query completes (see pypx.stream).
+        Likewise, any 'then' operations are started on the first STUDY
+        that completes, and run alongside the remaining SERIES queries.
+        Otherwise, they are run once all the SERIES queries are done, on
+        the STUDY records in STUDY order. In either case they operate on
+        the STUDY records of the result itself (and annotate them) rather
+        than on a copy.
+
         The query itself is based on the pattern of DICOM tag specifications
         given used to instantiate this class.
 
@@ -526,7 +676,7 @@ class Find(Base):
         # STUDIES related to this query
         series_uid = opt["SeriesInstanceUID"]
         opt["SeriesInstanceUID"] = ""
-        formattedStudiesResponse = await self.systemlevel_runasync(
+        formattedStudiesResponse = await self.query_runasync(
             opt, {"f_commandGen": self.findscu_command, "QueryRetrieveLevel": "STUDY"}
         )
         # pudb.set_trace()
@@ -536,20 +686,30 @@ class Find(Base):
             filteredStudiesResponse["command"] = formattedStudiesResponse["command"]
             filteredStudiesResponse["data"] = []
             filteredStudiesResponse["args"] = self.arg
-            studyIndex = 0
-            for study in formattedStudiesResponse["data"]:
-                l_seriesResults = []
-                # For each study, we now execute a query on a SERIES
-                # level to complete the picture.
-                formattedSeriesResponse = await self.systemlevel_runasync(
-                    opt,
-                    {
-                        "f_commandGen": self.findscu_command,
-                        "QueryRetrieveLevel": "SERIES",
-                        "StudyInstanceUID": study["StudyInstanceUID"]["value"],
-                        "SeriesInstanceUID": series_uid,
-                    },
+            if self.stream:
+                stream.line_write(
+                    "header",
+                    {k: v for k, v in filteredStudiesResponse.items() if k != "data"},
                 )
+            semaphore = asyncio.Semaphore(self.maxConcurrentQueries)
+            # (the 'then' operations update the args as they go)
+            d_query: dict = dict(opt)
+
+            async def seriesQuery_run(study) -> dict:
+                # For each study, we now execute a query on a SERIES
+                # level to complete the picture. Each query gets its
+                # own copy of the <opt> since these run concurrently.
+                async with semaphore:
+                    formattedSeriesResponse = await self.query_runasync(
+                        dict(d_query),
+                        {
+                            "f_commandGen": self.findscu_command,
+                            "QueryRetrieveLevel": "SERIES",
+                            "StudyInstanceUID": study["StudyInstanceUID"]["value"],
+                            "SeriesInstanceUID": series_uid,
+                        },
+                    )
+                l_seriesResults = []
                 for series in formattedSeriesResponse["data"]:
                     series["label"] = {}
                     series["label"]["tag"] = 0
@@ -567,21 +727,92 @@ class Find(Base):
                     series["status"]["label"] = "status"
 
                     l_seriesResults.append(series)
-
-                if len(l_seriesResults):
-                    filteredStudiesResponse["data"].append(study)
-                    filteredStudiesResponse["data"][-1]["series"] = l_seriesResults
-
-                formattedStudiesResponse["data"][studyIndex]["series"] = l_seriesResults
-                studyIndex += 1
+                study["series"] = l_seriesResults
+                return study
+
+            # The STUDY records for the 'then' operations, in the order
+            # their SERIES queries complete
+            studyQueue: asyncio.Queue = asyncio.Queue()
+
+            async def studies_get():
+                while (study := await studyQueue.get()) is not None:
+                    yield study
+
+            thenTask: asyncio.Future = None
+            if len(self.arg["then"]) and self.stream:
+                thenTask = asyncio.ensure_future(
+                    self.then.run(
+                        {
+                            "reportData": {**filteredStudiesResponse, "data": []},
+                            "studies": studies_get(),
+                        }
+                    )
+                )
+            for seriesQuery in asyncio.as_completed(
+                [seriesQuery_run(study) for study in formattedStudiesResponse["data"]]
+            ):
+                study = await seriesQuery
+                if len(study["series"]):
+                    if self.stream:
+                        stream.line_write("study", {"study": study})
+                        studyQueue.put_nowait(study)
+            studyQueue.put_nowait(None)
+            filteredStudiesResponse["data"] = [
+                study
+                for study in formattedStudiesResponse["data"]
+                if len(study["series"])
+            ]
 
             # pudb.set_trace()
-            if len(self.arg["then"]):
-                self.then.arg["reportData"] = copy.deepcopy(filteredStudiesResponse)
-                self.then.arg["studyResponse"] = copy.deepcopy(formattedStudiesResponse)
-                d_then = await self.then.run()
-                filteredStudiesResponse["then"] = copy.deepcopy(d_then)
+            if thenTask:
+                filteredStudiesResponse["then"] = await thenTask
+            elif len(self.arg["then"]):
+                filteredStudiesResponse["then"] = await self.then.run(
+                    {"reportData": filteredStudiesResponse}
+                )
+            if self.stream:
+                stream.line_write(
+                    "end",
+                    {
+                        "status": filteredStudiesResponse["status"],
+                        "studies": len(filteredStudiesResponse["data"]),
+                    },
+                )
 
+            if self.ndjson:
+                self.ndjson_statusPrint(
+                    filteredStudiesResponse,
+                    {"studies": len(filteredStudiesResponse["data"])},
+                )
             return filteredStudiesResponse
         else:
+            # (the 'data' of an error is the log of the query)
+            l_study: list = []
+            if formattedStudiesResponse["status"] != "error":
+                l_study = formattedStudiesResponse["data"]
+            if self.ndjson:
+                self.ndjson_statusPrint(
+                    formattedStudiesResponse, {"studies": len(l_study)}
+                )
+            if self.stream:
+                # A failed (or STUDY only) query is still a complete
+                # stream, so that a downstream process sees its status
+                stream.line_write(
+                    "header",
+                    {
+                        "status": formattedStudiesResponse["status"],
+                        "command": formattedStudiesResponse["command"],
+                        "args": self.arg,
+                    },
+                )
+                for study in l_study:
+                    stream.line_write("study", {"study": study})
+                stream.line_write(
+                    "end",
+                    {
+                        "status": formattedStudiesResponse["status"],
+                        "studies": len(l_study),
+                        "command": formattedStudiesResponse["command"],
+                    },
+                )
             return formattedStudiesResponse
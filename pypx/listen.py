@@ -18,9 +18,7 @@ import  pydicom
 
 # PYPX modules
 import  pypx.utils
-
-import  pudb
-from    pudb.remote         import set_trace
+from    pypx            import  repack
 
 import  pfmisc
 
@@ -237,7 +235,8 @@ class Listen():
                 b_ret   = False
         return b_ret
 
-    def processImage(self, dcm_info, log_file, error_file, series_directory, tmp_file):
+    def processImage(self, dcm_info, log_file, error_file, series_directory, tmp_file,
+                     l_pending = None):
         # get information of interest
         image_uid               = self.processDicomField(dcm_info, "SOPInstanceUID")
         image_instance_number   = self.processDicomField(dcm_info, "InstanceNumber")
@@ -248,22 +247,44 @@ class Listen():
 
         image_path = pypx.utils.dataPath(series_directory, image_instance_number, image_uid)
 
-        if not os.path.exists(image_path):
-            try:
-                shutil.copy2(tmp_file, image_path)
-            except OSError as e:
+        # The image is either placed now, or appended to the <l_pending>
+        # (tmp_file, image_path) list for a later imagesPlace()
+        if l_pending is None:
+            self.imagesPlace([(tmp_file, image_path)], error_file)
+        else:
+            l_pending.append((tmp_file, image_path))
+        return image_path
+
+    def imagesPlace(self, l_image, error_file, threads = 4):
+        """
+        Place the (tmp_file, image_path) images of <l_image> by a pool of
+        <threads> worker threads, as clones or in-kernel copies that keep
+        the times of the tmp_file. An image already there is left as is,
+        as is the first of any images (e.g. a resent SOP instance) with
+        the same image_path.
+        """
+        d_image = {}
+        for tmp_file, image_path in l_image:
+            d_image.setdefault(image_path, tmp_file)
+        l_image = [(tmp_file, image_path) for image_path, tmp_file in d_image.items()]
+        l_place = repack.files_place(
+                        [tmp_file   for tmp_file, image_path in l_image],
+                        [image_path for tmp_file, image_path in l_image],
+                        str_placement   = 'reflink',
+                        threads         = threads,
+                        str_match       = 'exists')
+        for (tmp_file, image_path), d_place in zip(l_image, l_place):
+            if not d_place['status']:
                 errorfile = open(error_file, 'w')
                 errorfile.write('Copy ' + tmp_file + ' to ' + image_path + '\n')
-                errorfile.write('Error number: ' + str(e.errno) + '\n')
-                errorfile.write('File name: ' + e.filename + '\n')
-                errorfile.write('Error message: ' + e.strerror + '\n')
+                errorfile.write('Error message: ' + d_place['error'] + '\n')
                 errorfile.close()
 
-        if not os.path.exists(image_path):
-            errorfile = open(error_file, 'w')
-            errorfile.write('File doesn\'t exist:' + image_path + '\n')
-            errorfile.close()
-            raise NameError('File doesn\'t exist:' + image_path)
+            if not os.path.exists(image_path):
+                errorfile = open(error_file, 'w')
+                errorfile.write('File doesn\'t exist:' + image_path + '\n')
+                errorfile.close()
+                raise NameError('File doesn\'t exist:' + image_path)
 
     def run(self):
 
@@ -358,6 +379,8 @@ class Listen():
 
         # Keep track of "receiving.series" files
         series_received = set()
+        # and of the images to place in their series
+        l_image         = []
 
         for directory in abs_dirs:
 
@@ -395,10 +418,13 @@ class Listen():
                 # process image
                 self.processImage(
                     dcm_info, stdout_file, self.log_error,
-                    series_info['SERIES']['Location'], abs_data)
+                    series_info['SERIES']['Location'], abs_data, l_image)
                 # image.info file
                 # mri_info? :/
 
+        # place the images (all at once, in parallel)
+        self.imagesPlace(l_image, self.log_error)
+
         # rename receiving.series to series.info
         # changing name lets external applications know the incoming data has been received
         for series in series_received:
@@ -1,6 +1,5 @@
 # Global modules
 import  subprocess
-import  pudb
 import  json
 import  pfmisc
 from    pfmisc._colors      import  Colors
@@ -58,12 +57,23 @@ class Move(Base):
         #     }
         # )
 
-        d_moveRun = self.systemlevel_run(self.arg,
+        engine      = self.engine_get()
+        if engine:
+            d_moveRun = engine.move(
+                {
+                    'QueryRetrieveLevel':   'SERIES',
+                    'StudyInstanceUID':     opt['StudyInstanceUID'],
+                    'SeriesInstanceUID':    opt['SeriesInstanceUID']
+                },
+                self.aet
+            )
+        else:
+            d_moveRun = self.systemlevel_run(self.arg,
                 {
                     'f_commandGen':         self.movescu_command,
                     'series_uid':           opt['SeriesInstanceUID'],
                     'study_uid':            opt['StudyInstanceUID']
                 }
-        )
+            )
 
         return d_moveRun
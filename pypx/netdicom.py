@@ -0,0 +1,302 @@
+"""
+An in-process DICOM network engine, built on pynetdicom.
+
+This is an optional alternative to running the DCMTK 'findscu',
+'movescu', and 'echoscu' executables in a subprocess for each
+request. Associations to a PACS (identified by the calling and
+called AETitles, the IP, and the port) are opened on first use and
+then kept in a small pool, and reused for all subsequent C-FIND,
+C-MOVE, and C-ECHO requests -- for example across the STUDY and
+SERIES passes of a Find. Concurrent requests (the SERIES queries of
+a Find, the retrieves of a Do) each get an association of their own,
+up to <associationsMax> per PACS.
+
+Responses are returned in the same structure that Base.formatResponse()
+builds from the text output of the DCMTK executables, i.e. for a query
+a list of
+
+    {
+        '<label>':  {
+            'tag':      '<gggg,eeee>',
+            'value':    '<value>',
+            'label':    '<label>'
+        },
+        ...
+    }
+
+dictionaries, one per matching dataset.
+
+Select this engine with the '--engine pynetdicom' CLI flag (or the
+'engine' key of the module arg dictionary) of px-find, px-move, and
+px-echo.
+"""
+
+import atexit
+import threading
+
+from pydicom.dataset import Dataset
+from pynetdicom import AE
+from pynetdicom.sop_class import (
+    Verification,
+    StudyRootQueryRetrieveInformationModelFind,
+    StudyRootQueryRetrieveInformationModelMove,
+)
+
+# The maximum number of associations to hold (and use concurrently)
+# per PACS
+associationsMax: int = 4
+
+
+class Engine:
+    """
+    A (thread safe) client for one PACS that holds on to its
+    associations between requests.
+
+    DIMSE requests on one association are sequential, so each request
+    takes an idle association from the pool (or opens a new one) for
+    its duration. At most <associationsMax> requests run at a time, a
+    long C-MOVE thus only holding up a C-FIND if all are in use.
+    """
+
+    def __init__(
+        self,
+        aet: str,
+        aec: str,
+        serverIP: str,
+        serverPort,
+        timeout: float = 30,
+        associationsMax: int = associationsMax,
+    ):
+        self.__name__: str = "netdicom.Engine"
+        self.aet: str = aet
+        self.aec: str = aec
+        self.serverIP: str = serverIP
+        self.serverPort: int = int(serverPort)
+
+        self.ae = AE(ae_title=aet)
+        self.ae.acse_timeout = timeout
+        self.ae.dimse_timeout = timeout
+        self.ae.network_timeout = timeout
+        for context in [
+            Verification,
+            StudyRootQueryRetrieveInformationModelFind,
+            StudyRootQueryRetrieveInformationModelMove,
+        ]:
+            self.ae.add_requested_context(context)
+
+        # The idle associations, and the number of requests allowed to
+        # run at a time
+        self.l_idle: list = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max(1, associationsMax))
+        # The number of associations actually opened by this engine
+        self.associations: int = 0
+
+    def command(self, str_service: str) -> str:
+        return "pynetdicom %s -aec %s -aet %s %s %d" % (
+            str_service,
+            self.aec,
+            self.aet,
+            self.serverIP,
+            self.serverPort,
+        )
+
+    def association_get(self):
+        """
+        Return an idle established association to the PACS from the
+        pool, or else a new one.
+        """
+        with self.lock:
+            while len(self.l_idle):
+                assoc = self.l_idle.pop()
+                if assoc.is_established:
+                    return assoc
+        assoc = self.ae.associate(self.serverIP, self.serverPort, ae_title=self.aec)
+        if not assoc.is_established:
+            raise ConnectionError(
+                "Could not associate with %s@%s:%d"
+                % (self.aec, self.serverIP, self.serverPort)
+            )
+        with self.lock:
+            self.associations += 1
+        return assoc
+
+    def association_put(self, assoc) -> None:
+        """
+        Return the <assoc> to the pool of idle associations.
+        """
+        with self.lock:
+            self.l_idle.append(assoc)
+
+    def release(self) -> None:
+        with self.lock:
+            for assoc in self.l_idle:
+                if assoc.is_established:
+                    assoc.release()
+            self.l_idle = []
+
+    def request_run(self, f_request, str_service: str) -> dict:
+        """
+        Run the <f_request>(assoc) on an association of the pool. If the
+        PACS has dropped a previously reused association the request is
+        tried once more on a new one.
+        """
+        d_ret: dict = {
+            "status": "error",
+            "data": "",
+            "command": self.command(str_service),
+            "returncode": 1,
+        }
+        with self.slots:
+            for attempt in range(2):
+                assoc = None
+                try:
+                    assoc = self.association_get()
+                    d_ret["data"] = f_request(assoc)
+                    d_ret["status"] = "success"
+                    d_ret["returncode"] = 0
+                    break
+                except ConnectionAbortedError as e:
+                    # The association is dropped
+                    if assoc is not None and assoc.is_established:
+                        assoc.abort()
+                    assoc = None
+                    d_ret["data"] = "E: %s" % e
+                except Exception as e:
+                    d_ret["data"] = "E: %s" % e
+                    break
+                finally:
+                    if assoc is not None:
+                        self.association_put(assoc)
+        return d_ret
+
+    def identifier_create(self, d_query: dict) -> Dataset:
+        """
+        Build a query identifier from <d_query>, where an empty value
+        is a return key.
+        """
+        ds: Dataset = Dataset()
+        for key, value in d_query.items():
+            setattr(ds, key, value)
+        return ds
+
+    def dataset_toDict(self, ds: Dataset, uid: int) -> dict:
+        """
+        Convert a response dataset into the {label: {tag, value, label}}
+        structure of Base.parseResponse().
+        """
+        d_ds: dict = {"uid": {"tag": 0, "value": uid, "label": "uid"}}
+        for elem in ds:
+            str_label: str = elem.keyword or elem.name
+            str_tag: str = "%04x,%04x" % (elem.tag.group, elem.tag.element)
+            if elem.VM == 0 or elem.value in (None, ""):
+                value = "no value provided for %s" % str_tag
+            elif elem.VM > 1:
+                value = "\\".join([str(v) for v in elem.value])
+            else:
+                value = str(elem.value).strip().replace("\x00", "")
+            d_ds[str_label] = {"tag": str_tag, "value": value, "label": str_label}
+        return d_ds
+
+    def responses_check(self, l_responses: list) -> None:
+        """
+        Raise if the final status of a DIMSE request is not a success.
+        """
+        if not l_responses or "Status" not in l_responses[-1][0]:
+            # An empty status means the association was aborted or
+            # timed out
+            raise ConnectionAbortedError("No response from %s" % self.aec)
+        status: int = l_responses[-1][0].Status
+        if status not in (0x0000, 0xFF00, 0xFF01):
+            raise RuntimeError("%s returned status 0x%04x" % (self.aec, status))
+
+    def find(self, d_query: dict, f_record=None) -> dict:
+        """
+        C-FIND on the Study Root model. Each matching dataset is passed
+        to the optional <f_record> callable as soon as it is received.
+        """
+
+        def find_do(assoc) -> list:
+            l_data: list = []
+            response = (None, None)
+            for response in assoc.send_c_find(
+                self.identifier_create(d_query),
+                StudyRootQueryRetrieveInformationModelFind,
+            ):
+                status, identifier = response
+                if status and status.Status in (0xFF00, 0xFF01) and identifier:
+                    d_record: dict = self.dataset_toDict(identifier, len(l_data))
+                    l_data.append(d_record)
+                    if f_record:
+                        f_record(d_record)
+            self.responses_check([response])
+            return l_data
+
+        return self.request_run(find_do, "findscu")
+
+    def move(self, d_query: dict, str_moveAET: str = "") -> dict:
+        """
+        C-MOVE on the Study Root model to <str_moveAET> (by default
+        *this* AETitle).
+        """
+
+        def move_do(assoc) -> list:
+            l_responses: list = list(
+                assoc.send_c_move(
+                    self.identifier_create(d_query),
+                    str_moveAET or self.aet,
+                    StudyRootQueryRetrieveInformationModelMove,
+                )
+            )
+            self.responses_check(l_responses)
+            ds: Dataset = Dataset()
+            for str_count in [
+                "NumberOfCompletedSuboperations",
+                "NumberOfFailedSuboperations",
+                "NumberOfWarningSuboperations",
+            ]:
+                if str_count in l_responses[-1][0]:
+                    setattr(ds, str_count, l_responses[-1][0][str_count].value)
+            return [self.dataset_toDict(ds, 0)]
+
+        return self.request_run(move_do, "movescu")
+
+    def echo(self) -> dict:
+        """
+        C-ECHO
+        """
+
+        def echo_do(assoc) -> list:
+            status: Dataset = assoc.send_c_echo()
+            self.responses_check([(status, None)])
+            return ["I: Received Echo Response (Success)"]
+
+        return self.request_run(echo_do, "echoscu")
+
+
+# One engine per PACS, shared across all Find/Move/Echo objects in
+# this process.
+d_engine: dict = {}
+engineLock = threading.Lock()
+
+
+def engine_get(aet: str, aec: str, serverIP: str, serverPort) -> Engine:
+    """
+    Return the (cached) engine for the given PACS.
+    """
+    key: tuple = (aet, aec, serverIP, int(serverPort))
+    with engineLock:
+        if key not in d_engine:
+            d_engine[key] = Engine(aet, aec, serverIP, serverPort)
+        return d_engine[key]
+
+
+@atexit.register
+def engines_release() -> None:
+    """
+    Release all the associations that are held.
+    """
+    with engineLock:
+        for engine in d_engine.values():
+            engine.release()
+        d_engine.clear()
@@ -1,6 +1,5 @@
 # Global modules
 import subprocess
-import pudb
 import json
 import pfmisc
 from pfmisc._colors import Colors
@@ -8,9 +7,13 @@ from argparse import Namespace
 from typing import Any
 from pathlib import Path
 import os
+import time
+import asyncio
+import threading
 import aiohttp
 import ssl
 from functools import reduce
+from urllib.parse import urlencode
 
 # PYPX modules
 from .base import Base
@@ -27,6 +30,188 @@ def deep_get(dictionary, keys, default=None):
     )
 
 
+class CUBEclient:
+    """
+    A client of one CUBE (API url and user) that is shared by all the
+    Status objects of an event loop. It holds a single aiohttp session,
+    whose connector keeps the (TLS) connections alive for reuse, and
+    bounds the number of requests in flight to <limit>.
+    """
+
+    def __init__(self, d_CUBE: dict[str, Any], limit: int = 8):
+        self.d_CUBE: dict[str, Any] = d_CUBE
+        self.limit: int = max(1, int(limit))
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(self.limit)
+        self.session: aiohttp.ClientSession = None
+        self.requests: int = 0
+
+    def session_get(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            ssl_context: ssl.SSLContext = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+            self.session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(
+                    self.d_CUBE["username"], self.d_CUBE["password"]
+                ),
+                connector=aiohttp.TCPConnector(ssl=ssl_context, limit=self.limit),
+            )
+        return self.session
+
+    async def get(self, url: str) -> dict[str, Any]:
+        data: dict[str, Any] = {}
+        async with self.semaphore:
+            self.requests += 1
+            async with self.session_get().get(url) as response:
+                if response.status == 200:
+                    data = await response.json()
+                else:
+                    data["error"] = f"Error: {response.status}"
+        return data
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+# The CUBEclient of each (event loop, url, username)
+d_CUBEclient: dict = {}
+
+# The CUBE service entries read from the <services>/cube.json files,
+# as {(<file>, <CUBE>): (<file mtime>, <entry>)}
+d_CUBEinfo: dict = {}
+
+
+def CUBEclient_get(d_CUBE: dict[str, Any], limit: int = 8) -> CUBEclient:
+    """
+    Return the CUBEclient of the running event loop for <d_CUBE>.
+    """
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    for key in [k for k in d_CUBEclient if k[0].is_closed()]:
+        del d_CUBEclient[key]
+    key: tuple = (loop, d_CUBE["url"], d_CUBE["username"], d_CUBE["password"])
+    if key not in d_CUBEclient:
+        d_CUBEclient[key] = CUBEclient(d_CUBE, limit)
+    return d_CUBEclient[key]
+
+
+async def CUBEclients_close():
+    """
+    Close the sessions of the CUBEclients of the running event loop.
+    """
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    for key in [k for k in d_CUBEclient if k[0] is loop]:
+        await d_CUBEclient.pop(key).close()
+
+
+class DirCache:
+    """
+    A per-process cache of the listings and file counts of directories,
+    each valid for as long as the mtime of its directory is unchanged.
+    Repeated status polls thus only rescan the directories that changed.
+
+    A directory that changed within <racy> seconds of its scan might
+    still change within the same mtime tick, so it is not cached. Files
+    that are rewritten in place do not change the mtime of their
+    directory -- invalidate() drops the cache of one (or all)
+    directories explicitly.
+    """
+
+    def __init__(self, racy: float = 1.0):
+        self.racy: float = racy
+        self.lock: threading.Lock = threading.Lock()
+        # <dir>: (<mtime>, <listing>, {<fragment>: <match>})
+        self.d_listing: dict = {}
+        # <dir>: (<mtime>, <file count>)
+        self.d_count: dict = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def mtime_get(self, str_dir: str) -> int:
+        """
+        Return the mtime (in ns) of <str_dir>, or -1 if it does not exist.
+        """
+        try:
+            return os.stat(str_dir).st_mtime_ns
+        except OSError:
+            return -1
+
+    def cacheable(self, mtime: int) -> bool:
+        return time.time_ns() - mtime > self.racy * 1e9
+
+    def listing_get(self, str_dir: str) -> tuple:
+        mtime: int = self.mtime_get(str_dir)
+        if mtime < 0:
+            return (mtime, [], {})
+        with self.lock:
+            t_listing: tuple = self.d_listing.get(str_dir)
+            if t_listing and t_listing[0] == mtime:
+                self.hits += 1
+                return t_listing
+            self.misses += 1
+        t_listing = (mtime, os.listdir(str_dir), {})
+        if self.cacheable(mtime):
+            with self.lock:
+                self.d_listing[str_dir] = t_listing
+        return t_listing
+
+    def listdir(self, str_dir: str) -> list[str]:
+        """
+        Return the entries of <str_dir> (an empty list if it does not
+        exist).
+        """
+        return list(self.listing_get(str_dir)[1])
+
+    def match(self, str_dir: str, fragment: str) -> str:
+        """
+        Return the first entry of <str_dir> that contains <fragment>,
+        or an empty string.
+        """
+        mtime, l_entries, d_match = self.listing_get(str_dir)
+        if fragment not in d_match:
+            l_hit: list[str] = [
+                str_entry for str_entry in l_entries if fragment in str_entry
+            ]
+            d_match[fragment] = l_hit[0] if l_hit else ""
+        return d_match[fragment]
+
+    def count(self, str_dir: str) -> int:
+        """
+        Return the number of entries of <str_dir> (0 if it does not
+        exist).
+        """
+        mtime: int = self.mtime_get(str_dir)
+        if mtime < 0:
+            return 0
+        with self.lock:
+            t_count: tuple = self.d_count.get(str_dir)
+            if t_count and t_count[0] == mtime:
+                self.hits += 1
+                return t_count[1]
+            self.misses += 1
+        count: int = len(os.listdir(str_dir))
+        if self.cacheable(mtime):
+            with self.lock:
+                self.d_count[str_dir] = (mtime, count)
+        return count
+
+    def invalidate(self, str_dir: str = None):
+        """
+        Drop the cache of <str_dir>, or of all directories.
+        """
+        with self.lock:
+            if str_dir is None:
+                self.d_listing.clear()
+                self.d_count.clear()
+            else:
+                str_dir = str(str_dir)
+                self.d_listing.pop(str_dir, None)
+                self.d_count.pop(str_dir, None)
+
+
+dirCache: DirCache = DirCache()
+
+
 class Status(Base):
     """
     The 'Status' class provides a similar/related interface signature
@@ -49,6 +234,8 @@ class Status(Base):
         """
 
         super(Status, self).__init__(arg)
+        # The number of items per page of a study level pacsfiles search
+        self.CUBEpageLimit: int = int(self.arg.get("CUBEpageLimit", 1000))
         self.dp = pfmisc.debug(verbosity=self.verbosity, within="Find", syslog=False)
         self.log = self.dp.qprint
         self.db = smdb.SMDB(Namespace(str_logDir=self.arg["dblogbasepath"]))
@@ -79,6 +266,14 @@ class Status(Base):
 
     def requestedDICOMcount_getForSeries(self, opt: dict[str, Any]) -> int:
         requestedDICOMcount: int = 0
+        # A status index of the whole study (see smdb.study_seriesIndexGet())
+        # already has the count
+        d_index: dict[str, Any] = opt.get("statusIndex", {})
+        if opt["SeriesInstanceUID"] in d_index.get("series", {}):
+            requestedDICOMcount = d_index["series"][opt["SeriesInstanceUID"]]["images"][
+                "requested"
+            ]["count"]
+            return max(0, requestedDICOMcount)
         d_DBtables: dict[str, Any] = self.db.seriesData_DBtablesGet(
             SeriesInstanceUID=opt["SeriesInstanceUID"]
         )
@@ -92,39 +287,44 @@ class Status(Base):
 
     def resolveSeriesDir(self, dir: Path) -> Path:
         fullPath: Path = dir
-        fragment: str = dir.name
-        if not dir.parent.exists():
-            return fullPath
-        ls: list[str] = os.listdir(str(dir.parent))
-        hits: list[str] = [i for i in ls if fragment in i]
-        if hits:
-            fullPath = dir.with_name(hits[0])
+        hit: str = dirCache.match(str(dir.parent), dir.name)
+        if hit:
+            fullPath = dir.with_name(hit)
         return fullPath
 
     def filesInDir_count(self, dir: Path) -> int:
         fileCount: int = 0
-        d_CUBEs: dict[str, Any] = self.db.service_keyAccess("CUBE")
-        if not d_CUBEs["status"]:
-            return 0
-        if self.arg["CUBE"] not in d_CUBEs["CUBE"].keys():
-            return 0
-        d_CUBE: dict[str, Any] = d_CUBEs["CUBE"][self.arg["CUBE"]]
+        d_CUBE: dict[str, Any] = self.CUBEinfo_get()
         if "regFSdir" not in d_CUBE.keys():
             return 0
         targetDir: Path = Path(d_CUBE["regFSdir"] / dir)
         finalDir: Path = self.resolveSeriesDir(targetDir)
-        if finalDir.exists():
-            fileCount = len(os.listdir(str(finalDir)))
+        fileCount = dirCache.count(str(finalDir))
         return fileCount
 
     def CUBEinfo_get(self) -> dict[str, Any]:
+        """
+        Return the service entry of the CUBE. The entry is cached (per
+        process) until the services file changes.
+        """
         d_CUBE: dict[str, Any] = {}
+        str_service: str = os.path.join(
+            self.db.str_servicesDir, self.db.str_CUBEservice
+        )
+        key: tuple = (str_service, self.arg["CUBE"])
+        try:
+            mtime: int = os.stat(str_service).st_mtime_ns
+        except OSError:
+            return d_CUBE
+        if key in d_CUBEinfo and d_CUBEinfo[key][0] == mtime:
+            return d_CUBEinfo[key][1]
         d_CUBEs: dict[str, Any] = self.db.service_keyAccess("CUBE")
         if not d_CUBEs["status"]:
             return d_CUBE
         if self.arg["CUBE"] not in d_CUBEs["CUBE"].keys():
             return d_CUBE
         d_CUBE = d_CUBEs["CUBE"][self.arg["CUBE"]]
+        d_CUBEinfo[key] = (mtime, d_CUBE)
         return d_CUBE
 
     async def registeredDICOMcount_getFromCUBE(self) -> int:
@@ -164,28 +364,87 @@ class Status(Base):
         }
         return int(d_numberInstances.get("SeriesDescription", 0))
 
-    async def CUBE_get(self, url: str) -> dict[str, Any]:
-        # pudb.set_trace()
+    async def CUBE_getAllItems(self, d_query: dict[str, Any]) -> list:
+        """
+        Return the data of all the items of the pacsfiles search
+        <d_query>, as a list of {<name>: <value>} dictionaries. The first
+        page tells the total, and the remaining pages (of
+        <CUBEpageLimit> items) are then all requested at once.
+        """
         d_CUBE: dict[str, Any] = self.CUBEinfo_get()
+        limit: int = self.CUBEpageLimit
 
-        auth: aiohttp.BasicAuth = aiohttp.BasicAuth(
-            d_CUBE["username"], d_CUBE["password"]
+        def url_page(offset: int) -> str:
+            return "%spacsfiles/search/?%s" % (
+                d_CUBE["url"],
+                urlencode({**d_query, "limit": limit, "offset": offset}),
+            )
+
+        resp: dict[str, Any] = await self.CUBE_get(url_page(0))
+        l_resp: list = [resp]
+        total: int = deep_get(resp, "collection.total", 0) or 0
+        l_resp += await asyncio.gather(
+            *[self.CUBE_get(url_page(offset)) for offset in range(limit, total, limit)]
         )
+        return [
+            {d["name"]: d["value"] for d in item.get("data", [])}
+            for resp in l_resp
+            for item in deep_get(resp, "collection.items", []) or []
+        ]
 
-        ssl_context: ssl.SSLContext = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        data: dict[str, Any]
-        async with aiohttp.ClientSession(
-            auth=auth, connector=aiohttp.TCPConnector(ssl=ssl_context)
-        ) as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                else:
-                    resp = f"Error: {response.status}"
-                    data["error"] = resp
-        return data
+    async def CUBEstudy_get(self, str_StudyInstanceUID: str) -> dict[str, Any]:
+        """
+        Return the CUBE side of the status of all the series of a study
+        from two (paginated) study level pacsfiles searches:
+
+            {
+                'status':       True|False,
+                'registered':   {<SeriesInstanceUID>: <registered files>},
+                'requested':    {<SeriesInstanceUID>: <NumberOfSeriesRelatedInstances>}
+            }
+
+        A run() of the status of a series picks its counts from this
+        structure (if passed as 'CUBEstudy') instead of querying CUBE.
+        """
+        d_ret: dict[str, Any] = {"status": False, "registered": {}, "requested": {}}
+        if "url" not in self.CUBEinfo_get():
+            return d_ret
+        l_files, l_instances = await asyncio.gather(
+            self.CUBE_getAllItems(
+                {
+                    "pacs_identifier": "PACSDCM",
+                    "StudyInstanceUID": str_StudyInstanceUID,
+                }
+            ),
+            self.CUBE_getAllItems(
+                {
+                    "StudyInstanceUID": str_StudyInstanceUID,
+                    "pacs_identifier": "org.fnndsc.oxidicom",
+                    "ProtocolName": "NumberOfSeriesRelatedInstances",
+                }
+            ),
+        )
+        for d_file in l_files:
+            str_SeriesInstanceUID: str = d_file.get("SeriesInstanceUID", "")
+            d_ret["registered"][str_SeriesInstanceUID] = (
+                d_ret["registered"].get(str_SeriesInstanceUID, 0) + 1
+            )
+        for d_instances in l_instances:
+            d_ret["requested"].setdefault(
+                d_instances.get("SeriesInstanceUID", ""),
+                int(d_instances.get("SeriesDescription", 0)),
+            )
+        d_ret["status"] = True
+        return d_ret
+
+    async def CUBE_get(self, url: str) -> dict[str, Any]:
+        """
+        GET the <url> over the shared CUBEclient of the event loop.
+        """
+        client: CUBEclient = CUBEclient_get(
+            self.CUBEinfo_get(), self.arg.get("maxConcurrentCUBEqueries", 8)
+        )
+        return await client.get(url)
 
     def registeredDICOMcount_getFromFS(self, d_DICOMseries: dict[str, Any]) -> int:
         registeredDICOMcount: int = 0
@@ -229,10 +488,21 @@ class Status(Base):
         # pudb.set_trace()
         d_status: dict = self.status_init()
         requested: int = self.requestedDICOMcount_getForSeries(opt)
-        if not requested:
-            requested = await self.NumberOfSeriesRelatedInstances_get()
         packed: int = self.registeredDICOMcount_getFromFS(opt["series"])
-        registered: int = await self.registeredDICOMcount_getFromCUBE()
+        # The CUBE side of the status of the whole study (see CUBEstudy_get())
+        # already has the counts, else the CUBE queries go out concurrently
+        d_CUBEstudy: dict[str, Any] = opt.get("CUBEstudy", {})
+        if d_CUBEstudy.get("status"):
+            registered: int = d_CUBEstudy["registered"].get(opt["SeriesInstanceUID"], 0)
+            if not requested:
+                requested = d_CUBEstudy["requested"].get(opt["SeriesInstanceUID"], 0)
+        elif not requested:
+            requested, registered = await asyncio.gather(
+                self.NumberOfSeriesRelatedInstances_get(),
+                self.registeredDICOMcount_getFromCUBE(),
+            )
+        else:
+            registered: int = await self.registeredDICOMcount_getFromCUBE()
         if not packed:
             return d_status
         d_status = self.status_update(requested, packed, registered, d_status)
@@ -25,13 +25,15 @@ import  multiprocessing
 import  configparser
 import  swiftclient
 import  traceback
+import  hashlib
+import  collections
+import  itertools
 from    argparse            import  Namespace
+from    concurrent.futures  import  ThreadPoolExecutor
 
 import  pfmisc
 
 # debugging utilities
-import  pudb
-
 from    pypx                import  repack
 
 # pfstorage local dependencies
@@ -48,6 +50,108 @@ def static_vars(**kwargs):
     return decorate
 
 
+class SwiftAuth:
+    """
+    The auth token (and storage url) shared by all the pooled swift
+    connections of one (authurl, user, container).
+    """
+
+    def __init__(self, pool):
+        self.pool       = pool
+        self.lock       = threading.Lock()
+        self.url        : str   = None
+        self.token      : str   = None
+
+    def get(self, conn) -> tuple:
+        """
+        Return the (url, token) for the connection <conn>: the shared
+        token, unless <conn> is asking again because that very token
+        was refused (i.e. it expired), in which case authenticate anew.
+        """
+        with self.lock:
+            if self.token is not None and self.token != conn.tokenUsed:
+                self.pool.count('authsSaved')
+            else:
+                self.url, self.token    = swiftclient.Connection.get_auth(conn)
+                self.pool.count('auths')
+            conn.tokenUsed              = self.token
+            return self.url, self.token
+
+
+class PooledConnection(swiftclient.Connection):
+    """
+    A swift connection that takes its token from a SwiftAuth. As with
+    any swiftclient.Connection, a request answered with a 401 drops the
+    token and retries, and the retry then picks up a new token.
+    """
+
+    def __init__(self, auth, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.auth       = auth
+        self.tokenUsed  : str   = None
+
+    def get_auth(self) -> tuple:
+        self.url, self.token    = self.auth.get(self)
+        return self.url, self.token
+
+
+class SwiftPool:
+    """
+    A process-wide pool of swift connections, keyed on the
+    (authurl, user, container).
+
+    A swiftclient.Connection is not thread safe, so each thread gets
+    a connection of its own (which keeps its HTTP session between
+    requests) -- but all the connections of a key share one auth
+    token, which is reused until the storage refuses it. Only then
+    is there another auth round trip.
+    """
+
+    def __init__(self):
+        self.lock       = threading.Lock()
+        self.d_auth     : dict  = {}
+        self.threadConn         = threading.local()
+        self.d_count    : dict  = {'auths': 0, 'authsSaved': 0, 'connections': 0}
+
+    def count(self, str_counter: str) -> None:
+        with self.lock:
+            self.d_count[str_counter] += 1
+
+    def metrics_get(self) -> dict:
+        """
+        Return the counts of
+            'auths':        auth round trips
+            'authsSaved':   auth round trips saved by reusing a token
+            'connections':  connections created
+        """
+        with self.lock:
+            return dict(self.d_count)
+
+    def connection_get(self, str_authurl, str_user, str_key, str_container):
+        """
+        Return the connection of the calling thread for the key.
+        """
+        t_key                   = (str_authurl, str_user, str_container)
+        d_conn  : dict          = getattr(self.threadConn, 'd_conn', None)
+        if d_conn is None:
+            d_conn                  = {}
+            self.threadConn.d_conn  = d_conn
+        if t_key not in d_conn:
+            with self.lock:
+                auth    = self.d_auth.setdefault(t_key, SwiftAuth(self))
+                self.d_count['connections'] += 1
+            d_conn[t_key]   = PooledConnection(
+                                auth,
+                                user    = str_user,
+                                key     = str_key,
+                                authurl = str_authurl
+                            )
+        return d_conn[t_key]
+
+
+swiftPool   = SwiftPool()
+
+
 class D(S):
     """
     A derived 'pfstate' class that keeps system state.
@@ -130,6 +234,81 @@ class PfStorage(metaclass = abc.ABCMeta):
         # result of the read and can be used by a friendly caller.
         self.obj            = None
 
+    def filesFind_iter(self, *args, **kwargs):
+        """
+        Yield the files down a filesystem tree as they are found,
+        starting from the kwarg:
+
+            root        = <someStartPath>
+            fileSubStr  = <someSubStr>
+            dirList     = <someList>
+            threads     = <workers>
+
+        where the 'fileSubStr' optionally filters all the files with
+        <someSubStr>, and the directories found are appended to the
+        optional 'dirList'.
+
+        The directories are read with os.scandir() breadth first, the
+        sibling directories in parallel by a pool of 'threads' (kwarg,
+        or the 'swiftThreads' arg) worker threads, with at most a few
+        directories per thread read ahead of the caller. As with
+        os.walk(), links to directories are listed but not followed.
+        """
+        str_rootPath    : str   = ''
+        str_fileSubStr  : str   = ''
+        l_dirFS         : list  = []
+        threads         : int   = self.arg.get('swiftThreads', 4)
+        for k,v in kwargs.items():
+            if k == 'root'          : str_rootPath      = v
+            if k == 'fileSubStr'    : str_fileSubStr    = v
+            if k == 'dirList'       : l_dirFS           = v
+            if k == 'threads'       : threads           = v
+
+        def dir_scan(str_dir) -> tuple:
+            """
+            Return the (files, dirs, dirs to walk) of <str_dir>.
+            """
+            l_file      : list  = []
+            l_dir       : list  = []
+            l_walk      : list  = []
+            try:
+                with os.scandir(str_dir) as it:
+                    for entry in it:
+                        try:
+                            b_dir   = entry.is_dir()
+                        except OSError:
+                            b_dir   = False
+                        if not b_dir:
+                            l_file.append(entry.path)
+                            continue
+                        l_dir.append(entry.path)
+                        if not entry.is_symlink():
+                            l_walk.append(entry.path)
+            except OSError:
+                pass
+            return l_file, l_dir, l_walk
+
+        if not len(str_rootPath):
+            return
+        threads     = max(1, int(threads))
+        dq_dir      = collections.deque([str_rootPath])
+        dq_scan     = collections.deque()
+        executor    = ThreadPoolExecutor(max_workers = threads)
+        try:
+            while len(dq_dir) or len(dq_scan):
+                while len(dq_dir) and len(dq_scan) < 4 * threads:
+                    dq_scan.append(executor.submit(dir_scan, dq_dir.popleft()))
+                l_file, l_dir, l_walk   = dq_scan.popleft().result()
+                dq_dir.extend(l_walk)
+                l_dirFS.extend(l_dir)
+                for str_file in l_file:
+                    if str_fileSubStr in str_file:
+                        yield str_file
+        finally:
+            # A caller that stops early leaves no directories to scan
+            for future in dq_scan: future.cancel()
+            executor.shutdown(wait = False)
+
     def filesFind(self, *args, **kwargs) -> dict:
         """
         This method simply returns a list of files
@@ -140,7 +319,8 @@ class PfStorage(metaclass = abc.ABCMeta):
             fileSubStr  = <someSubStr>
 
         where the 'fileSubStr' optionally filters all the files
-        with <someSubStr>.
+        with <someSubStr>. See filesFind_iter() to have the files
+        as they are found instead.
         """
         d_ret           : dict  = {
             'status':   False,
@@ -149,25 +329,9 @@ class PfStorage(metaclass = abc.ABCMeta):
             'numFiles': 0,
             'numDirs':  0
         }
-        str_rootPath    : str   = ''
-        str_fileSubStr  : str   = ''
-        for k,v in kwargs.items():
-            if k == 'root'          : str_rootPath      = v
-            if k == 'fileSubStr'    : str_fileSubStr    = v
-        if len(str_rootPath):
-            # Create a list of all files down the <str_rootPath>
-            for root, dirs, files in os.walk(str_rootPath):
-                for filename in files:
-                    d_ret['l_fileFS'].append(os.path.join(root, filename))
-                    d_ret['status'] = True
-                for dirname in dirs:
-                    d_ret['l_dirFS'].append(os.path.join(root, dirname))
-            if len(str_fileSubStr):
-                d_ret['l_fileFS']   = [
-                                        f for f in d_ret['l_fileFS']
-                                            if str_fileSubStr in f
-                                        ]
-
+        d_ret['l_fileFS']   = list(self.filesFind_iter(**dict(kwargs,
+                                    dirList = d_ret['l_dirFS'])))
+        d_ret['status']     = len(d_ret['l_fileFS']) > 0
         d_ret['numFiles']   = len(d_ret['l_fileFS'])
         d_ret['numDirs']    = len(d_ret['l_dirFS'])
         return d_ret
@@ -223,6 +387,11 @@ class PfStorage(metaclass = abc.ABCMeta):
 
 class swiftStorage(PfStorage):
 
+    # Files are streamed to swift in chunks of this many bytes
+    chunkSize   : int   = 65536
+    # Objects are listed in pages of this many (at most 10000)
+    lsPageSize  : int   = 10000
+
     def __init__(self, arg, *args, **kwargs):
         """
         Core initialization and logic in the base class
@@ -261,19 +430,32 @@ class swiftStorage(PfStorage):
             'container_name':       self.state('/swift/container_name')
         }
 
-        # initiate a swift service connection, based on internal
-        # settings already available in the django variable space.
+        # get the swift service connection of this thread from the
+        # pool, based on internal settings already available in the
+        # django variable space.
         try:
-            d_ret['conn'] = swiftclient.Connection(
-                user    = d_ret['user'],
-                key     = d_ret['key'],
-                authurl = d_ret['authurl']
+            d_ret['conn'] = swiftPool.connection_get(
+                d_ret['authurl'],
+                d_ret['user'],
+                d_ret['key'],
+                d_ret['container_name']
             )
         except:
             d_ret['status'] = False
 
         return d_ret
 
+    def connection_get(self, *args, **kwargs) -> dict:
+        """
+        Return the swift connection of the calling thread.
+
+        The connections come from the process-wide 'swiftPool': each
+        thread (for example each objPut() worker) holds on to its own,
+        and all of them share the auth token -- so a push or pull does
+        not authenticate again for every operation, or every series.
+        """
+        return self.connect(*args, **kwargs)
+
     def rmtree_process(self, *args, **kwargs) -> dict:
         """
         Process the 'rmtree' directive.
@@ -297,25 +479,25 @@ class swiftStorage(PfStorage):
 
     def rmtree(self, **kwargs)  -> dict:
         """
-        Remove a "tree" of objects in swift
+        Remove a "tree" of objects in swift.
+
+        The objects are deleted page by page as they are listed (see
+        ls_iter()), rather than after listing them all.
         """
         d_ret = {
             'status'    : False,
             'dellist'   : []
         }
 
-        d_conn  = self.connect(**kwargs)
-
-        # Get a list of objects
-        d_ls    = self.ls(**kwargs)
-        if d_ls['status']:
-            d_ret['status']     = True
-            d_ret['dellist']    = d_ls['list_ls']
-            for obj in d_ls['list_ls']:
+        d_conn  = self.connection_get(**kwargs)
+        if d_conn['status']:
+            for d_obj in self.ls_iter(**kwargs):
                 d_conn['conn'].delete_object(
                     d_conn['container_name'],
-                    obj
+                    d_obj['name']
                 )
+                d_ret['dellist'].append(d_obj['name'])
+            d_ret['status']     = bool(len(d_ret['dellist']))
 
         return d_ret
 
@@ -355,74 +537,106 @@ class swiftStorage(PfStorage):
 
         return d_ret
 
-    def ls(self, **kwargs) -> dict:
+    def ls_iter(self, **kwargs):
         """
-        Return a dictionary of information about objects in swiftstorage.
+        Yield the dictionary of each object in swiftstorage under a
+        path, as the listing is read page by page -- so that even a
+        very large listing is walked in constant memory.
 
         Behaviour specifiers (kwargs):
 
-            path   = <locationInSwift>
+            path        = <locationInSwift>
             substr      = filter return objects on <substr> in their name
             retSpec     = list of specs to return.
-                        Default: ['hash', 'last_modified', 'bytes', 'name']
-
-        Return
-        {
-            'status':           the status of this call (True/False),
-            'listDict_obj':     a list of dictionary objects,
-            'list_ls':          a list of object names at the query path,
-        }
-
+                        Default: all of
+                        ['hash', 'last_modified', 'bytes', 'name', 'content_type']
+            pageSize    = the number of objects to list per request.
+                        Default: 'lsPageSize'
         """
-
-        l_ls                    : list  = []    # The listing of names to return
-        ld_obj                  : list  = []    # List of dictionary objects in swift
         str_path                : str   = '/'
         str_subString           : str   = ''
-        b_status                : bool  = False
+        str_marker              : str   = ''
         l_retSpec               : list  = []
+        pageSize                : int   = self.lsPageSize
+        ld_page                 : list  = []    # A page of the listing
+        ld_obj                  : list  = []
 
         for k,v in kwargs.items():
             if k == 'path'      : str_path            = v
             if k == 'substr'    : str_subString       = v
             if k == 'retSpec'   : l_retSpec           = v
+            if k == 'pageSize'  : pageSize            = int(v)
 
         # Remove any leading noise on the str_path, specifically
         # any leading '.' characters.
         # This is probably not very robust!
         while str_path[:1] == '.':  str_path    = str_path[1:]
 
-        d_conn          = self.connect(**kwargs)
-        if d_conn['status']:
-            conn        = d_conn['conn']
-
-            # get the full list of objects in Swift storage with given prefix
-            ld_obj = conn.get_container(
-                        d_conn['container_name'],
-                        prefix          = str_path,
-                        full_listing    = True)[1]
+        d_conn          = self.connection_get(**kwargs)
+        if not d_conn['status']:
+            return
 
+        while True:
+            ld_page     = d_conn['conn'].get_container(
+                            d_conn['container_name'],
+                            prefix  = str_path,
+                            marker  = str_marker,
+                            limit   = pageSize)[1]
+            if not len(ld_page):
+                break
+            str_marker  = ld_page[-1]['name']
+            ld_obj      = ld_page
             if len(str_subString):
-                ld_obj      = [x for x in ld_obj if str_subString in x['name']]
+                ld_obj  = [x for x in ld_obj if str_subString in x['name']]
+            if len(l_retSpec):
+                ld_obj  = [ {x: y[x] for x in l_retSpec}
+                                for y in ld_obj ]
+            yield from ld_obj
+            if len(ld_page) < pageSize:
+                break
 
+    def ls(self, **kwargs) -> dict:
+        """
+        Return a dictionary of information about objects in swiftstorage.
+
+        Behaviour specifiers (kwargs) are those of ls_iter(), which
+        yields the same objects one by one.
+
+        Return
+        {
+            'status':           the status of this call (True/False),
+            'listDict_obj':     a list of dictionary objects,
+            'list_ls':          a list of object names at the query path,
+        }
+
+        """
+
+        l_ls                    : list  = []    # The listing of names to return
+        ld_obj                  : list  = []    # List of dictionary objects in swift
+        l_retSpec               : list  = kwargs.pop('retSpec', [])
+        d_conn                  : dict  = self.connection_get(**kwargs)
+
+        if d_conn['status']:
+            ld_obj          = list(self.ls_iter(**kwargs))
             l_ls            = [x['name'] for x in ld_obj]
 
             if len(l_retSpec):
                 ld_obj      = [ {x: y[x] for x in l_retSpec}
                                     for y in ld_obj ]
 
-            if len(l_ls):   b_status    = True
-
         return {
-            'status':       b_status,
+            'status':       bool(len(ld_obj)),
             'listDict_obj': ld_obj,
             'list_ls':      l_ls,
-            'conn':         conn
+            'conn':         d_conn['conn']
         }
 
     def objExists(self, **kwargs) -> bool:
         """
         Return True/False if the object at 'path' exists in swift storage.
+
+        This is a single HEAD request on the object, whatever the
+        number of objects stored under the same path.
         """
         b_exists                : bool      = False
         str_obj                 : str       = ''
@@ -430,13 +644,14 @@ class swiftStorage(PfStorage):
         for k,v in kwargs.items():
             if k == 'path'      : str_obj   = v
 
-        if len(str_obj):
-            kwargs['path']          = str_obj
-            d_ls                    = self.ls(**kwargs)
-            if d_ls['status']:
-                for name in d_ls['list_ls']:
-                    if name == str_obj:
-                        b_exists = True
+        d_conn                  = self.connection_get(**kwargs)
+        if len(str_obj) and d_conn['status']:
+            try:
+                d_conn['conn'].head_object(d_conn['container_name'], str_obj)
+                b_exists    = True
+            except swiftclient.ClientException as e:
+                if e.http_status != 404:
+                    self.log('objExists(%s): %s' % (str_obj, e), comms = 'error')
 
         return b_exists
 
@@ -475,7 +690,7 @@ class swiftStorage(PfStorage):
             Return the original and modified 'toLocation' and status flag.
             """
             b_pack                      = False
-            d_DICOMread                 = self.packer.DICOMfile_read(file = str_DICOMfilename)
+            d_DICOMread                 = self.packer.DICOMfile_read(file = str_DICOMfilename, headerOnly = True)
             d_path                      = self.packer.packPath_resolve(d_DICOMread)
             self.obj[str_DICOMfilename] = d_DICOMread
             str_origTo                  = d_args['toLocation']
@@ -492,11 +707,13 @@ class swiftStorage(PfStorage):
 
         def files_putSingly() -> dict:
             """
-            Handle a single file put, return and update d_ret
+            Resolve the pack location of each file and put them all
+            in one objPut(), return and update d_ret
             """
             nonlocal d_ret
             nonlocal b_singleShot
-            d_pack  : dict          = {}
+            d_pack          : dict  = {}
+            l_objectfile    : list  = []
             b_singleShot            = True
             d_ret                   = {
                 'status'            : False,
@@ -504,20 +721,34 @@ class swiftStorage(PfStorage):
                 'objectFileList'    : []
             }
             self.obj                = {}
-            # pudb.set_trace()
             for f in d_fileList['l_fileFS']:
                 d_pack                  = toLocation_updateWithDICOMtags(f)
-                d_args['file']          = f
-                d_args['remoteFile']    = d_pack['path']['imageFile']
-                d_put                   = self.objPut(**d_args)
-                d_ret[f]                = d_put
+                l_objectfile           += self.objectFileList_resolve(**dict(d_args,
+                                            fileList        = [f],
+                                            remoteFileList  = [d_pack['path']['imageFile']]
+                                        ))
                 d_args['toLocation']    = d_pack['originalLocation']
-                d_ret['status']         = d_put['status']
-                if d_ret['status']:
-                    d_ret['localFileList'].append(d_put['localFileList'][0])
-                    d_ret['objectFileList'].append(d_put['objectFileList'][0])
+            if not len(l_objectfile):
+                return d_ret
+            d_put                   = self.objPut(**dict(d_args,
+                                        fileList        = d_fileList['l_fileFS'],
+                                        objectFileList  = l_objectfile
+                                    ))
+            d_ret['status']         = d_put['status']
+            for f, o, b in zip( d_put['localFileList'],
+                                d_put['objectFileList'],
+                                d_put['statusList']):
+                d_ret[f]            = {
+                    'status'            : b,
+                    'localFileList'     : [f],
+                    'objectFileList'    : [o],
+                    'localpath'         : d_put['localpath']
+                }
+                if b:
+                    d_ret['localFileList'].append(f)
+                    d_ret['objectFileList'].append(o)
                 else:
-                    break
+                    d_ret[f]['error']   = d_put['error']
             return d_ret
 
         d_ret           :   dict  = {
@@ -538,26 +769,97 @@ class swiftStorage(PfStorage):
             d_args  = d_msg['args']
             if 'localpath' in d_args:
                 str_localPath       = d_args['localpath']
-                if 'DICOMsubstr' in d_args:
+                if d_args.get('packEachDICOM') and 'DICOMsubstr' in d_args:
                     d_fileList      = self.filesFind(
                                         root        = str_localPath,
                                         fileSubStr  = d_args['DICOMsubstr']
                                     )
-                    if 'packEachDICOM' in d_args:
-                        if d_args['packEachDICOM']: files_putSingly()
-                    if len(d_fileList['l_fileFS']) and not b_singleShot:
-                        toLocation_updateWithDICOMtags(d_fileList['l_fileFS'][0])
-                else:
-                    d_fileList      = self.filesFind(
-                                        root        = str_localPath
-                    )
-                if d_fileList['status'] and not b_singleShot:
-                    d_args['fileList']  = d_fileList['l_fileFS']
-                    d_ret               = self.objPut(**d_args)
-                elif not d_fileList['status']:
+                    if d_fileList['status']:
+                        return files_putSingly()
+                    d_ret['msg']    = 'No valid file list generated'
+                    return d_ret
+                # The files are put as they are found
+                it_file             = self.filesFind_iter(
+                                        root        = str_localPath,
+                                        fileSubStr  = d_args.get('DICOMsubstr', '')
+                                    )
+                str_first           = next(it_file, None)
+                if str_first is None:
                     d_ret['msg']    = 'No valid file list generated'
+                    return d_ret
+                if 'DICOMsubstr' in d_args:
+                    toLocation_updateWithDICOMtags(str_first)
+                d_ret               = self.objPut(**dict(d_args,
+                                        fileList    = itertools.chain([str_first], it_file)
+                                    ))
+                d_args['fileList']  = d_ret['localFileList']
         return d_ret
 
+    def objectFileList_resolve(self, *args, **kwargs) -> list:
+        """
+        Return the list of object storage names for the kwarg
+        'fileList' (or 'file') of local files -- see objPut() for
+        the 'toLocation', 'mapLocationOver', and 'remoteFileList'
+        (or 'remoteFile') mapping.
+        """
+        l_localfile             : list  = []    # Name on the local file system
+        l_remotefileName        : list  = []    # A replacement for the remote filename
+        l_objectfile            : list  = []    # Name in the object storage
+        str_swiftLocation       : str   = ''
+        str_mapLocationOver     : str   = ''
+
+        for k,v in kwargs.items():
+            if k == 'file'              : l_localfile.append(v)
+            if k == 'remoteFile'        : l_remotefileName.append(v)
+            if k == 'remoteFileList'    : l_remotefileName      = v
+            if k == 'fileList'          : l_localfile           = v
+            if k == 'toLocation'        : str_swiftLocation     = v
+            if k == 'mapLocationOver'   : str_mapLocationOver   = v
+
+        if len(str_mapLocationOver):
+            # replace the local file path with object store path
+            l_objectfile    = [w.replace(str_mapLocationOver, str_swiftLocation) \
+                                for w in l_localfile]
+        else:
+            # Prepend the swiftlocation to each element in the localfile list:
+            l_objectfile    = [str_swiftLocation + '{0}'.format(i) for i in l_localfile]
+
+        # Check and possibly change the actual file *names* to put into swift storage
+        # (the default is to use the same name as the local file -- however in the
+        # case of DICOM files, the actual final file name might also change)
+        if len(l_remotefileName):
+            l_objectfile    = [l.replace(os.path.basename(l), f) for l,f in
+                                    zip(l_objectfile, l_remotefileName)]
+        return l_objectfile
+
+    def file_put(self, str_localfilename, str_storagefilename) -> dict:
+        """
+        Stream the single local file <str_localfilename> to the
+        object <str_storagefilename> over the connection of the
+        calling thread.
+
+        The file is read and sent in chunks of 'chunkSize' bytes
+        rather than loaded into memory.
+        """
+        d_put                   : dict  = {
+                                            'status':   True,
+                                            'error':    ''
+                                        }
+        d_conn                  : dict  = self.connection_get()
+        try:
+            with open(str_localfilename, 'rb') as fp:
+                d_conn['conn'].put_object(
+                    d_conn['container_name'],
+                    str_storagefilename,
+                    contents        = fp,
+                    content_length  = os.fstat(fp.fileno()).st_size,
+                    chunk_size      = self.chunkSize
+                )
+        except Exception as e:
+            d_put['error']  = '%s' % e
+            d_put['status'] = False
+        return d_put
+
     def objPut(self, *args, **kwargs) -> dict:
         """
         Put an object (or list of objects) into swift storage.
@@ -585,66 +887,82 @@ class swiftStorage(PfStorage):
                 '/storage/dir1/file_d1',
                 '/storage/dir2/file_d2'
 
+        Alternatively, the object names can be given directly in an
+        'objectFileList' kwarg.
+
+        The files are streamed to storage by a pool of 'threads' (kwarg,
+        or the 'swiftThreads' arg) worker threads, each reusing its own
+        connection. The <fileList> can also be an iterator (see
+        filesFind_iter()), in which case the first files are put while
+        the later ones are still coming in. The 'localFileList',
+        'objectFileList', and the per-file 'statusList' of the return
+        are in <fileList> order.
         """
-        b_status                : bool  = True
         l_localfile             : list  = []    # Name on the local file system
-        l_remotefileName        : list  = []    # A replacement for the remote filename
         l_objectfile            : list  = []    # Name in the object storage
-        str_swiftLocation       : str   = ''
-        str_mapLocationOver     : str   = ''
-        str_localfilename       : str   = ''
-        str_storagefilename     : str   = ''
-        str_swiftLocation       : str   = ""
-        str_remoteFile          : str   = ""
+        l_remotefileName        : list  = []    # A replacement for the remote filename
+        threads                 : int   = self.arg.get('swiftThreads', 4)
         d_ret                   : dict  = {
-                                            'status':           b_status,
+                                            'status':           True,
                                             'localFileList':    [],
                                             'objectFileList':   [],
+                                            'statusList':       [],
                                             'localpath':        ''
                                         }
 
-        d_conn  = self.connect(*args, **kwargs)
+        d_conn  = self.connection_get(*args, **kwargs)
 
         for k,v in kwargs.items():
             if k == 'file'              : l_localfile.append(v)
+            if k == 'fileList'          : l_localfile           = v
+            if k == 'objectFileList'    : l_objectfile          = v
             if k == 'remoteFile'        : l_remotefileName.append(v)
             if k == 'remoteFileList'    : l_remotefileName      = v
-            if k == 'fileList'          : l_localfile           = v
-            if k == 'toLocation'        : str_swiftLocation     = v
-            if k == 'mapLocationOver'   : str_mapLocationOver   = v
+            if k == 'threads'           : threads               = v
 
-        if len(str_mapLocationOver):
-            # replace the local file path with object store path
-            l_objectfile    = [w.replace(str_mapLocationOver, str_swiftLocation) \
-                                for w in l_localfile]
-        else:
-            # Prepend the swiftlocation to each element in the localfile list:
-            l_objectfile    = [str_swiftLocation + '{0}'.format(i) for i in l_localfile]
-
-        # Check and possibly change the actual file *names* to put into swift storage
-        # (the default is to use the same name as the local file -- however in the
-        # case of DICOM files, the actual final file name might also change)
-        if len(l_remotefileName):
-            l_objectfile    = [l.replace(os.path.basename(l), f) for l,f in
-                                    zip(l_objectfile, l_remotefileName)]
-
-        d_ret['localpath']  = os.path.dirname(l_localfile[0])
+        def objectFiles_resolve():
+            """
+            Yield the (local, object) names of the files, resolving the
+            object name of each file as it comes in.
+            """
+            if len(l_objectfile):
+                yield from zip(l_localfile, l_objectfile)
+                return
+            d_kwargs    = dict(kwargs)
+            d_kwargs.pop('file', None)
+            d_kwargs.pop('remoteFile', None)
+            for i, str_localfilename in enumerate(l_localfile):
+                d_kwargs['fileList']        = [str_localfilename]
+                d_kwargs['remoteFileList']  = l_remotefileName[i : i + 1]
+                yield str_localfilename, self.objectFileList_resolve(**d_kwargs)[0]
+
+        def put_collect(t_put) -> None:
+            str_localfilename, str_storagefilename, future = t_put
+            d_put       = future.result()
+            if not d_put['status']:
+                d_ret['error']  = d_put['error']
+                d_ret['status'] = False
+            d_ret['localFileList'].append(str_localfilename)
+            d_ret['objectFileList'].append(str_storagefilename)
+            d_ret['statusList'].append(d_put['status'])
 
         if d_conn['status']:
-            for str_localfilename, str_storagefilename in zip(l_localfile, l_objectfile):
-                try:
-                    d_ret['status'] = True and d_ret['status']
-                    with open(str_localfilename, 'rb') as fp:
-                        d_conn['conn'].put_object(
-                            d_conn['container_name'],
-                            str_storagefilename,
-                            contents=fp.read()
-                        )
-                except Exception as e:
-                    d_ret['error']  = '%s' % e
-                    d_ret['status'] = False
-                d_ret['localFileList'].append(str_localfilename)
-                d_ret['objectFileList'].append(str_storagefilename)
+            threads     = max(1, int(threads))
+            dq_put      = collections.deque()
+            with ThreadPoolExecutor(max_workers = threads) as executor:
+                # The files are put as they come in
+                for str_localfilename, str_storagefilename in objectFiles_resolve():
+                    dq_put.append((
+                        str_localfilename,
+                        str_storagefilename,
+                        executor.submit(self.file_put, str_localfilename, str_storagefilename)
+                    ))
+                    if len(dq_put) >= 4 * threads:
+                        put_collect(dq_put.popleft())
+                while len(dq_put):
+                    put_collect(dq_put.popleft())
+        if len(d_ret['localFileList']):
+            d_ret['localpath']  = os.path.dirname(d_ret['localFileList'][0])
         return d_ret
 
     def objPull_process(self, *args, **kwargs):
@@ -667,6 +985,88 @@ class swiftStorage(PfStorage):
 
         return d_ret
 
+    def file_md5(self, str_localfilename, fp = None) -> str:
+        """
+        Return the MD5 hex digest of a local file (or of the rest of
+        its open <fp>), read in chunks of 'chunkSize' bytes.
+        """
+        md5         = hashlib.md5()
+        if fp is None:
+            with open(str_localfilename, 'rb') as fp:
+                return self.file_md5(str_localfilename, fp)
+        while chunk := fp.read(self.chunkSize):
+            md5.update(chunk)
+        return md5.hexdigest()
+
+    def file_pull(self, d_obj, str_localfilename) -> dict:
+        """
+        Stream the object of the listing entry <d_obj> to the local file
+        <str_localfilename> over the connection of the calling thread.
+
+        A local file that already has the size and MD5 (ETag) of the
+        object is left as is. Otherwise the body is written in chunks of
+        'chunkSize' bytes to a '.<name>.part' file next to it, which is
+        renamed to the local file once complete -- so that the local file
+        is never a partial one. A '.part' file left by an interrupted pull
+        is resumed with a range request.
+        """
+        d_pull                  : dict  = {
+                                            'status':   True,
+                                            'skipped':  False,
+                                            'error':    ''
+                                        }
+        str_partfilename        : str   = os.path.join(
+                                            os.path.dirname(str_localfilename),
+                                            '.%s.part' % os.path.basename(str_localfilename)
+                                        )
+        d_conn                  : dict  = self.connection_get()
+        try:
+            if os.path.isfile(str_localfilename) and \
+               os.path.getsize(str_localfilename) == d_obj['bytes'] and \
+               self.file_md5(str_localfilename) == d_obj['hash']:
+                d_pull['skipped']   = True
+                return d_pull
+            os.makedirs(os.path.dirname(str_localfilename), exist_ok = True)
+            offset      : int   = 0
+            if os.path.isfile(str_partfilename):
+                offset  = os.path.getsize(str_partfilename)
+            if not 0 < offset < d_obj['bytes']:
+                offset  = 0
+            d_response  : dict  = {}
+            headers, body       = d_conn['conn'].get_object(
+                                    d_conn['container_name'],
+                                    d_obj['name'],
+                                    resp_chunk_size = self.chunkSize,
+                                    headers         = {'Range': 'bytes=%d-' % offset} \
+                                                        if offset else None,
+                                    response_dict   = d_response
+                                )
+            if d_response.get('status') != 206:
+                offset  = 0
+            with open(str_partfilename, 'r+b' if offset else 'wb') as fp:
+                md5     = hashlib.md5()
+                if offset:
+                    # Take up the MD5 of what is there, and append to it
+                    while chunk := fp.read(self.chunkSize):
+                        md5.update(chunk)
+                    fp.seek(offset)
+                for chunk in body:
+                    fp.write(chunk)
+                    md5.update(chunk)
+                fp.truncate()
+            str_etag    : str   = d_obj['hash']
+            if 'x-static-large-object' not in headers and \
+               'x-object-manifest' not in headers and \
+               md5.hexdigest() != str_etag:
+                os.remove(str_partfilename)
+                raise ValueError('MD5 %s of the pulled %s does not match its ETag %s' % (
+                                    md5.hexdigest(), d_obj['name'], str_etag))
+            os.replace(str_partfilename, str_localfilename)
+        except Exception as e:
+            d_pull['error']     = '%s' % e
+            d_pull['status']    = False
+        return d_pull
+
     def objPull(self, *args, **kwargs):
         """
         Pull an object (or set of objects) from swift storage and
@@ -691,65 +1091,77 @@ class swiftStorage(PfStorage):
         if 'toLocation' is not specified, then the local file system
         location will be the 'fromLocation' prefixed with a '/'.
 
+        The objects are pulled (see file_pull()) as the listing is read,
+        by a pool of 'threads' (kwarg, or the 'swiftThreads' arg) worker
+        threads, with at most a few pulls per thread queued at any time.
+        Local files that are already complete are skipped, so a pull that
+        was interrupted is resumed by simply running it again. The
+        'localFileList' and 'objectFileList' of the return are in
+        listing order.
         """
         b_status                : bool  = True
-        l_localfile             : list  = []    # Name on the local file system
-        l_objectfile            : list  = []    # Name in the object storage
         str_swiftLocation       : str   = ''
         str_mapLocationOver     : str   = ''
-        str_localfilename       : str   = ''
-        str_storagefilename     : str   = ''
-        str_swiftLocation       : str   = ""
+        threads                 : int   = self.arg.get('swiftThreads', 4)
         d_ret                   = {
             'status':           b_status,
             'localFileList':    [],
             'objectFileList':   [],
+            'pulled':           0,
+            'skipped':          0,
             'localpath':        ''
         }
 
-        d_conn  = self.connect(*args, **kwargs)
+        d_conn  = self.connection_get(*args, **kwargs)
 
         for k,v in kwargs.items():
             if k == 'fromLocation'  : str_swiftLocation   = v
             if k == 'toLocation'    : str_mapLocationOver = v
+            if k == 'threads'       : threads             = v
 
         kwargs['path']  = str_swiftLocation
-        # Get dictionary of objects in storage
-        d_ls            = self.ls(*args, **kwargs)
-
-        # List of objects in storage
-        l_objectfile    = [x['name'] for x in d_ls['listDict_obj']]
-
-        if len(str_mapLocationOver):
-            # replace the local file path with object store path
-            l_localfile         = [w.replace(str_swiftLocation, str_mapLocationOver) \
-                                    for w in l_objectfile]
-        else:
-            # Prepend a '/' to each element in the l_objectfile:
-            l_localfile         = ['/' + '{0}'.format(i) for i in l_objectfile]
-            str_mapLocationOver =  '/' + str_swiftLocation
-
-        d_ret['localpath']          = str_mapLocationOver
+        kwargs.pop('retSpec', None)
+
+        def localfile_map(str_storagefilename) -> str:
+            if len(str_mapLocationOver):
+                # replace the local file path with object store path
+                return str_storagefilename.replace(str_swiftLocation, str_mapLocationOver)
+            else:
+                # Prepend a '/' to the object name
+                return '/' + str_storagefilename
+
+        def pull_collect(t_pull) -> None:
+            str_localfilename, str_storagefilename, future = t_pull
+            d_pull      = future.result()
+            if not d_pull['status']:
+                d_ret['error']  = d_pull['error']
+                d_ret['status'] = False
+            elif d_pull['skipped']:
+                d_ret['skipped']    += 1
+            else:
+                d_ret['pulled']     += 1
+            d_ret['localFileList'].append(str_localfilename)
+            d_ret['objectFileList'].append(str_storagefilename)
+
+        d_ret['localpath']          = str_mapLocationOver or '/' + str_swiftLocation
         d_ret['currentWorkingDir']  = os.getcwd()
 
         if d_conn['status']:
-            for str_localfilename, str_storagefilename in zip(l_localfile, l_objectfile):
-                try:
-                    d_ret['status'] = True and d_ret['status']
-                    obj_tuple       = d_conn['conn'].get_object(
-                                                    d_conn['container_name'],
-                                                    str_storagefilename
-                                                )
-                    str_parentDir   = os.path.dirname(str_localfilename)
-                    os.makedirs(str_parentDir, exist_ok = True)
-                    with open(str_localfilename, 'wb') as fp:
-                        # fp.write(str(obj_tuple[1], 'utf-8'))
-                        fp.write(obj_tuple[1])
-                except Exception as e:
-                    d_ret['error']  = str(e)
-                    d_ret['status'] = False
-                d_ret['localFileList'].append(str_localfilename)
-                d_ret['objectFileList'].append(str_storagefilename)
+            threads     = max(1, int(threads))
+            dq_pull     = collections.deque()
+            with ThreadPoolExecutor(max_workers = threads) as executor:
+                # The objects are pulled as the listing is read
+                for d_obj in self.ls_iter(**kwargs):
+                    str_localfilename   = localfile_map(d_obj['name'])
+                    dq_pull.append((
+                        str_localfilename,
+                        d_obj['name'],
+                        executor.submit(self.file_pull, d_obj, str_localfilename)
+                    ))
+                    if len(dq_pull) >= 4 * threads:
+                        pull_collect(dq_pull.popleft())
+                while len(dq_pull):
+                    pull_collect(dq_pull.popleft())
         return d_ret
 
     def run(self, opt={}) -> dict:
@@ -787,6 +1199,10 @@ class swiftStorage(PfStorage):
                 }
                 self.log(str_msg, comms = 'error')
             self.log(json.dumps(d_actionResult, indent = 4), comms = 'tx')
+            d_pool          = swiftPool.metrics_get()
+            self.log("swift auth round trips: %d, saved: %d, connections: %d" % (
+                        d_pool['auths'], d_pool['authsSaved'], d_pool['connections']),
+                      comms = 'status')
 
         return d_actionResult
 
@@ -846,7 +1262,7 @@ class fileStorage(PfStorage):
             Return the original and modified 'toLocation' and status flag.
             """
             b_pack = False
-            d_DICOMread = self.packer.DICOMfile_read(file=str_DICOMfilename)
+            d_DICOMread = self.packer.DICOMfile_read(file=str_DICOMfilename, headerOnly=True)
             d_path = self.packer.packPath_resolve(d_DICOMread)
             self.obj[str_DICOMfilename] = d_DICOMread
             str_origTo = d_args['toLocation']
@@ -956,6 +1372,11 @@ class fileStorage(PfStorage):
                 '/storage/dir1/file_d1',
                 '/storage/dir2/file_d2'
 
+        under the container directory. The files are placed there by a
+        pool of 'threads' (kwarg, or the 'swiftThreads' arg) worker threads
+        as a 'placement' (kwarg, default 'reflink', see repack.file_place())
+        and a file already there with the same size and modification time
+        is skipped; the 'skipped' of the return counts those.
         """
         b_status: bool = True
         l_localfile: list = []  # Name on the local file system
@@ -967,7 +1388,10 @@ class fileStorage(PfStorage):
         str_storagefilename: str = ''
         str_swiftLocation: str = ""
         str_remoteFile: str = ""
-        dst: str = ""
+        str_placement: str = "reflink"
+        threads: int = self.arg.get('swiftThreads', 4)
+        l_dst: list = []
+        l_place: list = []
         d_ret: dict = {
             'status': b_status,
             'localFileList': [],
@@ -982,6 +1406,8 @@ class fileStorage(PfStorage):
             if k == 'fileList': l_localfile = v
             if k == 'toLocation': str_swiftLocation = v
             if k == 'mapLocationOver': str_mapLocationOver = v
+            if k == 'placement': str_placement = v
+            if k == 'threads': threads = v
 
         if len(str_mapLocationOver):
             # replace the local file path with object store path
@@ -1001,17 +1427,17 @@ class fileStorage(PfStorage):
         d_ret['localpath'] = os.path.dirname(l_localfile[0])
         d_conn = self.state('/swift/container_name')
         if d_conn:
-            for str_localfilename, str_storagefilename in zip(l_localfile, l_objectfile):
-                try:
-                    d_ret['status'] = True and d_ret['status']
-                    dst = Path(d_conn)/str_storagefilename
-                    dst.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copyfile(str_localfilename, str(dst))
-                except Exception as e:
-                    d_ret['error'] = '%s' % e
+            l_dst   = [str(Path(d_conn)/f) for f in l_objectfile]
+            l_place = repack.files_place(l_localfile, l_dst,
+                                         str_placement  = str_placement,
+                                         threads        = max(1, int(threads)))
+            for str_localfilename, dst, d_place in zip(l_localfile, l_dst, l_place):
+                if not d_place['status']:
+                    d_ret['error']  = d_place['error']
                     d_ret['status'] = False
                 d_ret['localFileList'].append(str_localfilename)
-                d_ret['objectFileList'].append(str(dst))
+                d_ret['objectFileList'].append(dst)
+            d_ret['skipped']    = [d['placement'] for d in l_place].count('skip')
         return d_ret
 
     def connect(self, *args, **kwargs):
@@ -1,6 +1,5 @@
 # Global modules
 import  subprocess
-import  pudb
 import  json
 import  pfmisc
 from    pfmisc._colors      import  Colors
@@ -119,6 +118,13 @@ def parser_setup(str_desc):
         dest    = 'b_swiftPackEachDICOM',
         action  = 'store_true',
         default = False)
+    parser.add_argument(
+        '--swiftThreads',
+        action  = 'store',
+        dest    = 'swiftThreads',
+        type    = int,
+        default = 4,
+        help    = 'number of files to push to swift concurrently')
     parser.add_argument(
         '--storeBaseLocation',
         action  = 'store',
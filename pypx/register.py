@@ -28,10 +28,12 @@ from datetime import date, datetime
 import inspect
 
 import re
+from concurrent.futures import ThreadPoolExecutor
 
 # PyDicom module
 import pydicom as dicom
 from chrisclient import client
+from chrisclient import request
 
 # PYPX modules
 import pypx.utils
@@ -39,8 +41,6 @@ import pypx.smdb
 import pypx.repack
 
 # Debugging
-import pudb
-from pudb.remote import set_trace
 import pfmisc
 
 from argparse import Namespace, ArgumentParser
@@ -48,7 +48,6 @@ from argparse import RawTextHelpFormatter
 from pypx.push import parser_setup as push_parser_setup
 from pypx.push import parser_interpret as push_parser_interpret
 
-
 argv_orig = sys.argv
 # To exclude help and exit while building push parser
 sys.argv = [a for a in sys.argv if (a != "-h" and a != "--help")]
@@ -198,6 +197,23 @@ def parser_setup(str_desc):
         help="swift PACS location within SERVICE/PACS to push files",
     )
 
+    parser.add_argument(
+        "--threads",
+        action="store",
+        dest="threads",
+        type=int,
+        default=1,
+        help="Number of files to register with CUBE concurrently",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store",
+        dest="checkpoint",
+        type=int,
+        default=100,
+        help="Update the smdb register table every <checkpoint> registered files",
+    )
+
     parser.add_argument(
         "--cleanup",
         action="store_true",
@@ -322,8 +338,29 @@ class Register:
     a DICOM file, parses its tags, and then registers tags of that file
     with a ChRIS/CUBE instance. This of course assumes that the file has been
     pushed to CUBE using some mechanism (most typically ``pfstorage``).
+
+    Files are registered in bulk: up to <threads> files are read and
+    registered concurrently, and the smdb register table of each series
+    is only updated every <checkpoint> files and once at the end.
     """
 
+    # The DICOM tags that are registered with CUBE
+    l_DICOMtags: list = [
+        "PatientID",
+        "PatientName",
+        "PatientBirthDate",
+        "PatientAge",
+        "PatientSex",
+        "ProtocolName",
+        "StudyDate",
+        "StudyDescription",
+        "StudyInstanceUID",
+        "Modality",
+        "SeriesDescription",
+        "SeriesInstanceUID",
+        "AccessionNumber",
+    ]
+
     def serviceKey_process(self) -> dict:
         """
         If a service key (--CUBE <key>) has been specified, read from
@@ -416,6 +453,13 @@ class Register:
             self.args.str_CUBEuserpasswd,
         )
 
+        # Only these header tags are read from each file
+        self.l_tagsToRead: list = list(
+            dict.fromkeys(self.l_DICOMtags + self.packer.templateTags_get())
+        )
+        # Per series register table fields that are not yet written
+        self.d_seriesUpdate: dict = {}
+
         self.filesToRegister_determine()
         self.loggers_create()
         self.log("Register DICOM dir: %s" % (self.args.str_xcrdir), level=2)
@@ -432,29 +476,40 @@ class Register:
 
         A CRITICAL assumption here is that the file to be registered already
         exists in storage! For now, this assumption is not verified/tested!
+
+        The read and register of up to <threads> files happen concurrently,
+        while the smdb is only updated from this (the calling) thread.
         """
         dl_run: list = []
         d_run: dict = {"status": False}
-        current: int = 0
         total: int = len(self.l_files)
-        for str_file in self.l_files:
-            current += 1
-            d_run = self.DICOMfile_mapsUpdate(
-                self.DICOMfile_register(
-                    self.packer.DICOMfile_read(
-                        file="%s/%s" % (self.args.str_xcrdir, str_file)
-                    ),
-                    str_file,
+        checkpoint: int = max(1, int(getattr(self.args, "checkpoint", 100)))
+
+        def file_register(str_file) -> dict:
+            return self.DICOMfile_register(
+                self.packer.DICOMfile_read(
+                    file="%s/%s" % (self.args.str_xcrdir, str_file),
+                    l_tagsToUse=list(self.l_tagsToRead),
+                    headerOnly=True,
                 ),
-                current,
-                total,
+                str_file,
             )
-            # Before returning, we need to "sanitize" some of the
-            # DICOMfile_read fields, specifically the DICOM read
-            # payload that can be very full/noisy. Here we just
-            # remove it.
-            d_run["d_DICOMfile_register"]["d_DICOMfile_read"].pop("d_DICOM")
-            dl_run.append(d_run)
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, int(getattr(self.args, "threads", 1)))
+        ) as executor:
+            # map() returns the results in file order
+            for d_register in executor.map(file_register, self.l_files):
+                d_run = self.DICOMfile_mapsUpdate(d_register, len(dl_run) + 1, total)
+                # Before returning, we need to "sanitize" some of the
+                # DICOMfile_read fields, specifically the DICOM read
+                # payload that can be very full/noisy. Here we just
+                # remove it.
+                d_run["d_DICOMfile_register"]["d_DICOMfile_read"].pop("d_DICOM")
+                dl_run.append(d_run)
+                if not len(dl_run) % checkpoint:
+                    self.mapsUpdate_flush()
+        self.mapsUpdate_flush()
 
         return {"status": d_run["status"], "run": dl_run}
 
@@ -539,23 +594,8 @@ class Register:
         d_pacsData: dict = {}
         d_register: dict = {}
         ld_register: list = []
-        l_DICOMtags: list = [
-            "PatientID",
-            "PatientName",
-            "PatientBirthDate",
-            "PatientAge",
-            "PatientSex",
-            "ProtocolName",
-            "StudyDate",
-            "StudyDescription",
-            "StudyInstanceUID",
-            "Modality",
-            "SeriesDescription",
-            "SeriesInstanceUID",
-            "AccessionNumber",
-        ]
         if d_DICOMfile_read["status"]:
-            for k in l_DICOMtags:
+            for k in self.l_DICOMtags:
                 try:
                     d_pacsData[k] = d_DICOMfile_read["d_DICOM"]["d_dicomSimple"][k]
                 except Exception as e:
@@ -574,7 +614,7 @@ class Register:
                     d_path["imageFile"],
                 )
             try:
-                d_register = self.CUBE.register_pacs_file(d_pacsData)
+                d_register = self.CUBEfile_register(d_pacsData)
             except Exception as e:
                 d_register = {"path": d_pacsData["path"], "msg": "%s" % str(e)}
         return {
@@ -583,38 +623,70 @@ class Register:
             "d_CUBE_register_pacs_file": d_register,
         }
 
+    def CUBEfile_register(self, d_pacsData) -> dict:
+        """
+        Register a single PACS file with CUBE. This POSTs to the CUBE
+        'pacsfiles/' collection directly if the installed chrisclient
+        no longer provides a register_pacs_file().
+        """
+        if hasattr(self.CUBE, "register_pacs_file"):
+            return self.CUBE.register_pacs_file(d_pacsData)
+        req: request.Request = request.Request(self.CUBE.auth, self.CUBE.content_type)
+        collection = req.post(self.args.str_CUBEURL + "pacsfiles/", d_pacsData)
+        return request.Request.get_data_from_collection(collection)["data"][0]
+
     def DICOMfile_mapsUpdate(self, d_DICOMfile_register, current=0, total=0) -> dict:
         """
-        Interact with the SMDB object to update JSON mapping information
-        recording this registration operation.
+        Record the register information of a file for the smdb register
+        table of its series. The table itself is only written by
+        mapsUpdate_flush().
         """
         b_status: bool = False
         d_register: dict = {}
         if d_DICOMfile_register["status"]:
             b_status = True
-            self.smdb.housingDirs_create()
             d_register = d_DICOMfile_register["d_CUBE_register_pacs_file"]
             if "id" in d_register.keys():
                 l_pop = [
                     d_register.pop(k) for k in ["id", "creation_date", "fname", "fsize"]
                 ]
-            # Record in the smdb an entry for each series
-            self.smdb.d_DICOM = d_DICOMfile_register["d_DICOMfile_read"]["d_DICOM"][
+            d_dicomSimple: dict = d_DICOMfile_register["d_DICOMfile_read"]["d_DICOM"][
                 "d_dicomSimple"
             ]
-            now = datetime.now()
-            self.smdb.seriesData("register", "info", d_register)
-            self.smdb.seriesData(
-                "register", "objectCounter", {"current": current, "total": total}
-            )
-            self.smdb.seriesData(
-                "register", "timestamp", now.strftime("%Y-%m-%d, %H:%M:%S")
+            str_seriesUID: str = d_dicomSimple.get("SeriesInstanceUID", "")
+            d_update: dict = self.d_seriesUpdate.setdefault(
+                str_seriesUID,
+                {"d_DICOM": d_dicomSimple, "current": 0, "fields": {}},
             )
-            if len(self.args.CUBE):
-                self.smdb.seriesData(
-                    "register",
-                    "CUBE",
-                    self.smdb.service_keyAccess("CUBE")["CUBE"][self.args.CUBE],
-                )
+            d_update["current"] += 1
+            d_update["fields"]["info"] = d_register
+            d_update["fields"]["objectCounter"] = {
+                "current": d_update["current"],
+                "total": total,
+            }
 
         return {"status": b_status, "d_DICOMfile_register": d_DICOMfile_register}
+
+    def mapsUpdate_flush(self) -> None:
+        """
+        Interact with the SMDB object to update JSON mapping information
+        recording the registration operations so far -- one write per
+        series.
+        """
+        if not self.d_seriesUpdate:
+            return
+        self.smdb.housingDirs_create()
+        d_CUBE: dict = {}
+        if len(self.args.CUBE):
+            d_CUBE = self.smdb.service_keyAccess("CUBE")["CUBE"][self.args.CUBE]
+        now = datetime.now()
+        for str_seriesUID, d_update in self.d_seriesUpdate.items():
+            if not d_update["fields"]:
+                continue
+            d_update["fields"]["timestamp"] = now.strftime("%Y-%m-%d, %H:%M:%S")
+            if d_CUBE:
+                d_update["fields"]["CUBE"] = d_CUBE
+            # Record in the smdb an entry for each series
+            self.smdb.d_DICOM = d_update["d_DICOM"]
+            self.smdb.seriesData_fieldsSet("register", d_update["fields"])
+            d_update["fields"] = {}
@@ -26,17 +26,20 @@ from datetime import date, datetime
 import inspect
 import hashlib
 import re
+import functools
+import errno
+import fcntl
+from concurrent.futures import ThreadPoolExecutor
 
 # PyDicom module
 import pydicom as dicom
+from pydicom.datadict import keyword_dict
 
 # PYPX modules
 import pypx.utils
 import pypx.smdb
 
 # Debugging
-import pudb
-from pudb.remote import set_trace
 import pfmisc
 
 import seahash
@@ -101,6 +104,14 @@ def parser_setup(str_desc):
         default="/tmp/log",
         help="Directory to store log files",
     )
+    parser.add_argument(
+        "--dbtype",
+        action="store",
+        dest="str_dbType",
+        type=str,
+        default="",
+        help="smdb storage backend: 'json' or 'sqlite' (default: detect)",
+    )
     parser.add_argument(
         "-d",
         "--datadir",
@@ -144,6 +155,16 @@ def parser_setup(str_desc):
         help="Template pattern for image file",
     )
 
+    parser.add_argument(
+        "--placement",
+        action="store",
+        dest="str_placement",
+        type=str,
+        choices=["copy", "hardlink", "reflink", "move"],
+        default="copy",
+        help="How to place a received file in the pack tree",
+    )
+
     parser.add_argument(
         "--cleanup",
         action="store_true",
@@ -151,6 +172,70 @@ def parser_setup(str_desc):
         default=False,
         help="If specified, then cleanup temporary files",
     )
+
+    # Daemon settings
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        dest="b_daemon",
+        default=False,
+        help="If specified, run as a long lived repack daemon",
+    )
+    parser.add_argument(
+        "--watchdir",
+        action="store",
+        dest="str_watchDir",
+        type=str,
+        default="",
+        help="In daemon mode, directory to watch for incoming files",
+    )
+    parser.add_argument(
+        "--fifo",
+        action="store",
+        dest="str_fifo",
+        type=str,
+        default="",
+        help="In daemon mode, FIFO from which to read file names",
+    )
+    parser.add_argument(
+        "--socket",
+        action="store",
+        dest="str_socket",
+        type=str,
+        default="",
+        help="In daemon mode, Unix socket from which to read file names",
+    )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        dest="workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="In daemon mode, number of repack worker processes",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        dest="b_poll",
+        default=False,
+        help="In daemon mode, poll the watchdir instead of using inotify",
+    )
+    parser.add_argument(
+        "--pollInterval",
+        action="store",
+        dest="pollInterval",
+        type=float,
+        default=1.0,
+        help="In daemon mode, seconds between watchdir polls",
+    )
+    parser.add_argument(
+        "--reportInterval",
+        action="store",
+        dest="reportInterval",
+        type=float,
+        default=10.0,
+        help="In daemon mode, seconds between throughput reports",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -258,9 +343,482 @@ def args_impedanceMatch(ns_arg):
         setattr(ns_arg, "str_seriesDirTemplate", args.str_seriesDirTemplate)
     if "str_imageTemplate" not in l_key:
         setattr(ns_arg, "str_imageTemplate", args.str_imageTemplate)
+    if "str_placement" not in l_key:
+        setattr(ns_arg, "str_placement", args.str_placement)
     return ns_arg
 
 
+class DICOMdict(dict):
+    """
+    A dictionary for the d_DICOM structure returned by
+    Process.DICOMfile_read(), where some (expensive) representations
+    of the DICOM data can be registered as builder callables that are
+    only run, and their result stored, the first time the key is read.
+
+    Lazy keys keep their template (empty) value until then, so that
+    iteration and JSON serialization see the same keys as before.
+    Explicitly setting a key discards any pending builder.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.d_lazy: dict = {}
+
+    def lazy_set(self, key, builder) -> None:
+        self.d_lazy[key] = builder
+
+    def __getitem__(self, key):
+        if key in self.d_lazy:
+            self[key] = self.d_lazy.pop(key)()
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value) -> None:
+        self.d_lazy.pop(key, None)
+        super().__setitem__(key, value)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+# Runs of characters that are not allowed in a pack path component
+re_unsafe = re.compile(r"[^A-Za-z0-9\.\-]+")
+re_nonWord = re.compile(r"\W+")
+
+# The tags that a template can refer to: all the DICOM keywords, and
+# the AgeInDays that is calculated from the StudyDate and the
+# PatientBirthDate
+s_templateTags: set = {str_keyword for str_keyword in keyword_dict if str_keyword}
+s_templateTags.add("AgeInDays")
+templateTagLength: int = max(len(str_tag) for str_tag in s_templateTags)
+
+
+def age_daysToDMY(ageInDays: int) -> str:
+    """
+    Given an age in days, return a string of D[ay], M[onth], [Y]ear
+    of the age closest to either epoch.
+    """
+    str_age: str = "999Y"
+    if ageInDays >= 365:
+        str_age = "%03dY" % round(ageInDays / 365)
+    if ageInDays >= 30 and ageInDays < 365:
+        str_age = "%03dM" % round(ageInDays / 30)
+    if ageInDays >= 7 and ageInDays < 30:
+        str_age = "%03dW" % round(ageInDays / 7)
+    if ageInDays < 7:
+        str_age = "%03dD" % ageInDays
+    return str_age
+
+
+def ageInDays_calculateExplicitly(d_DICOM: dict) -> int:
+    """
+    Explicitly calculate the age in days from the StudyDate and
+    PatientBirthDate tag values, or 0 if either is empty.
+    """
+    d_pacsData: dict = d_DICOM["d_dicomSimple"]
+    ageInDays: int = 0
+    if len(d_pacsData["StudyDate"]) and len(d_pacsData["PatientBirthDate"]):
+        try:
+            date_study = datetime.strptime(d_pacsData["StudyDate"], "%Y-%m-%d")
+        except:
+            date_study = datetime.strptime(d_pacsData["StudyDate"], "%Y%m%d")
+        try:
+            date_birth = datetime.strptime(d_pacsData["PatientBirthDate"], "%Y-%m-%d")
+        except:
+            date_birth = datetime.strptime(d_pacsData["PatientBirthDate"], "%Y%m%d")
+        ageInDays = abs((date_study - date_birth).days)
+    return ageInDays
+
+
+class Template:
+    """
+    A '%'-tagged string template (see Process.tagsInString_process())
+    parsed into a list of parts, each either a literal string or a tag
+    substitution of the form
+
+        (<tag>, [(<function>, <arg>), ...], <trailing literal>, <source>)
+
+    so that it can be evaluated against the tags of a DICOM file in one
+    pass. A tag is the longest DICOM keyword that follows the '%' and
+    its (optional) functions. Each function is written as
+
+        _<name>|<arg>_  or  _<name>_
+
+    and the functions of a tag are applied in order, where <name> is one of
+
+        md5|<chars>         the md5 hash (truncated to <chars>)
+        seahash|<chars>     the seahash (truncated to <chars>)
+        pad|<width>,<char>  right justify in <width> with <char> (default '0')
+        strmsk|<mask>       keep the value where <mask> has a '*', else
+                            use the <mask> character
+        nospc|<char>        collapse non alphanumeric runs to <char>
+        name|<tag>          a fake name, seeded by the value of <tag>
+
+    A tag that is not in the DICOM file is left as is, except for the
+    PatientAge and AgeInDays which are then calculated (and added to the
+    d_dicomSimple).
+
+    Use template_compile() to get the (cached) Template of a string.
+    """
+
+    # The tags that are calculated if not in a DICOM file
+    l_ageTag: list = ["PatientAge", "AgeInDays"]
+    l_functionName: list = ["md5", "seahash", "pad", "strmsk", "nospc", "name"]
+
+    @staticmethod
+    def pad(str_value: str, str_arg: str, d_DICOM: dict) -> str:
+        if len(str_arg):
+            l_arg: list = str_arg.split(",")
+            str_value = str_value.rjust(
+                int(l_arg[0]), l_arg[1] if len(l_arg) > 1 else "0"
+            )
+        return str_value
+
+    @staticmethod
+    def md5(str_value: str, str_arg: str, d_DICOM: dict) -> str:
+        str_value = hashlib.md5(str_value.encode("utf-8")).hexdigest()
+        if len(str_arg):
+            str_value = str_value[0 : int(str_arg)]
+        return str_value
+
+    @staticmethod
+    def seahash(str_value: str, str_arg: str, d_DICOM: dict) -> str:
+        s = seahash.SeaHash()
+        s.update(str_value.encode("utf-8"))
+        str_value = s.hexdigest()
+        if len(str_arg):
+            str_value = str_value[0 : int(str_arg)]
+        return str_value
+
+    @staticmethod
+    def strmsk(str_value: str, str_arg: str, d_DICOM: dict) -> str:
+        return "".join(
+            [i if j == "*" else j for i, j in zip(list(str_value), list(str_arg))]
+        )
+
+    @staticmethod
+    def nospc(str_value: str, str_arg: str, d_DICOM: dict) -> str:
+        # strip out all non-alphnumeric chars and join what is left with
+        # str_arg
+        return str_arg.join(re_nonWord.sub(" ", str_value).split())
+
+    @staticmethod
+    def name(str_value: str, str_arg: str, d_DICOM: dict) -> str:
+        """
+        Replace the value with a name. If the <str_arg> is a DICOM tag
+        (with a lower case first character to protect the parsing of
+        non-arg tags) its value seeds the name, so that all the files
+        that have the same tag value (e.g. a series) get the same name.
+        """
+        from faker import Faker
+
+        fake = Faker()
+        if len(str_arg):
+            str_argTag: str = str_arg[0].upper() + str_arg[1:]
+            if str_argTag in d_DICOM["d_dicomSimple"]:
+                str_seed: str = d_DICOM["d_dicomSimple"][str_argTag]
+                Faker.seed(int.from_bytes(str_seed.encode(), "little"))
+        l_firstLast: list = fake.name().split()
+        return "%s^%s^ANON" % (l_firstLast[1].upper(), l_firstLast[0].upper())
+
+    def __init__(self, str_template: str):
+        self.str_template: str = str_template
+        self.l_part: list = []
+        l_fragment: list = str_template.split("%")
+        if len(l_fragment[0]):
+            self.l_part.append(l_fragment[0])
+        for str_fragment in l_fragment[1:]:
+            self.l_part.append(self.fragment_compile(str_fragment))
+
+    def fragment_compile(self, str_fragment: str):
+        """
+        Return the part for the text between two '%'s: a tag
+        substitution if it names a tag, else the literal text.
+        """
+        l_function: list = []
+        str_rest: str = str_fragment
+        while str_rest.startswith("_"):
+            str_function, str_sep, str_after = str_rest[1:].partition("_")
+            str_name, _, str_arg = str_function.partition("|")
+            if not str_sep or str_name not in self.l_functionName:
+                break
+            l_function.append((getattr(Template, str_name), str_arg))
+            str_rest = str_after
+        for length in range(min(len(str_rest), templateTagLength), 0, -1):
+            if str_rest[:length] in s_templateTags:
+                return (
+                    str_rest[:length],
+                    l_function,
+                    str_rest[length:],
+                    "%" + str_fragment,
+                )
+        return "%" + str_fragment
+
+    def evaluate(self, d_DICOM: dict) -> dict:
+        """
+        Substitute the tags of <d_DICOM> (a DICOMfile_read() structure)
+        into the template.
+        """
+        d_tags: dict = d_DICOM["d_dicomSimple"]
+        l_tagRaw: list = d_DICOM["l_tagRaw"]
+        l_result: list = []
+        b_tagsFound: bool = False
+        ageInDays = None
+        for part in self.l_part:
+            if isinstance(part, str):
+                l_result.append(part)
+                continue
+            str_tag, l_function, str_trailing, str_source = part
+            if str_tag not in l_tagRaw:
+                if str_tag not in self.l_ageTag:
+                    l_result.append(str_source)
+                    continue
+                if ageInDays is None:
+                    ageInDays = ageInDays_calculateExplicitly(d_DICOM)
+                if str_tag == "PatientAge":
+                    d_tags[str_tag] = age_daysToDMY(ageInDays)
+                else:
+                    d_tags[str_tag] = "%06dd" % ageInDays
+            b_tagsFound = True
+            str_value: str = str(d_tags[str_tag])
+            for f_function, str_arg in l_function:
+                str_value = f_function(str_value, str_arg, d_DICOM)
+            l_result.append(str_value + str_trailing)
+        return {
+            "status": True,
+            "b_tagsFound": b_tagsFound,
+            "str_result": "".join(l_result),
+        }
+
+
+@functools.lru_cache(maxsize=256)
+def template_compile(str_template: str) -> Template:
+    """
+    Return the (cached) compiled Template for <str_template>.
+    """
+    return Template(str_template)
+
+
+# The errors of a link/clone/rename that mean "not possible here", in which
+# case file_place() falls back to a copy
+l_placementErrno: list = [
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.ENOSYS,
+]
+
+
+def file_reflink(str_source: str, str_destination: str) -> None:
+    """
+    Clone <str_source> to <str_destination> with the FICLONE ioctl, so
+    that they share their data blocks (copy on write) on filesystems
+    that support it, like btrfs and XFS.
+    """
+    FICLONE: int = getattr(fcntl, "FICLONE", 0x40049409)
+    with open(str_source, "rb") as fp_source:
+        with open(str_destination, "wb") as fp_destination:
+            try:
+                fcntl.ioctl(fp_destination.fileno(), FICLONE, fp_source.fileno())
+            except OSError:
+                fp_destination.close()
+                os.remove(str_destination)
+                raise
+    file_statCopy(str_source, str_destination)
+
+
+def file_statCopy(str_source: str, str_destination: str) -> None:
+    """
+    Give <str_destination> the mode and the access/modification times of
+    <str_source>, so that a later placement finds it up to date.
+    """
+    st = os.stat(str_source)
+    os.chmod(str_destination, st.st_mode & 0o7777)
+    os.utime(str_destination, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def file_copy(str_source: str, str_destination: str) -> None:
+    """
+    Copy <str_source> to <str_destination> within the kernel, with
+    copy_file_range(2) (which some filesystems turn into a clone or a
+    server side copy) or else sendfile(2), so that the data is never
+    copied through Python. A plain read/write copy is the last resort.
+    """
+    with open(str_source, "rb") as fp_source:
+        with open(str_destination, "wb") as fp_destination:
+            fd_in: int = fp_source.fileno()
+            fd_out: int = fp_destination.fileno()
+            size: int = os.fstat(fd_in).st_size
+            copied: int = 0
+            for str_call in ["copy_file_range", "sendfile"]:
+                if not hasattr(os, str_call):
+                    continue
+                try:
+                    while copied < size:
+                        if str_call == "copy_file_range":
+                            sent: int = os.copy_file_range(fd_in, fd_out, size - copied)
+                        else:
+                            sent = os.sendfile(fd_out, fd_in, copied, size - copied)
+                        if not sent:
+                            break
+                        copied += sent
+                    break
+                except OSError as e:
+                    # Only start over with the next call if nothing was copied
+                    if e.errno not in l_placementErrno + [errno.ENOTSUP] or copied:
+                        raise
+            if copied < size:
+                fp_source.seek(copied)
+                fp_destination.seek(copied)
+                shutil.copyfileobj(fp_source, fp_destination)
+    file_statCopy(str_source, str_destination)
+
+
+def file_hash(str_filename: str) -> str:
+    """
+    Return the MD5 hex digest of the content of <str_filename>.
+    """
+    md5 = hashlib.md5()
+    with open(str_filename, "rb") as fp:
+        while chunk := fp.read(1 << 20):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def file_matches(
+    str_source: str, str_destination: str, str_match: str = "mtime"
+) -> bool:
+    """
+    Check if <str_destination> already holds the content of <str_source>:
+    if it is the same inode, or has the same size and either the same
+    modification time (to the second, for <str_match> 'mtime') or the
+    same content hash (for <str_match> 'hash'). For <str_match> 'exists'
+    any file at <str_destination> matches.
+    """
+    if str_match == "exists":
+        return os.path.lexists(str_destination)
+    try:
+        st_destination = os.stat(str_destination)
+    except FileNotFoundError:
+        return False
+    st_source = os.stat(str_source)
+    if (st_source.st_dev, st_source.st_ino) == (
+        st_destination.st_dev,
+        st_destination.st_ino,
+    ):
+        return True
+    if st_source.st_size != st_destination.st_size:
+        return False
+    if str_match == "hash":
+        return file_hash(str_source) == file_hash(str_destination)
+    return int(st_source.st_mtime) == int(st_destination.st_mtime)
+
+
+def file_place(str_source: str, str_destination: str, str_placement: str) -> dict:
+    """
+    Place the file <str_source> at <str_destination> (replacing any file
+    already there) by one of
+
+        copy        a full copy (in the kernel, see file_copy())
+        hardlink    a new link to the same inode
+        reflink     a copy on write clone
+        move        a rename, removing <str_source>
+
+    where a hardlink, reflink or move that is not possible (e.g. across
+    devices, or on a filesystem without clones) falls back to a copy, or
+    to a copy and remove for a move. The 'placement' of the return is
+    the method actually used. A copy or clone keeps the modification time
+    of <str_source>, and only appears at <str_destination> once complete.
+    """
+    d_ret: dict = {"status": False, "placement": str_placement, "path": "", "error": ""}
+    str_temp: str = "%s.%s.tmp" % (str_destination, uuid.uuid4().hex)
+    try:
+        try:
+            if str_placement == "move":
+                os.replace(str_source, str_destination)
+            elif str_placement == "hardlink":
+                os.link(str_source, str_temp)
+                os.replace(str_temp, str_destination)
+            elif str_placement == "reflink":
+                file_reflink(str_source, str_temp)
+                os.replace(str_temp, str_destination)
+            else:
+                d_ret["placement"] = "copy"
+                file_copy(str_source, str_temp)
+                os.replace(str_temp, str_destination)
+        except OSError as e:
+            if e.errno not in l_placementErrno or d_ret["placement"] == "copy":
+                raise
+            d_ret["placement"] = "copy"
+            file_copy(str_source, str_temp)
+            os.replace(str_temp, str_destination)
+            if str_placement == "move":
+                os.remove(str_source)
+        d_ret["path"] = str_destination
+        d_ret["status"] = True
+    except Exception as e:
+        d_ret["error"] = "%s" % e
+    finally:
+        # A rename onto another link of the same inode leaves the source
+        if os.path.lexists(str_temp):
+            os.remove(str_temp)
+    return d_ret
+
+
+def files_place(
+    l_source: list,
+    l_destination: list,
+    str_placement: str = "copy",
+    threads: int = 4,
+    str_match: str = "mtime",
+) -> list:
+    """
+    Place each file of <l_source> at the corresponding path of
+    <l_destination> with file_place(), by a pool of <threads> worker
+    threads, and return the list of their returns in <l_source> order.
+
+    Each destination directory is created once, up front. A destination
+    that already matches its source (see file_matches(), unless the
+    <str_match> is empty, or the <str_placement> a 'move') is skipped
+    with a 'placement' of 'skip'.
+    """
+    d_dirError: dict = {}
+    for str_dir in dict.fromkeys(os.path.dirname(str_d) for str_d in l_destination):
+        try:
+            os.makedirs(str_dir or ".", exist_ok=True)
+        except OSError as e:
+            d_dirError[str_dir] = "%s" % e
+
+    def place(str_source: str, str_destination: str) -> dict:
+        str_error: str = d_dirError.get(os.path.dirname(str_destination), "")
+        if str_error:
+            return {
+                "status": False,
+                "placement": str_placement,
+                "path": "",
+                "error": str_error,
+            }
+        if (
+            str_match
+            and str_placement != "move"
+            and file_matches(str_source, str_destination, str_match)
+        ):
+            return {
+                "status": True,
+                "placement": "skip",
+                "path": str_destination,
+                "error": "",
+            }
+        return file_place(str_source, str_destination, str_placement)
+
+    if threads <= 1 or len(l_source) <= 1:
+        return list(map(place, l_source, l_destination))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(place, l_source, l_destination))
+
+
 class Process:
     """
     The core class of the repack module -- this class essentially reads
@@ -326,6 +884,8 @@ class Process:
         self.__name__: str = "repack"
         self.args = args
         self.l_files: list = []
+        # The pack directories that are known to exist
+        self.s_outputDir: set = set()
 
         if len(self.args.str_xcrdirfile):
             self.args.str_xcrdir = os.path.dirname(self.args.str_xcrdirfile)
@@ -363,6 +923,9 @@ class Process:
                 str_message = "%s successfully deleted" % str_filepath
             except Exception as e:
                 str_error = "%s" % e
+        elif self.args.str_placement == "move":
+            b_status = True
+            str_message = "%s moved to the pack tree" % str_filepath
 
         return {"status": b_status, "error": str_error, "message": str_message}
 
@@ -379,7 +942,8 @@ class Process:
             d_run = self.DICOMfile_mapsUpdate(
                 self.DICOMfile_save(
                     Process.DICOMfile_read(
-                        file="%s/%s" % (self.args.str_xcrdir, str_file)
+                        file="%s/%s" % (self.args.str_xcrdir, str_file),
+                        headerOnly=True,
                     )
                 )
             )
@@ -405,6 +969,33 @@ class Process:
 
         return {"status": d_run["status"], "run": dl_run}
 
+    def templateTags_get(self) -> list:
+        """
+        Return the DICOM keywords that the pack path templates can refer
+        to, i.e. the header tags that need to be read from a file in order
+        to resolve its pack path. Like tagsInString_process(), this matches
+        keywords anywhere within the templates (here regardless of case so
+        as to also catch tag arguments to functions), and adds the tags
+        needed to calculate the age.
+        """
+        str_templates: str = "%".join(
+            [
+                self.args.str_rootDirTemplate,
+                self.args.str_studyDirTemplate,
+                self.args.str_seriesDirTemplate,
+                self.args.str_imageTemplate,
+            ]
+        ).lower()
+        l_tags: list = [
+            str_keyword
+            for str_keyword in keyword_dict
+            if str_keyword and str_keyword.lower() in str_templates
+        ]
+        for str_tag in ["PatientAge", "StudyDate", "PatientBirthDate"]:
+            if str_tag not in l_tags:
+                l_tags.append(str_tag)
+        return l_tags
+
     def packPath_resolve(self, d_DICOMfile_read) -> dict:
         """
         Return the pack path and image name template. Note this
@@ -417,8 +1008,7 @@ class Process:
             Process DICOM lookup tags in a template string and
             return a sanitized result.
             """
-            return re.sub(
-                "[^A-Za-z0-9\.\-]+",
+            return re_unsafe.sub(
                 "_",
                 self.tagsInString_process(d_DICOMfile_read["d_DICOM"], str_template)[
                     "str_result"
@@ -460,41 +1050,63 @@ class Process:
         status of receipts.
         """
 
+        def outputDir_create(str_outputDir) -> str:
+            """
+            Create the <str_outputDir> (once, since all the files of a
+            series share it) and return any error.
+            """
+            if str_outputDir in self.s_outputDir:
+                return ""
+            try:
+                os.makedirs(str_outputDir, exist_ok=True)
+            except Exception as e:
+                return "%s" % e
+            if len(self.s_outputDir) >= 4096:
+                self.s_outputDir.clear()
+            self.s_outputDir.add(str_outputDir)
+            return ""
+
         b_status: bool = False
         str_imageFile: str = ""
         str_outputDir: str = ""
         str_errorDir: str = ""
         str_errorCopy: str = ""
         str_path: str = ""
+        str_placement: str = ""
         d_path: dict = {}
+        d_place: dict = {}
 
-        # pudb.set_trace()
         if d_DICOMfile_read["status"]:
             d_path = self.packPath_resolve(d_DICOMfile_read)
             str_outputDir = "%s/%s" % (self.args.str_dataDir, d_path["packDir"])
             str_imageFile = d_path["imageFile"]
 
-            try:
-                os.makedirs(str_outputDir)
-            except Exception as e:
-                str_errorDir = "%s" % e
-            try:
-                str_path = shutil.copy(
+            str_errorDir = outputDir_create(str_outputDir)
+            for attempt in range(2):
+                d_place = file_place(
                     "%s/%s"
                     % (
                         d_DICOMfile_read["inputPath"],
                         d_DICOMfile_read["inputFileName"],
                     ),
                     "%s/%s" % (str_outputDir, str_imageFile),
+                    self.args.str_placement,
                 )
-                b_status = True
-            except Exception as e:
-                str_errorCopy = "%s" % e
+                if d_place["status"] or os.path.isdir(str_outputDir):
+                    break
+                # The output directory was removed since it was created
+                self.s_outputDir.discard(str_outputDir)
+                str_errorDir = outputDir_create(str_outputDir)
+            b_status = d_place["status"]
+            str_path = d_place["path"]
+            str_placement = d_place["placement"]
+            str_errorCopy = d_place["error"]
         return {
-            "method": inspect.stack()[0][3],
+            "method": inspect.currentframe().f_code.co_name,
             "outputDir": str_outputDir,
             "outputFile": str_imageFile,
             "shutilpath": str_path,
+            "placement": str_placement,
             "status": b_status,
             "errorDir": str_errorDir,
             "errorCopy": str_errorCopy,
@@ -534,22 +1146,37 @@ class Process:
         returning  a  dictionary  object of multiple representations
         of the dicom data.
 
+        kwargs:
+
+            file        = <DICOMfile>
+            l_tagsToUse = <list of DICOM tag keywords>
+            headerOnly  = True|False
+
+        If 'headerOnly' is True, the file is read up to (but not including)
+        the PixelData -- restricted further to only the 'l_tagsToUse' if
+        these are given -- and the 'str_raw', 'd_dcm', and 'd_dicom'
+        representations are only built when first looked up in the
+        returned 'd_DICOM'. This is what most callers want, since they
+        only use the 'd_dicomSimple' tag values.
+
         Nested functions are used here, mainly for encapsulation
         and readability.
         """
 
         # Core structure template returned by this method
-        d_DICOM: dict = {
-            "str_dicomFile": "",
-            "dcm": None,
-            "d_dcm": {},
-            "str_raw": "",
-            "l_tagRaw": [],
-            "str_json": {},
-            "d_dicom": {},
-            "d_dicomSimple": {},
-            "l_tagsUsed": [],
-        }
+        d_DICOM: DICOMdict = DICOMdict(
+            {
+                "str_dicomFile": "",
+                "dcm": None,
+                "d_dcm": {},
+                "str_raw": "",
+                "l_tagRaw": [],
+                "str_json": {},
+                "d_dicom": {},
+                "d_dicomSimple": {},
+                "l_tagsUsed": [],
+            }
+        )
 
         def dcm_readFromFile(str_file, d_DICOM) -> bool:
             """
@@ -559,14 +1186,25 @@ class Process:
             d_err: dict = {"file": "", "cwd": "", "message": ""}
             d_DICOM["str_dicomFile"] = str_file
             try:
-                d_DICOM["dcm"] = dicom.read_file(str_file)
+                if b_headerOnly:
+                    d_DICOM["dcm"] = dicom.dcmread(
+                        str_file,
+                        stop_before_pixels=True,
+                        specific_tags=l_tags if len(l_tags) else None,
+                    )
+                else:
+                    d_DICOM["dcm"] = dicom.dcmread(str_file)
                 b_status = True
             except Exception as e:
                 d_err["file"] = str_file
                 d_err["cwd"] = os.getcwd()
                 d_err["message"] = "%s" % e
                 b_status = False
-            return {"method": inspect.stack()[0][3], "status": b_status, "error": d_err}
+            return {
+                "method": inspect.currentframe().f_code.co_name,
+                "status": b_status,
+                "error": d_err,
+            }
 
         def dcm_doExplicitToStr(d_dcm, str_file) -> dict:
             """
@@ -591,13 +1229,25 @@ class Process:
                     str_raw += str_err + "\n"
                     b_status = False
             return {
-                "method": inspect.stack()[0][3],
+                "method": inspect.currentframe().f_code.co_name,
                 "failingFile": str_file,
                 "status": b_status,
                 "conversion": str_raw,
                 "error": str_err,
             }
 
+        def dcm_toStr(d_DICOM, d_prior) -> str:
+            """
+            Return the 'str_raw' representation, falling back to an
+            explicit element by element conversion.
+            """
+            nonlocal d_raw
+            try:
+                return str(d_DICOM["dcm"])
+            except:
+                d_raw = dcm_doExplicitToStr(d_DICOM["d_dcm"], d_prior)
+                return d_raw["conversion"]
+
         def dcm_populate(d_DICOM, d_prior) -> dict:
             """
             Populate some additional records of the d_DICOM structure
@@ -605,18 +1255,17 @@ class Process:
             """
             b_status: bool = False
             d_explicit: dict = {}
-            d_raw: dict = {}
             if d_prior["status"]:
                 b_status = True
                 d_DICOM["l_tagRaw"] = d_DICOM["dcm"].dir()
-                d_DICOM["d_dcm"] = dict(d_DICOM["dcm"])
-                try:
-                    d_DICOM["str_raw"] = str(d_DICOM["dcm"])
-                except:
-                    d_raw = dcm_doExplicitToStr(d_DICOM["d_dcm"], d_prior)
-                    d_DICOM["str_raw"] = d_raw["conversion"]
+                if b_headerOnly:
+                    d_DICOM.lazy_set("d_dcm", lambda: dict(d_DICOM["dcm"]))
+                    d_DICOM.lazy_set("str_raw", lambda: dcm_toStr(d_DICOM, d_prior))
+                else:
+                    d_DICOM["d_dcm"] = dict(d_DICOM["dcm"])
+                    d_DICOM["str_raw"] = dcm_toStr(d_DICOM, d_prior)
             return {
-                "method": inspect.stack()[0][3],
+                "method": inspect.currentframe().f_code.co_name,
                 "status": b_status,
                 "rawConversion": d_raw,
                 "prior": d_prior,
@@ -637,8 +1286,17 @@ class Process:
                 if "PixelData" in d_DICOM["l_tagsUsed"]:
                     d_DICOM["l_tagsUsed"].remove("PixelData")
 
+                if b_headerOnly:
+                    d_DICOM.lazy_set(
+                        "d_dicom",
+                        lambda: {
+                            key: d_DICOM["dcm"].data_element(key)
+                            for key in d_DICOM["l_tagsUsed"]
+                        },
+                    )
                 for key in d_DICOM["l_tagsUsed"]:
-                    d_DICOM["d_dicom"][key] = d_DICOM["dcm"].data_element(key)
+                    if not b_headerOnly:
+                        d_DICOM["d_dicom"][key] = d_DICOM["dcm"].data_element(key)
                     try:
                         d_DICOM["d_dicomSimple"][key] = getattr(d_DICOM["dcm"], key)
                     except:
@@ -660,13 +1318,15 @@ class Process:
                     str_error = "%s" % e
 
             return {
-                "method": inspect.stack()[0][3],
+                "method": inspect.currentframe().f_code.co_name,
                 "status": b_status,
                 "error": str_error,
                 "prior": d_prior,
             }
 
         b_status: bool = False
+        b_headerOnly: bool = False
+        d_raw: dict = {}
         l_tags: list = []
         l_tagsToUse: list = []
         d_tagsInString: dict = {}
@@ -678,6 +1338,8 @@ class Process:
                 str_file = v
             if k == "l_tagsToUse":
                 l_tags = v
+            if k == "headerOnly":
+                b_headerOnly = v
 
         if len(args):
             l_file: list = args[0]
@@ -688,7 +1350,7 @@ class Process:
         )
 
         return {
-            "method": inspect.stack()[0][3],
+            "method": inspect.currentframe().f_code.co_name,
             "status": d_DICOMprocess["status"],
             "inputPath": os.path.dirname(str_file),
             "inputFileName": os.path.basename(str_file),
@@ -722,291 +1384,8 @@ class Process:
 
             006Y-7f38-output.txt
 
+        See Template for the available functions. The template string
+        is only parsed the first time it is seen, after which its
+        compiled form is reused for every DICOM.
         """
-
-        def pad_process(func, str_replace):
-            """
-            Pad a string in a given width.
-
-            Arg specifier:
-
-                    "<width>,<leadingChar>"
-
-            i.e.
-
-                %_pad|3,0_
-
-            will pad the value in a width 3 with leading '0's.
-
-            """
-            nonlocal astr
-            l_funcTag = []  # a function/tag list
-            l_funcTag = func.split("_")[1:]
-            func = l_funcTag[0]
-            char = "0"
-            str_pad = ""
-            l_args = func.split("|")
-            if len(l_args) > 1:
-                str_pad = l_args[1]
-            if len(str_pad):
-                l_arg = str_pad.split(",")
-                width = l_arg[0]
-                if len(l_arg) > 1:
-                    char = l_arg[1]
-                str_replace = str_replace.rjust(int(width), char)
-            astr = astr.replace("_%s_" % func, "")
-            return astr, str_replace
-
-        def md5_process(func, str_replace):
-            """
-            md5 mangle the <str_replace>.
-            """
-            nonlocal astr
-            l_funcTag = []  # a function/tag list
-            l_args = []  # the 'args' of the function
-            chars = ""  # the number of resultant chars from func
-            # result to use
-            str_replace = hashlib.md5(str_replace.encode("utf-8")).hexdigest()
-            l_funcTag = func.split("_")[1:]
-            func = l_funcTag[0]
-            l_args = func.split("|")
-            if len(l_args) > 1:
-                chars = l_args[1]
-                str_replace = str_replace[0 : int(chars)]
-            astr = astr.replace("_%s_" % func, "")
-            return astr, str_replace
-
-        def seahash_process(func, str_replace):
-            """
-            seahash the <str_replace>.
-            """
-            nonlocal astr
-            l_funcTag = []  # a function/tag list
-            l_args = []  # the 'args' of the function
-            chars = ""  # the number of resultant chars from func
-            # result to use
-            s = seahash.SeaHash()
-            s.update(str_replace.encode("utf-8"))
-            str_replace = s.hexdigest()
-            l_funcTag = func.split("_")[1:]
-            func = l_funcTag[0]
-            l_args = func.split("|")
-            if len(l_args) > 1:
-                chars = l_args[1]
-                str_replace = str_replace[0 : int(chars)]
-            astr = astr.replace("_%s_" % func, "")
-            return astr, str_replace
-
-        def strmsk_process(func, str_replace):
-            """
-            string mask
-            """
-            nonlocal astr
-            l_funcTag = []  # a function/tag list
-            l_funcTag = func.split("_")[1:]
-            func = l_funcTag[0]
-            str_msk = func.split("|")[1]
-            l_n = []
-            for i, j in zip(list(str_replace), list(str_msk)):
-                if j == "*":
-                    l_n.append(i)
-                else:
-                    l_n.append(j)
-            str_replace = "".join(l_n)
-            astr = astr.replace("_%s_" % func, "")
-            return astr, str_replace
-
-        def nospc_process(func, str_replace):
-            """
-            replace spaces in string
-            """
-            nonlocal astr
-            l_funcTag = []  # a function/tag list
-            l_args = []  # the 'args' of the function
-            l_funcTag = func.split("_")[1:]
-            func = l_funcTag[0]
-            l_args = func.split("|")
-            str_char = ""
-            if len(l_args) > 1:
-                str_char = l_args[1]
-            # strip out all non-alphnumeric chars and
-            # replace with space
-            str_replace = re.sub(r"\W+", " ", str_replace)
-            # replace all spaces with str_char
-            str_replace = str_char.join(str_replace.split())
-            astr = astr.replace("_%s_" % func, "")
-            return astr, str_replace
-
-        def convertToNumber(s):
-            return int.from_bytes(s.encode(), "little")
-
-        def convertFromNumber(n):
-            return n.to_bytes(math.ceil(n.bit_length() / 8), "little").decode()
-
-        def name_process(func, str_replace):
-            """
-            replace str_replace with a name
-
-            Note this sub-function can take as an argument a DICOM tag, which
-            is then used to seed the name caller. This assures that all
-            DICOM files belonging to the same series (or that have the same
-            DICOM tag value passed as argument) all get the same 'name'.
-
-            NB: If a DICOM tag is passed as an argument, the first character
-            of the tag must be lower case to protect parsing of any non-arg
-            DICOM tags.
-            """
-            nonlocal astr, d_DICOM
-            l_funcTag = []  # a function/tag list
-            l_args = []  # the 'args' of the function
-            l_funcTag = func.split("_")[1:]
-            func = l_funcTag[0]
-            l_args = func.split("|")
-            if len(l_args) > 1:
-                str_argTag = l_args[1]
-                str_argTag = re.sub(
-                    "([a-zA-Z])", lambda x: x.groups()[0].upper(), str_argTag, 1
-                )
-                if str_argTag in d_DICOM["d_dicomSimple"]:
-                    str_seed = d_DICOM["d_dicomSimple"][str_argTag]
-                    randSeed = convertToNumber(str_seed)
-                    Faker.seed(randSeed)
-            str_firstLast = pfdicom.fake.name()
-            l_firstLast = str_firstLast.split()
-            str_first = l_firstLast[0]
-            str_last = l_firstLast[1]
-            str_replace = "%s^%s^ANON" % (str_last.upper(), str_first.upper())
-            astr = astr.replace("_%s_" % func, "")
-            return astr, str_replace
-
-        def age_daysToDMY(ageInDays: int) -> str:
-            """
-            Given an age in days, return a string of D[ay], M[onth], [Y]ear
-            of the age closest to either epoch.
-            """
-            str_age: str = "999Y"
-            if ageInDays >= 365:
-                str_age = "%03dY" % round(ageInDays / 365)
-            if ageInDays >= 30 and ageInDays < 365:
-                str_age = "%03dM" % round(ageInDays / 30)
-            if ageInDays >= 7 and ageInDays < 30:
-                str_age = "%03dW" % round(ageInDays / 7)
-            if ageInDays < 7:
-                str_age = "%03dD" % ageInDays
-            return str_age
-
-        def ageInDays_calculateExplicitly(d_DICOM: dict) -> int:
-            """
-            Explicitly calculate the PatientAge using the StudyDate and PatientBirthDate
-            tag values.
-
-            If unable to calculate return an age string of '999Y' otherwise, return the
-            age in DICOM-y format i.e. '005Y' or '012M' etc.
-            """
-            d_pacsData: dict = d_DICOM["d_dicomSimple"]
-            ageInDays: int = 0
-            str_age: str = "999Y"
-            if len(d_pacsData["StudyDate"]) and len(d_pacsData["PatientBirthDate"]):
-                try:
-                    date_study = datetime.strptime(d_pacsData["StudyDate"], "%Y-%m-%d")
-                except:
-                    date_study = datetime.strptime(d_pacsData["StudyDate"], "%Y%m%d")
-                try:
-                    date_birth = datetime.strptime(
-                        d_pacsData["PatientBirthDate"], "%Y-%m-%d"
-                    )
-                except:
-                    date_birth = datetime.strptime(
-                        d_pacsData["PatientBirthDate"], "%Y%m%d"
-                    )
-                ageInDays = abs((date_study - date_birth).days)
-                # str_age     = age_daysToDMY(ageInDays)
-            return ageInDays
-
-        def AgeInDays_set(d_DICOM: dict, ageInDays: int):
-            """Add a trailing string of age in days (explicitly calculated)
-            to the DICOM PatientAge field.
-
-            Args:
-                d_DICOM (dict): Existing DICOM tag structure
-                ageInDays (int): The explicit age in days calculation
-
-            Returns:
-                Modifies the d_DICOM structure in place
-            """
-            if "PatientAge" not in d_DICOM["d_dicomSimple"]:
-                d_DICOM["d_dicomSimple"]["PatientAge"] = age_daysToDMY(ageInDays)
-            str_DICOMage: str = d_DICOM["d_dicomSimple"]["PatientAge"]
-            d_DICOM["d_dicomSimple"]["PatientAge"] = "%s-%06dd" % (
-                str_DICOMage,
-                ageInDays,
-            )
-
-        def ageTag_processAndUpdate(
-            str_tag: str, d_DICOM: dict, l_tags: list, l_tagsToSub: list
-        ):
-            """Process age related tags in the DICOM structure --
-                either the PatientAge and AgeInDays tags. If not currently
-                present in the d_DICOM structure, then explicitly add to
-                dictionary and tag lists.
-
-            Args:
-                str_tag (str):  tag to process
-                d_DICOM (dict): DICOM header structure
-                l_tags (list): original tag list
-                l_tagsToSub (list): tag list found in DICOM header
-
-            Returns:
-                Modifies the d_DICOM and l_tagsToSub in place if necessary
-            """
-            if any(str_tag in string for string in l_tags) and not any(
-                str_tag in string for string in l_tagsToSub
-            ):
-                ageInDays: int = ageInDays_calculateExplicitly(d_DICOM)
-                if str_tag == "PatientAge":
-                    d_DICOM["d_dicomSimple"][str_tag] = age_daysToDMY(ageInDays)
-                if str_tag == "AgeInDays":
-                    d_DICOM["d_dicomSimple"][str_tag] = "%06dd" % ageInDays
-                l_tagsToSub.append(str_tag)
-
-        b_tagsFound: bool = False
-        str_replace: str = ""  # The lookup/processed tag value
-        l_tags: list = []  # The input string split by '%'
-        l_tagsToSub: list = []  # Remove any noise etc from each tag
-        func: str = ""  # the function to apply
-        tag: str = ""  # the tag in the funcTag combo
-
-        if "%" in astr:
-            l_tags = astr.split("%")[1:]
-            # Find which tags (mangled) in string match actual tags
-            l_tagsToSub = [
-                i for i in d_DICOM["l_tagRaw"] if any(i in b for b in l_tags)
-            ]
-
-            # Explicitly check the PatientAge and the AgeInDays tags
-            for tag in ["PatientAge", "AgeInDays"]:
-                ageTag_processAndUpdate(tag, d_DICOM, l_tags, l_tagsToSub)
-
-            # Make sure lists are in same sort order
-            l_tagsToSubSort = sorted(
-                l_tagsToSub,
-                key=lambda x: [i for i, s in enumerate(l_tags) if x in s][0],
-            )
-            for tag, func in zip(l_tagsToSubSort, l_tags):
-                b_tagsFound = True
-                str_replace = str(d_DICOM["d_dicomSimple"][tag])
-                if "seahash" in func:
-                    astr, str_replace = seahash_process(func, str_replace)
-                if "md5" in func:
-                    astr, str_replace = md5_process(func, str_replace)
-                if "strmsk" in func:
-                    astr, str_replace = strmsk_process(func, str_replace)
-                if "nospc" in func:
-                    astr, str_replace = nospc_process(func, str_replace)
-                if "name" in func:
-                    astr, str_replace = name_process(func, str_replace)
-                if "pad" in func:
-                    astr, str_replace = pad_process(func, str_replace)
-                astr = astr.replace("%" + tag, str_replace)
-
-        return {"status": True, "b_tagsFound": b_tagsFound, "str_result": astr}
+        return template_compile(astr).evaluate(d_DICOM)
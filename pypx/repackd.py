@@ -0,0 +1,463 @@
+"""
+A long running ``px-repack`` daemon.
+
+In the classic setup, ``storescp`` runs a fresh ``px-repack`` process for
+every single received DICOM file (via its ``-xcr`` exec-on-reception hook).
+Each of these processes pays the full python interpreter start, module import
+and ``repack.Process``/``smdb.SMDB`` construction cost before doing a few
+milliseconds of actual work.
+
+The daemon here instead keeps a pool of worker processes, each holding a warm
+``repack.Process`` object, and feeds them file names as they arrive. Files are
+discovered from one or more sources:
+
+    * a watched directory (typically the ``storescp -od`` directory) using
+      inotify, with a polling fallback where inotify is not available;
+    * a FIFO, one fully qualified file name per line, for example
+
+        storescp ... -xcr "echo #p/#f > /tmp/repack.fifo"
+
+    * a Unix domain socket that accepts the same line protocol.
+
+Per-file output and cleanup semantics are those of ``repack.Process.run``.
+"""
+
+# Turn off all logging for modules in this libary!!
+import logging
+
+logging.disable(logging.CRITICAL)
+
+import os
+import sys
+import time
+import stat
+import signal
+import select
+import socket
+import struct
+import ctypes
+import ctypes.util
+import threading
+import queue
+import concurrent.futures
+from pathlib import Path
+
+import pfmisc
+
+from pypx import repack
+
+# inotify(7) event masks
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_TO: int = 0x00000080
+IN_CREATE: int = 0x00000100
+IN_Q_OVERFLOW: int = 0x00004000
+IN_ISDIR: int = 0x40000000
+
+# The warm repack.Process of a worker process
+_packer = None
+
+
+def worker_init(args):
+    """
+    Initializer for each worker process in the pool -- construct the
+    repack.Process (and its SMDB) once.
+    """
+    global _packer
+    args.str_xcrfile = ""
+    args.str_xcrdirfile = ""
+    args.str_filesubstr = ""
+    _packer = repack.Process(args)
+    _packer.l_files = []
+
+
+def worker_repack(str_file: str) -> dict:
+    """
+    Repack a single fully qualified <str_file> using the warm
+    repack.Process of this worker.
+    """
+    d_ret: dict = {"status": False, "file": str_file, "error": ""}
+    try:
+        _packer.args.str_xcrdir = os.path.dirname(str_file)
+        _packer.l_files = [os.path.basename(str_file)]
+        d_run: dict = _packer.run()
+        d_ret["status"] = d_run["status"]
+        if not d_ret["status"]:
+            d_ret["error"] = "repack returned a False status"
+    except Exception as e:
+        d_ret["error"] = "%s" % e
+    finally:
+        _packer.l_files = []
+    return d_ret
+
+
+class Daemon:
+    """
+    Watch for incoming DICOM files and repack them in a pool of
+    long lived worker processes.
+    """
+
+    def loggers_create(self):
+        """
+        Create the debug logger -- this shares the repack.log file.
+        """
+        self.str_debugFile = "%s/repack.log" % self.args.str_logDir
+        self.dp = pfmisc.debug(
+            verbosity=int(self.args.verbosity),
+            level=2,
+            within=self.__name__,
+            debugToFile=self.args.b_debug,
+            debugFile=self.str_debugFile,
+        )
+        self.log = self.dp.qprint
+
+    def __init__(self, args):
+        self.__name__: str = "repackd"
+        self.args = args
+        self.str_watchDir: str = args.str_watchDir or args.str_xcrdir
+        self.workers: int = max(1, int(args.workers))
+        self.f_pollInterval: float = float(args.pollInterval)
+        self.l_fileSubStr: list = [s for s in args.str_filesubstr.split(",") if s]
+
+        self.q_files: queue.Queue = queue.Queue()
+        self.s_inFlight: set = set()
+        self.event_stop: threading.Event = threading.Event()
+        self.l_threads: list = []
+
+        self.d_stats: dict = {
+            "received": 0,
+            "repacked": 0,
+            "failed": 0,
+            "startTime": 0.0,
+        }
+        os.makedirs(self.args.str_logDir, exist_ok=True)
+        self.loggers_create()
+
+    def file_accept(self, str_file: str) -> bool:
+        """
+        Check if a file name is one that should be repacked.
+        """
+        str_name: str = os.path.basename(str_file)
+        if not str_name or str_name.startswith("."):
+            return False
+        if self.l_fileSubStr:
+            return any(s in str_name for s in self.l_fileSubStr)
+        return True
+
+    def file_enqueue(self, str_file: str):
+        """
+        Queue a file for repacking. Relative names are relative to
+        the watch directory.
+        """
+        str_file = str_file.strip()
+        if not str_file:
+            return
+        if not os.path.isabs(str_file):
+            str_file = os.path.join(self.str_watchDir, str_file)
+        if self.file_accept(str_file):
+            self.q_files.put(str_file)
+
+    def inotify_watch(self) -> bool:
+        """
+        Watch the <watchDir> tree with inotify, queueing files as they
+        are closed after writing (or moved into the tree). New
+        subdirectories (storescp -sp/-su sorting) are added to the watch.
+
+        Return False if inotify is not available on this system.
+        """
+        str_libc = ctypes.util.find_library("c")
+        if not str_libc:
+            return False
+        libc = ctypes.CDLL(str_libc, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            return False
+        fd: int = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            return False
+        d_wd: dict = {}
+        mask: int = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+        def dir_watch(str_dir):
+            wd = libc.inotify_add_watch(fd, os.fsencode(str_dir), mask)
+            if wd >= 0:
+                d_wd[wd] = str_dir
+            # Pick up anything that arrived before the watch was in place
+            for str_root, l_dirs, l_files in os.walk(str_dir):
+                for str_subdir in l_dirs:
+                    dir_watch(os.path.join(str_root, str_subdir))
+                for str_file in l_files:
+                    self.file_enqueue(os.path.join(str_root, str_file))
+                break
+
+        def loop():
+            try:
+                dir_watch(self.str_watchDir)
+                while not self.event_stop.is_set():
+                    l_ready, _, _ = select.select([fd], [], [], 0.5)
+                    if not l_ready:
+                        continue
+                    buf: bytes = os.read(fd, 64 * 1024)
+                    i: int = 0
+                    while i + 16 <= len(buf):
+                        wd, evmask, cookie, length = struct.unpack_from("iIII", buf, i)
+                        str_name = os.fsdecode(
+                            buf[i + 16 : i + 16 + length].rstrip(b"\0")
+                        )
+                        i += 16 + length
+                        if evmask & IN_Q_OVERFLOW:
+                            self.log(
+                                "inotify queue overflow, rescanning", comms="error"
+                            )
+                            dir_watch(self.str_watchDir)
+                            continue
+                        if wd not in d_wd:
+                            continue
+                        str_path: str = os.path.join(d_wd[wd], str_name)
+                        if evmask & IN_ISDIR:
+                            if evmask & (IN_CREATE | IN_MOVED_TO):
+                                dir_watch(str_path)
+                        elif evmask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                            self.file_enqueue(str_path)
+            finally:
+                os.close(fd)
+
+        self.thread_start(loop)
+        return True
+
+    def poll_watch(self):
+        """
+        Polling fallback -- rescan the <watchDir> tree every <pollInterval>
+        seconds and queue a file once its size and mtime are unchanged
+        across two consecutive scans.
+        """
+
+        def scan(str_dir, d_now):
+            try:
+                with os.scandir(str_dir) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            scan(entry.path, d_now)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat()
+                            d_now[entry.path] = (st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                pass
+
+        def loop():
+            d_previous: dict = {}
+            d_queued: dict = {}
+            while not self.event_stop.is_set():
+                d_now: dict = {}
+                scan(self.str_watchDir, d_now)
+                for str_file, t_stat in d_now.items():
+                    if (
+                        d_previous.get(str_file) == t_stat
+                        and d_queued.get(str_file) != t_stat
+                    ):
+                        d_queued[str_file] = t_stat
+                        self.file_enqueue(str_file)
+                d_queued = {k: v for k, v in d_queued.items() if k in d_now}
+                d_previous = d_now
+                self.event_stop.wait(self.f_pollInterval)
+
+        self.thread_start(loop)
+
+    def fifo_read(self):
+        """
+        Read fully qualified file names, one per line, from the FIFO
+        <str_fifo>, creating it if necessary.
+        """
+        str_fifo: str = self.args.str_fifo
+        if not os.path.exists(str_fifo):
+            os.mkfifo(str_fifo, 0o666)
+        if not stat.S_ISFIFO(os.stat(str_fifo).st_mode):
+            raise ValueError("%s exists and is not a FIFO" % str_fifo)
+
+        def loop():
+            # Opening read-write keeps the FIFO open across writers,
+            # so no EOF/reopen churn between storescp -xcr calls.
+            fd: int = os.open(str_fifo, os.O_RDWR | os.O_NONBLOCK)
+            buf: bytes = b""
+            try:
+                while not self.event_stop.is_set():
+                    l_ready, _, _ = select.select([fd], [], [], 0.5)
+                    if not l_ready:
+                        continue
+                    buf += os.read(fd, 64 * 1024)
+                    *l_lines, buf = buf.split(b"\n")
+                    for line in l_lines:
+                        self.file_enqueue(os.fsdecode(line))
+            finally:
+                os.close(fd)
+
+        self.thread_start(loop)
+
+    def socket_read(self):
+        """
+        Accept connections on the Unix domain socket <str_socket> and
+        read fully qualified file names, one per line.
+        """
+        str_socket: str = self.args.str_socket
+        if os.path.exists(str_socket):
+            os.unlink(str_socket)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str_socket)
+        server.listen(64)
+        server.settimeout(0.5)
+
+        def client_read(conn):
+            with conn, conn.makefile("rb") as fp:
+                for line in fp:
+                    self.file_enqueue(os.fsdecode(line))
+
+        def loop():
+            try:
+                while not self.event_stop.is_set():
+                    try:
+                        conn, _ = server.accept()
+                    except socket.timeout:
+                        continue
+                    conn.settimeout(None)
+                    self.thread_start(client_read, conn)
+            finally:
+                server.close()
+                if os.path.exists(str_socket):
+                    os.unlink(str_socket)
+
+        self.thread_start(loop)
+
+    def thread_start(self, f_target, *args):
+        thread = threading.Thread(target=f_target, args=args, daemon=True)
+        thread.start()
+        self.l_threads.append(thread)
+        return thread
+
+    def sources_start(self) -> list:
+        """
+        Start the file name sources as specified in the args.
+        """
+        l_sources: list = []
+        if self.args.str_fifo:
+            self.fifo_read()
+            l_sources.append("fifo:%s" % self.args.str_fifo)
+        if self.args.str_socket:
+            self.socket_read()
+            l_sources.append("socket:%s" % self.args.str_socket)
+        if self.args.str_watchDir or not l_sources:
+            os.makedirs(self.str_watchDir, exist_ok=True)
+            if not self.args.b_poll and self.inotify_watch():
+                l_sources.append("inotify:%s" % self.str_watchDir)
+            else:
+                self.poll_watch()
+                l_sources.append("poll:%s" % self.str_watchDir)
+        return l_sources
+
+    def stats_get(self) -> dict:
+        f_elapsed: float = time.time() - self.d_stats["startTime"]
+        done: int = self.d_stats["repacked"] + self.d_stats["failed"]
+        return {
+            **self.d_stats,
+            "elapsed": round(f_elapsed, 3),
+            "filesPerSecond": round(done / f_elapsed, 2) if f_elapsed > 0 else 0.0,
+        }
+
+    def stats_log(self, done: int, f_interval: float):
+        d_stats: dict = self.stats_get()
+        self.log(
+            "processed %d files in last %.1fs (%.2f files/sec); "
+            "total %d repacked, %d failed, %.2f files/sec overall"
+            % (
+                done,
+                f_interval,
+                done / f_interval if f_interval else 0.0,
+                d_stats["repacked"],
+                d_stats["failed"],
+                d_stats["filesPerSecond"],
+            ),
+            comms="status",
+        )
+
+    def stop(self, *args):
+        self.event_stop.set()
+
+    def run(self) -> dict:
+        """
+        Main loop: dispatch queued files to the worker pool until
+        stopped (SIGINT/SIGTERM), periodically reporting throughput.
+        """
+        f_reportInterval: float = float(self.args.reportInterval)
+        maxPending: int = self.workers * 4
+        s_pending: set = set()
+        d_futureFile: dict = {}
+
+        def reap(s_done):
+            for future in s_done:
+                str_file = d_futureFile.pop(future)
+                self.s_inFlight.discard(str_file)
+                try:
+                    d_result = future.result()
+                except Exception as e:
+                    d_result = {"status": False, "error": "%s" % e}
+                if d_result["status"]:
+                    self.d_stats["repacked"] += 1
+                else:
+                    self.d_stats["failed"] += 1
+                    self.log(
+                        "failed to repack %s: %s" % (str_file, d_result["error"]),
+                        comms="error",
+                    )
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self.stop)
+
+        self.d_stats["startTime"] = time.time()
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, initializer=worker_init, initargs=(self.args,)
+        ) as executor:
+            l_sources: list = self.sources_start()
+            self.log(
+                "repack daemon started with %d workers on %s"
+                % (self.workers, ", ".join(l_sources)),
+                comms="status",
+            )
+            f_lastReport: float = time.time()
+            doneAtLastReport: int = 0
+            while not self.event_stop.is_set() or s_pending:
+                if len(s_pending) >= maxPending or self.event_stop.is_set():
+                    s_done, s_pending = concurrent.futures.wait(
+                        s_pending,
+                        timeout=0.5,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    reap(s_done)
+                    continue
+                try:
+                    str_file: str = self.q_files.get(timeout=0.5)
+                except queue.Empty:
+                    str_file = ""
+                if str_file and str_file not in self.s_inFlight:
+                    self.d_stats["received"] += 1
+                    self.s_inFlight.add(str_file)
+                    future = executor.submit(worker_repack, str_file)
+                    d_futureFile[future] = str_file
+                    s_pending.add(future)
+                s_done = {f for f in s_pending if f.done()}
+                s_pending -= s_done
+                reap(s_done)
+
+                f_now: float = time.time()
+                if f_now - f_lastReport >= f_reportInterval:
+                    done = self.d_stats["repacked"] + self.d_stats["failed"]
+                    if done != doneAtLastReport:
+                        self.stats_log(done - doneAtLastReport, f_now - f_lastReport)
+                    doneAtLastReport = done
+                    f_lastReport = f_now
+
+        for thread in self.l_threads:
+            thread.join(timeout=1)
+        d_stats: dict = self.stats_get()
+        self.log(
+            "repack daemon stopped: %d repacked, %d failed, %.2f files/sec"
+            % (d_stats["repacked"], d_stats["failed"], d_stats["filesPerSecond"]),
+            comms="status",
+        )
+        return {"status": True, "sources": l_sources, "stats": d_stats}
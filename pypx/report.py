@@ -1,6 +1,5 @@
 # Global modules
 import subprocess, re, collections
-import pudb
 import json
 import sys
 
@@ -113,10 +112,14 @@ class Report(Base):
         self.dp = pfmisc.debug(verbosity=self.verbosity, within="Find", syslog=False)
         self.log = self.dp.qprint
 
-    def report_generate(self):
+    def report_generate(self, l_study: list = None, studyCount: int = 0):
         """
         Generate a nicely formatted report string,
         suitable for tty/consoles.
+
+        The report is of the <l_study> (by default all the studies of
+        the reportData), the first of which is the <studyCount>-th
+        study of the reportData.
         """
 
         def patientAge_calculate(study):
@@ -335,8 +338,9 @@ class Report(Base):
         l_tabularHits = []
         l_rawTextHits = []
         l_jsonHits = []
-        studyCount = 0
-        for study in self.arg["reportData"]["data"]:
+        if l_study is None:
+            l_study = self.arg["reportData"]["data"]
+        for study in l_study:
             seriesCount = 0
             d_tabular = {}
             d_rawText = {}
@@ -362,6 +366,18 @@ class Report(Base):
 
         return {"tabular": l_tabularHits, "rawText": l_rawTextHits, "json": l_jsonHits}
 
+    def study_add(self, study: dict) -> dict:
+        """
+        Add a (streamed) <study> to the reportData and to the report,
+        and return its report in each of the formats.
+        """
+        studyCount: int = len(self.arg["reportData"]["data"])
+        self.arg["reportData"]["data"].append(study)
+        d_study: dict = self.report_generate([study], studyCount)
+        for str_format, l_hit in d_study.items():
+            self.d_report.setdefault(str_format, []).extend(l_hit)
+        return {str_format: l_hit[0] for str_format, l_hit in d_study.items()}
+
     def queryRetrieveLevel_isStudy(self) -> bool:
         ret: bool = False
         if self.arg["reportData"]:
@@ -884,6 +900,10 @@ class Report(Base):
         This method mainly concerns itself with logic around
         interpreting if input JSON data is valid.
 
+        If an iterable of <studies> is passed in the <opt> (see
+        pypx.stream), these are added to the reportData as they arrive,
+        and a 'tabular' or 'rawText' report is printed study by study.
+
         """
 
         b_status: bool = True
@@ -916,6 +936,19 @@ class Report(Base):
 
         if b_status:
             self.d_report = self.report_generate()
+            if opt.get("studies") is not None:
+                for study in opt["studies"]:
+                    d_study: dict = self.study_add(study)
+                    if self.printReport in ["tabular", "rawText"]:
+                        print(
+                            "%s\n%s\n"
+                            % (
+                                d_study[self.printReport]["header"],
+                                d_study[self.printReport]["body"],
+                            )
+                        )
+                if self.printReport in ["tabular", "rawText"]:
+                    self.printReport = ""
             if len(self.printReport):
                 if (
                     self.printReport in self.d_report.keys()
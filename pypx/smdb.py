@@ -17,11 +17,20 @@ Three core map file/tables exist:
 
     <dataLogDir>/patientData/patientData-<%PatientID>.json
     <dataLogDir>/studyData/studyData-<%StudyInstanceUID>.json
-    <dataLogDir>/seriesData/<%SeriesInstanceUID>/seriesData-%%imageFile.json
+    <dataLogDir>/seriesData/<%SeriesInstanceUID>-images.log
 
-NB: This module is currently NOT THREAD SAFE as of April 2021! Collisions
-occur if multiple jobs try and read/write to the map files concurrently which
-happens if scheduled in an async xinetd storescp pipeline.
+where the seriesData images "table" is an append-only log with a
+{file, size, mtime, location} JSON line per image file.
+
+NB: Multiple jobs read/write the map files concurrently if scheduled in an
+async xinetd storescp pipeline. The default JSON file backend holds an
+advisory (flock) lock on a table across each read-modify-write, and
+replaces the table files atomically (see smdblock.py). The SQLite backend
+(--dbtype sqlite, see smdbstore.py) keeps the same "tables" in a single
+database and serializes the writers in transactions.
+An existing JSON tree can be imported into SQLite with
+
+    px-smdb --logdir <dataLogDir> --action migrateToSQLite
 
 Typical safe calling spec for an xinetd controlled storescp is
 
@@ -34,23 +43,22 @@ Typical safe calling spec for an xinetd controlled storescp is
 
 import sys, os, os.path
 import json
-import pudb
 import datetime
 import copy
 import re
 
-from retry import retry
+from concurrent.futures import ProcessPoolExecutor
+
 from pypx import repack
+from pypx import smdbstore
+from pypx import smdblock
 import pfmisc
 import inspect
 
 from argparse import Namespace, ArgumentParser
 from argparse import RawTextHelpFormatter
 
-import fcntl
 import time
-import pudb
-
 from pathlib import Path
 
 
@@ -108,6 +116,14 @@ def parser_setup(str_desc):
         default="",
         help="DB action args",
     )
+    parser.add_argument(
+        "--jobs",
+        action="store",
+        dest="jobs",
+        type=int,
+        default=0,
+        help="Number of processes reading DICOM headers in a mapsUpdateForPatient\n(default: the number of CPUs)",
+    )
     parser.add_argument(
         "-l",
         "--logdir",
@@ -118,6 +134,15 @@ def parser_setup(str_desc):
         help="Directory to store log files",
     )
 
+    parser.add_argument(
+        "--dbtype",
+        action="store",
+        dest="str_dbType",
+        type=str,
+        default="",
+        help="DB storage backend: 'json' or 'sqlite' (default: detect)",
+    )
+
     parser.add_argument(
         "--AccessionNumber",
         action="store",
@@ -320,6 +345,40 @@ def parser_JSONinterpret(parser, d_JSONargs):
     return parser_interpret(parser, l_args)
 
 
+def image_record(str_file: str) -> dict:
+    """
+    Return the image log record of the (packed) <str_file>.
+    """
+    ofs = os.stat(str_file)
+    return {
+        "file": os.path.basename(str_file),
+        "size": ofs.st_size,
+        "mtime": "%s" % datetime.datetime.fromtimestamp(ofs.st_mtime),
+        "location": str_file,
+    }
+
+
+def image_headerRead(str_file: str) -> dict:
+    """
+    Read the DICOM header of the (packed) <str_file> and return its
+    simple tag values and image log record. This is the per-file part
+    of a batch mapsUpdateForPatient, and runs in the worker processes.
+    """
+    d_read: dict = repack.Process.DICOMfile_read(file=str_file, headerOnly=True)
+    if not d_read["status"]:
+        return {
+            "status": False,
+            "file": str_file,
+            "error": "%s" % d_read["d_DICOMprocess"].get("error", ""),
+        }
+    return {
+        "status": True,
+        "file": str_file,
+        "d_DICOM": dict(d_read["d_DICOM"]["d_dicomSimple"]),
+        "record": image_record(str_file),
+    }
+
+
 class SMDB_models:
     """
     The core data models used by the SMDB database
@@ -498,9 +557,14 @@ class SMDB:
         self.d_seriesMeta: dict = {}
         self.d_seriesImage: dict = {}
 
+        # The images of each series read so far from its image log,
+        # and the log offset to read any new images from
+        self.d_seriesImages: dict = {}
+
         # pudb.set_trace()
         self.housingDirs_create()
         self.debugloggers_create()
+        self.store = smdbstore.store_create(self.args, self.args.str_logDir)
 
     def DICOMobj_set(self, d_DICOM) -> dict:
         self.d_DICOM = d_DICOM.copy()
@@ -555,10 +619,6 @@ class SMDB:
         except:
             return False
 
-    @retry(Exception, delay=1, backoff=2, max_delay=4, tries=10)
-    def json_write(self, fromObject, intoFile):
-        json.dump(fromObject, intoFile, indent=4)
-
     def patientData_DBtablesGet(self):
         """
         Return the patientData table files
@@ -571,7 +631,7 @@ class SMDB:
             "status": True,
             "patientDataFile": {
                 "name": str_patientDataFile,
-                "exists": os.path.isfile(str_patientDataFile),
+                "exists": self.store.exists(str_patientDataFile),
             },
         }
 
@@ -579,26 +639,30 @@ class SMDB:
         """
         Process the patient map data.
         """
+        str_PatientID: str = self.d_DICOM["PatientID"]
+        str_StudyInstanceUID: str = self.d_DICOM["StudyInstanceUID"]
+
+        def patientStudy_add(d_patientMeta) -> dict:
+            if str_PatientID not in d_patientMeta.keys():
+                d_patientMeta[str_PatientID] = self.d_patientModel
+            if str_StudyInstanceUID not in d_patientMeta[str_PatientID]["StudyList"]:
+                d_patientMeta[str_PatientID]["StudyList"].append(str_StudyInstanceUID)
+            return d_patientMeta
+
         self.patientModel_init()
         d_patientTable = self.patientData_DBtablesGet()
         if d_patientTable["patientDataFile"]["exists"]:
-            with open(d_patientTable["patientDataFile"]["name"]) as fj:
-                self.json_read(fj, self.d_patientMeta)
-                # self.d_patientMeta   = json.load(fj)
-            fj.close()
-        if self.d_DICOM["PatientID"] not in self.d_patientMeta.keys():
-            self.d_patientMeta[self.d_DICOM["PatientID"]] = self.d_patientModel
-        if (
-            self.d_DICOM["StudyInstanceUID"]
-            not in self.d_patientMeta[self.d_DICOM["PatientID"]]["StudyList"]
+            self.d_patientMeta.update(
+                self.store.read(d_patientTable["patientDataFile"]["name"])
+            )
+        if str_StudyInstanceUID not in self.d_patientMeta.get(str_PatientID, {}).get(
+            "StudyList", []
         ):
-            self.d_patientMeta[self.d_DICOM["PatientID"]]["StudyList"].append(
-                self.d_DICOM["StudyInstanceUID"]
+            # Add the study under the lock of the table (or in a
+            # transaction) so that concurrent additions are not lost
+            self.d_patientMeta = self.store.update(
+                d_patientTable["patientDataFile"]["name"], patientStudy_add
             )
-            with open(d_patientTable["patientDataFile"]["name"], "w") as fj:
-                self.json_write(self.d_patientMeta, fj)
-            fj.close()
-            # json.dump(self.d_patientMeta, fj, indent = 4)
         self.d_patientModel = self.d_patientMeta[self.d_DICOM["PatientID"]]
         return self.d_patientModel
 
@@ -620,8 +684,8 @@ class SMDB:
                 str_seriesDir,
                 self.d_DICOM["SeriesInstanceUID"],
             )
-            if not os.path.isdir(str_seriesDir):
-                os.makedirs(str_seriesDir, exist_ok=True)
+            if not self.store.isdir(str_seriesDir):
+                self.store.makedirs(str_seriesDir)
         else:
             str_studySeries = "-not applicable-"
         return {
@@ -630,11 +694,11 @@ class SMDB:
             "studySeriesDir": str_seriesDir,
             "studyMetaFile": {
                 "name": str_studyMetaFile,
-                "exists": os.path.isfile(str_studyMetaFile),
+                "exists": self.store.exists(str_studyMetaFile),
             },
             "studySeriesFile": {
                 "name": str_studySeries,
-                "exists": os.path.isfile(str_studySeries),
+                "exists": self.store.exists(str_studySeries),
             },
         }
 
@@ -674,28 +738,26 @@ class SMDB:
         d_studyTable = self.studyData_DBtablesGet()
         if not d_studyTable["studyMetaFile"]["exists"]:
             self.d_studyMeta[self.d_DICOM["StudyInstanceUID"]] = self.d_studyModel
-            with open(d_studyTable["studyMetaFile"]["name"], "w") as fj:
-                self.json_write(self.d_studyMeta, fj)
+            self.store.write(d_studyTable["studyMetaFile"]["name"], self.d_studyMeta)
         else:
-            with open(d_studyTable["studyMetaFile"]["name"]) as fj:
-                self.json_read(fj, self.d_studyMeta)
-        fj.close()
+            self.d_studyMeta.update(
+                self.store.read(d_studyTable["studyMetaFile"]["name"])
+            )
         if not d_studyTable["studySeriesFile"]["exists"]:
-            with open(d_studyTable["studySeriesFile"]["name"], "w") as fj:
-                self.json_write(
-                    {
-                        self.d_DICOM["StudyInstanceUID"]: {
-                            "SeriesInstanceUID": self.d_DICOM["SeriesInstanceUID"],
-                            "SeriesBaseDir": self.str_outputDir,
-                            "DICOM": self.dictexpand(self.d_DICOM),
-                        }
-                    },
-                    fj,
-                )
+            self.store.write(
+                d_studyTable["studySeriesFile"]["name"],
+                {
+                    self.d_DICOM["StudyInstanceUID"]: {
+                        "SeriesInstanceUID": self.d_DICOM["SeriesInstanceUID"],
+                        "SeriesBaseDir": self.str_outputDir,
+                        "DICOM": self.dictexpand(self.d_DICOM),
+                    }
+                },
+            )
         else:
-            with open(d_studyTable["studySeriesFile"]["name"]) as fj:
-                self.json_read(fj, self.d_studySeries)
-        fj.close()
+            self.d_studySeries.update(
+                self.store.read(d_studyTable["studySeriesFile"]["name"])
+            )
         return {
             "status": True,
             "d_studyMeta": self.d_studyMeta,
@@ -739,47 +801,22 @@ class SMDB:
               collisions.
 
             * THIS METHOD IS A POTENTIAL BREAKPOINT IN HIGHLY ASYNCHRONOUS AND
-              CONCURRENT CALLING ENVIRONMENTS!
+              CONCURRENT CALLING ENVIRONMENTS -- for the JSON backend!
 
               This method might attempt to write to the exact same *-meta.json file
-              in a flood of storescp which might break.
+              in a flood of storescp which might break. The JSON backend holds
+              the (flock) lock of the table across the read-modify-write, see
+              smdblock.py; the SQLite backend does the read-modify-write in a
+              single transaction.
 
         """
 
-        @retry(Exception, delay=1, backoff=2, max_delay=4, tries=10)
-        def seriesData_safeWrite(str_filename, d_obj) -> dict:
-            return seriesData_write(str_filename, d_obj)
-
-        def seriesData_write(str_filename, d_obj) -> dict:
-            """
-            Multiprocess safe write
-            """
-            d_ret: dict = {"status": True, "error": ""}
-
-            try:
-                # Create a lock file. If this already exists, the touch()
-                # will raise an exception.
-                lockFile: Path = Path(str_filename).with_suffix(".lock")
-                lockFile.touch(exist_ok=False)
-                with open(str_filename, "w") as fj:
-                    self.json_write(d_obj, fj)
-                    # Now that we've written the data, remove the lock!
-                    lockFile.unlink()
-            except FileExistsError as e:
-                d_ret["status"] = False
-                d_ret["error"] = "Possible multiprocess write failure."
-                raise
-            return d_ret
-
         b_status: bool = False
         b_fileRead: bool = False
         b_canWrite: bool = True
         str_error: str = "File does not exist at time of read"
-        writeRetries: int = 10
-        writeAttempt: int = 1
         str_field: str = ""
         d_meta: dict = {}
-        d_check: dict = {}
         d_ret: dict = {}
         d_seriesTable: dict = self.seriesData_DBtablesGet(
             SeriesInstanceUID=self.d_DICOM["SeriesInstanceUID"]
@@ -790,9 +827,7 @@ class SMDB:
             # The "read" from file...
             str_tableName = "series-%s" % str_table
             if d_seriesTable[str_tableName]["exists"]:
-                with open(d_seriesTable[str_tableName]["name"]) as fj:
-                    self.json_read(fj, d_meta)
-                fj.close()
+                d_meta.update(self.store.read(d_seriesTable[str_tableName]["name"]))
                 b_fileRead = True
                 if len(str_field):
                     if str_field in d_meta.keys():
@@ -810,8 +845,8 @@ class SMDB:
 
             # Optional "write" info to file... if file does not exist yet
             # this code will create it. It is possible that multiple processes
-            # might collide here. We use fcntl to lock access, write, and then
-            # release. If a file is locked, we wait a bit and try again.
+            # might collide here. The store's fieldSet() serializes the
+            # read-modify-write of the field.
             #
             # Only write to the file if there is a file content change
             #
@@ -824,29 +859,39 @@ class SMDB:
                 if b_canWrite:
                     d_meta[str_field] = value
                     str_fileName = d_seriesTable[str_tableName]["name"]
-                    d_write = seriesData_safeWrite(str_fileName, d_meta)
+                    d_write = self.store.fieldSet(str_fileName, str_field, value)
                     b_status = d_write["status"]
                     if d_write["status"]:
                         d_ret = value
                     else:
                         str_error = d_write["error"] + " Could not write DB entry."
-                        d_check = self.seriesData(str_table, str_field)
-                        while (
-                            d_check[str_field] != value and writeAttempt < writeRetries
-                        ):
-                            d_check = self.seriesData(str_table, str_field)
-                            time.sleep(0.5)
-                            writeAttempt += 1
-                        if writeAttempt >= writeRetries:
-                            str_error += "\nSeriesData DB write attempts to log space timed out. This means the DB could not store log data correctly."
-                            str_error += "\n\t\tThis usually implies a permissions issue in the DB dir."
-                            str_error += "\n\t\tDoes the current user (i.e. you) have write access?"
-                            str_error += (
-                                "\n\t\tCheck that the DB dir is not root-locked/owned."
-                            )
+                        str_error += (
+                            "\nThis usually implies a permissions issue in the DB dir."
+                        )
+                        str_error += (
+                            "\n\t\tDoes the current user (i.e. you) have write access?"
+                        )
+                        str_error += (
+                            "\n\t\tCheck that the DB dir is not root-locked/owned."
+                        )
 
         return {"status": b_status, "error": str_error, str_field: d_ret}
 
+    def seriesData_fieldsSet(self, str_table, d_fields) -> dict:
+        """
+        Set all the <d_fields> of the seriesData <str_table> of the current
+        series in one write. This is used to coalesce the many per-file
+        updates of a bulk operation (like a register) into a few writes.
+        """
+        d_seriesTable: dict = self.seriesData_DBtablesGet(
+            SeriesInstanceUID=self.d_DICOM["SeriesInstanceUID"]
+        )
+        if not d_seriesTable["status"]:
+            return {"status": False, "error": "No SeriesInstanceUID"}
+        return self.store.fieldsSet(
+            d_seriesTable["series-%s" % str_table]["name"], d_fields
+        )
+
     def study_statusGet(self, str_StudyInstanceUID) -> dict:
         """
         Return the status of the passed StudyInstanceUID as well as
@@ -863,13 +908,15 @@ class SMDB:
         b_status = d_studyTable["studyMetaFile"]["exists"]
         return {"status": b_status, "studyTable": d_studyTable}
 
-    def study_seriesListGet(self, str_StudyInstanceUID) -> dict:
+    def study_seriesListGet(self, str_StudyInstanceUID, d_studyTable=None) -> dict:
         """
         Return a list of the series associated with given
-        str_StudyInstanceUID
+        str_StudyInstanceUID (optionally using the already
+        known <d_studyTable> status of the study).
         """
         b_status: bool = False
-        d_studyTable: dict = self.study_statusGet(str_StudyInstanceUID)
+        if d_studyTable is None:
+            d_studyTable = self.study_statusGet(str_StudyInstanceUID)
         d_series: dict = {}
         l_series: list = []
         str_studySeriesDir: str = ""
@@ -877,21 +924,16 @@ class SMDB:
         lstr_error: list = []
         if d_studyTable["status"]:
             str_studySeriesDir = d_studyTable["studyTable"]["studySeriesDir"]
-            l_studySeries = os.listdir(str_studySeriesDir)
+            l_studySeries = self.store.listdir(str_studySeriesDir)
             if len(l_studySeries):
                 b_status = True
             for f in l_studySeries:
                 str_studySeriesFile = "%s/%s" % (str_studySeriesDir, f)
-                with open(str_studySeriesFile, "r") as fp:
-                    try:
-                        # d_series    = json.load(fp)
-                        self.json_read(fp, d_series)
-                    except:
-                        b_status = False
-                        lstr_error.append(str_studySeriesFile)
-                        # pudb.set_trace()
-                        # pass
-                fp.close()
+                d_read: dict = self.store.read(str_studySeriesFile)
+                if not d_read:
+                    b_status = False
+                    lstr_error.append(str_studySeriesFile)
+                d_series.update(d_read)
                 l_series.append(d_series[str_StudyInstanceUID]["SeriesInstanceUID"])
         return {
             "status": b_status,
@@ -899,18 +941,75 @@ class SMDB:
             "JSONparseError": lstr_error,
         }
 
+    def study_seriesIndexGet(
+        self, str_StudyInstanceUID, l_SeriesInstanceUID=None
+    ) -> dict:
+        """
+        Return an in-memory status index of a study and its series, built
+        in a single pass over the DB tables:
+
+            {
+                'study':                <study_statusGet()>,
+                'seriesListInStudy':    <study_seriesListGet()>,
+                'series': {
+                    <SeriesInstanceUID>: {
+                        'series':   <series_statusGet()>,
+                        'images':   <series_receivedAndRequested()>
+                    },
+                    ...
+                }
+            }
+
+        The index covers the series in <l_SeriesInstanceUID>, or if not
+        specified, all the series the DB lists for the study. Each study
+        and series table is read only once, regardless of the number of
+        series, so that a status of all the series of a study is linear
+        in the number of series.
+        """
+        d_index: dict = {}
+        d_index["study"] = self.study_statusGet(str_StudyInstanceUID)
+        d_index["seriesListInStudy"] = self.study_seriesListGet(
+            str_StudyInstanceUID, d_index["study"]
+        )
+        if l_SeriesInstanceUID is None:
+            l_SeriesInstanceUID = d_index["seriesListInStudy"]["seriesList"]
+        d_index["series"] = {}
+        for str_SeriesInstanceUID in l_SeriesInstanceUID:
+            d_seriesTable: dict = self.seriesData_DBtablesGet(
+                SeriesInstanceUID=str_SeriesInstanceUID
+            )
+            d_index["series"][str_SeriesInstanceUID] = {
+                "series": {
+                    "status": d_seriesTable["series-meta"]["exists"],
+                    "seriesTable": d_seriesTable,
+                },
+                "images": self.series_receivedAndRequested(
+                    str_SeriesInstanceUID, d_seriesTable
+                ),
+            }
+        return d_index
+
     def study_seriesContainsVerify(
-        self, str_StudyInstanceUID, str_SeriesInstanceUID, b_verifySeriesInStudy
+        self,
+        str_StudyInstanceUID,
+        str_SeriesInstanceUID,
+        b_verifySeriesInStudy,
+        d_index=None,
     ) -> dict:
         """
         Check if the passed str_StudyInstanceUID contains
         the passed str_SeriesInstanceUID -- at least as far
         as the smdb is concerned.
+
+        If passed, the study and series status is taken from the
+        <d_index> of study_seriesIndexGet().
         """
         d_status: dict = {}
         d_status["status"] = False
         d_status["error"] = "Study not found"
-        d_status["study"] = self.study_statusGet(str_StudyInstanceUID)
+        if d_index is None:
+            d_index = {"study": self.study_statusGet(str_StudyInstanceUID)}
+        d_status["study"] = d_index["study"].copy()
         d_status["study"]["state"] = "StudyNotFound"
         d_status["series"] = {}
 
@@ -918,10 +1017,18 @@ class SMDB:
             if d_status["study"]["status"]:
                 d_status["study"]["state"] = "StudyOK"
             d_status["error"] = "Series not found"
-            d_status["study"]["seriesListInStudy"] = self.study_seriesListGet(
-                str_StudyInstanceUID
-            )
-            d_status["series"] = self.series_statusGet(str_SeriesInstanceUID)
+            if "seriesListInStudy" in d_index:
+                d_status["study"]["seriesListInStudy"] = d_index["seriesListInStudy"]
+            else:
+                d_status["study"]["seriesListInStudy"] = self.study_seriesListGet(
+                    str_StudyInstanceUID, d_index["study"]
+                )
+            if str_SeriesInstanceUID in d_index.get("series", {}):
+                d_status["series"] = d_index["series"][str_SeriesInstanceUID][
+                    "series"
+                ].copy()
+            else:
+                d_status["series"] = self.series_statusGet(str_SeriesInstanceUID)
             d_status["series"]["state"] = "SeriesNotFound"
             if d_status["series"]["status"]:
                 d_status["error"] = ""
@@ -937,18 +1044,41 @@ class SMDB:
                 d_status["study"]["status"] = False
         return d_status
 
-    def series_receivedAndRequested(self, str_SeriesInstanceUID) -> dict:
+    def series_receivedAndRequested(
+        self, str_SeriesInstanceUID, d_seriesTable=None
+    ) -> dict:
         """
-        Return a dictionary with requested / received / packed file count.
+        Return a dictionary with requested / received / packed / pushed /
+        registered file count.
+
+        The counts are all determined from one look at the series tables
+        (optionally the already known <d_seriesTable>) and one listing of
+        each of the series' image and packed dirs.
         """
-        pudb.set_trace()
         d_count: dict = {}
-        d_count["received"] = self.series_receivedFilesCount(str_SeriesInstanceUID)
-        d_count["requested"] = self.series_requestedFilesCount(str_SeriesInstanceUID)
-        d_count["packed"] = self.series_packedFilesCount(str_SeriesInstanceUID)
-        d_count["pushed"] = self.series_dbFilesCount(str_SeriesInstanceUID, "push")
+        if d_seriesTable is None:
+            d_seriesTable = self.seriesData_DBtablesGet(
+                SeriesInstanceUID=str_SeriesInstanceUID
+            )
+        d_images: dict = self.series_imagesGet(str_SeriesInstanceUID)
+        d_count["received"] = {"status": bool(len(d_images)), "count": len(d_images)}
+        d_count["requested"] = {"status": False, "count": -1}
+        if d_seriesTable["series-retrieve"]["exists"]:
+            d_retrieve: dict = self.store.read(d_seriesTable["series-retrieve"]["name"])
+            if "NumberOfSeriesRelatedInstances" in d_retrieve:
+                d_count["requested"] = {
+                    "status": True,
+                    "count": int(d_retrieve["NumberOfSeriesRelatedInstances"]),
+                }
+        d_count["packed"] = self.series_packedFilesCount(
+            str_SeriesInstanceUID,
+            self.imageDirs_getOnSeriesInstanceUID(str_SeriesInstanceUID, d_images),
+        )
+        d_count["pushed"] = self.series_dbFilesCount(
+            str_SeriesInstanceUID, "push", d_seriesTable, d_count["packed"]
+        )
         d_count["registered"] = self.series_dbFilesCount(
-            str_SeriesInstanceUID, "register"
+            str_SeriesInstanceUID, "register", d_seriesTable, d_count["packed"]
         )
         if d_count["received"]["count"] >= d_count["requested"]["count"]:
             d_count["state"] = "ImagesAllReceivedOK"
@@ -1004,33 +1134,152 @@ class SMDB:
 
     def series_receivedFilesCount(self, str_SeriesInstanceUID) -> dict:
         """
-        Return the number of actual received files by "counting" the
-        object json files for a given series.
+        Return the number of actual received files, i.e. the images
+        recorded in the image log of the series. This is the count kept
+        with the log, and only the log of an older tree (without a count,
+        or with per-image JSON tables) is read for it.
 
-        Note this returns the count in the seriesDataDir for a given
-        series, which assumes that a file has been processed and
-        recorded -- this does not return the count of files in the
-        packed location.
+        Note this assumes that a file has been processed and recorded
+        -- this does not return the count of files in the packed location.
         """
-        l_files: list = []
-        str_processedDir: str = (
-            os.path.join(
-                self.args.str_logDir, self.str_seriesData, str_SeriesInstanceUID
-            )
-            + "-img"
+        count: int = self.store.logCount(
+            self.seriesImageLog_name(str_SeriesInstanceUID)
+        )
+        if count < 0 or self.store.isdir(
+            self.seriesImageDir_name(str_SeriesInstanceUID)
+        ):
+            count = len(self.series_imagesGet(str_SeriesInstanceUID))
+        return {"status": bool(count), "count": count}
+
+    def seriesImageDir_name(self, str_SeriesInstanceUID) -> str:
+        return "%s/%s-img" % (self.str_seriesDataDir, str_SeriesInstanceUID)
+
+    def seriesImageLog_name(self, str_SeriesInstanceUID) -> str:
+        return "%s/%s-images.log" % (self.str_seriesDataDir, str_SeriesInstanceUID)
+
+    def series_imagesGet(self, str_SeriesInstanceUID) -> dict:
+        """
+        Return the {<outputFile>: <record>} of the images recorded for a
+        series, where a record is
+
+            {'file': <outputFile>, 'size': <bytes>, 'mtime': <time>,
+             'location': <packed file>}
+
+        The image log of a series is read incrementally -- only the
+        records appended since the last call are read -- so this also
+        serves as the running received count of the series. The per-image
+        JSON tables of an older tree are listed on the first call (and only
+        read when needed, see image_recordResolve()).
+        """
+        d_log: dict = self.d_seriesImages.get(str_SeriesInstanceUID)
+        if d_log is None:
+            d_log = {"offset": 0, "images": {}}
+            str_imageDataDir: str = self.seriesImageDir_name(str_SeriesInstanceUID)
+            for str_imageFile in self.store.legacyImagesList(str_imageDataDir):
+                str_outputFile: str = os.path.splitext(str_imageFile)[0]
+                d_log["images"][str_outputFile] = {
+                    "file": str_outputFile,
+                    "legacyTable": "%s/%s" % (str_imageDataDir, str_imageFile),
+                }
+            self.d_seriesImages[str_SeriesInstanceUID] = d_log
+        d_read: dict = self.store.logRead(
+            self.seriesImageLog_name(str_SeriesInstanceUID), d_log["offset"]
+        )
+        for d_record in d_read["records"]:
+            d_log["images"][d_record["file"]] = d_record
+        d_log["offset"] = d_read["offset"]
+        return d_log["images"]
+
+    def image_recordResolve(self, str_SeriesInstanceUID, d_record) -> dict:
+        """
+        Return the full {file, size, mtime, location} record of an image
+        that might only be known by an older per-image JSON table.
+        """
+        if "location" in d_record:
+            return d_record
+        d_legacy: dict = d_record
+        if "legacyTable" in d_record:
+            d_legacy = self.store.read(d_record["legacyTable"])
+        d_imageObj: dict = (
+            d_legacy.get(str_SeriesInstanceUID, {})
+            .get("imageObj", {})
+            .get(d_record["file"], {})
         )
-        if os.path.isdir(str_processedDir):
-            l_files: list = [
-                f
-                for f in os.listdir(str_processedDir)
-                if os.path.isfile(os.path.join(str_processedDir, f))
-            ]
-        return {"status": bool(len(l_files)), "count": len(l_files)}
+        return {
+            "file": d_record["file"],
+            "size": d_imageObj.get("size", 0),
+            "mtime": d_imageObj.get("mtime", ""),
+            "location": d_imageObj.get("FSlocation", ""),
+        }
 
-    def series_dbFilesCount(self, str_SeriesInstanceUID, str_type) -> dict:
+    def series_imageRecorded(self, str_SeriesInstanceUID, str_outputFile) -> bool:
+        """
+        Check if the image <str_outputFile> is recorded for a series: in
+        the images already read, else by a search of its log (and of the
+        per-image tables of an older tree) -- so that a short-lived repack
+        does not need to read all of the image log.
+        """
+        if str_SeriesInstanceUID in self.d_seriesImages:
+            return str_outputFile in self.series_imagesGet(str_SeriesInstanceUID)
+        return self.store.logContains(
+            self.seriesImageLog_name(str_SeriesInstanceUID), str_outputFile
+        ) or self.store.exists(
+            "%s/%s.json"
+            % (self.seriesImageDir_name(str_SeriesInstanceUID), str_outputFile)
+        )
+
+    def series_imageObjGet(
+        self, str_SeriesInstanceUID, l_outputFile=None, d_images=None
+    ) -> dict:
+        """
+        Return the images of a series (or only those in <l_outputFile>,
+        of the optional already known <d_images>) in the structure of the
+        per-image JSON tables of older trees:
+
+            {
+                <SeriesInstanceUID>: {
+                    <series meta>,
+                    'outputFile':   <first outputFile>,
+                    'imageObj': {
+                        <outputFile>: {
+                            'size':         <bytes>,
+                            'mtime':        <time>,
+                            'FSlocation':   <packed file>
+                        },
+                        ...
+                    }
+                }
+            }
+        """
+        if d_images is None:
+            d_images = self.series_imagesGet(str_SeriesInstanceUID)
+        if l_outputFile is None:
+            l_outputFile = list(d_images.keys())
+        d_series: dict = self.store.read(
+            "%s/%s-meta.json" % (self.str_seriesDataDir, str_SeriesInstanceUID)
+        ).get(str_SeriesInstanceUID, {})
+        d_series["outputFile"] = l_outputFile[0] if len(l_outputFile) else ""
+        d_series["imageObj"] = {}
+        for str_outputFile in l_outputFile:
+            if str_outputFile in d_images:
+                d_record: dict = self.image_recordResolve(
+                    str_SeriesInstanceUID, d_images[str_outputFile]
+                )
+                d_series["imageObj"][str_outputFile] = {
+                    "size": d_record["size"],
+                    "mtime": d_record["mtime"],
+                    "FSlocation": d_record["location"],
+                }
+        return {str_SeriesInstanceUID: d_series}
+
+    def series_dbFilesCount(
+        self, str_SeriesInstanceUID, str_type, d_seriesTable=None, d_packed=None
+    ) -> dict:
         """
         Return the number of actual str_type files by "counting" the
-        object json files for a given series <str_type>.
+        object json files for a given series <str_type>. The already
+        known <d_seriesTable> and <d_packed> count of the series can
+        optionally be passed.
 
         In the case of success, the return count will reflect the number
         of current data objects relevant to the <str_type>. This is deter-
@@ -1066,13 +1315,13 @@ class SMDB:
             str_SeriesInstanceUID,
             str_type,
         )
-        if os.path.isdir(str_seriesDir):
-            l_files: list = [
-                f
-                for f in os.listdir(str_seriesDir)
-                if re.match(r"%s-%s.json" % (str_SeriesInstanceUID, str_type), f)
-            ]
-            b_status = bool(len(l_files))
+        if d_seriesTable is not None:
+            b_exists: bool = d_seriesTable["series-%s" % str_type]["exists"]
+        else:
+            b_exists = self.store.exists(str_dbFile)
+        if b_exists:
+            l_files = [str_dbFile]
+            b_status = True
             if b_status:
                 """
                 A 'true' status simply indicates the entire series has been pro-
@@ -1086,11 +1335,9 @@ class SMDB:
                 or simply the total number of packed files for the case of a
                 'push' operation).
                 """
-                pudb.set_trace()
                 count = len(l_files)
                 if count == 1:
-                    with open(str_dbFile) as fj:
-                        self.json_read(fj, d_content)
+                    d_content.update(self.store.read(str_dbFile))
                     if "status" in d_content:
                         if not d_content["status"]:
                             count = -10
@@ -1099,9 +1346,10 @@ class SMDB:
                             if "current" in d_content["objectCounter"]:
                                 count = d_content["objectCounter"]["current"]
                         else:
-                            d_packed = self.series_packedFilesCount(
-                                str_SeriesInstanceUID
-                            )
+                            if d_packed is None:
+                                d_packed = self.series_packedFilesCount(
+                                    str_SeriesInstanceUID
+                                )
                             count = d_packed["count"]
                             if d_packed["status"]:
                                 count = d_packed["count"]
@@ -1110,15 +1358,17 @@ class SMDB:
                                 count = -1
         return {"status": b_status, "count": count}
 
-    def series_packedFilesCount(self, str_SeriesInstanceUID) -> dict:
+    def series_packedFilesCount(self, str_SeriesInstanceUID, d_imageDir=None) -> dict:
         """
         Return the number of actual packed files by "counting" the
-        image DICOMS files for a given series.
+        image DICOMS files for a given series (optionally in the
+        already known <d_imageDir>).
 
         """
         b_status: bool = False
         l_files: list = []
-        d_imageDir: dict = self.imageDirs_getOnSeriesInstanceUID(str_SeriesInstanceUID)
+        if d_imageDir is None:
+            d_imageDir = self.imageDirs_getOnSeriesInstanceUID(str_SeriesInstanceUID)
         if d_imageDir["status"]:
             str_processedDir: str = d_imageDir[str_SeriesInstanceUID]
             if os.path.isdir(str_processedDir):
@@ -1182,31 +1432,31 @@ class SMDB:
             "status": b_status,
             "seriesBaseDir": {
                 "name": str_seriesBaseDir,
-                "exists": os.path.isdir(str_seriesBaseDir),
+                "exists": self.store.isdir(str_seriesBaseDir),
             },
             "series-meta": {
                 "name": str_seriesMetaFile,
-                "exists": os.path.isfile(str_seriesMetaFile),
+                "exists": self.store.exists(str_seriesMetaFile),
             },
             "series-retrieve": {
                 "name": str_seriesRetrieveFile,
-                "exists": os.path.isfile(str_seriesRetrieveFile),
+                "exists": self.store.exists(str_seriesRetrieveFile),
             },
             "series-image": {
                 "name": str_seriesImageFile,
-                "exists": os.path.isfile(str_seriesImageFile),
+                "exists": self.store.exists(str_seriesImageFile),
             },
             "series-push": {
                 "name": str_seriesPushFile,
-                "exists": os.path.isfile(str_seriesPushFile),
+                "exists": self.store.exists(str_seriesPushFile),
             },
             "series-pack": {
                 "name": str_seriesPackFile,
-                "exists": os.path.isfile(str_seriesPackFile),
+                "exists": self.store.exists(str_seriesPackFile),
             },
             "series-register": {
                 "name": str_seriesRegisterFile,
-                "exists": os.path.isfile(str_seriesRegisterFile),
+                "exists": self.store.exists(str_seriesRegisterFile),
             },
         }
 
@@ -1219,9 +1469,6 @@ class SMDB:
             """
             (compare this method to the first part of the studyData_process())
 
-            * Check on the housing directory for the JSON image representations and
-              create if necessary;
-
             * Return the series tables (data)
 
             * On return, the self.d_seriesMeta is existant.
@@ -1233,119 +1480,55 @@ class SMDB:
                 SeriesInstanceUID=self.d_DICOM["SeriesInstanceUID"],
                 **kwargs,
             )
-            if not d_seriesTables["seriesBaseDir"]["exists"]:
-                try:
-                    os.makedirs(d_seriesTables["seriesBaseDir"]["name"], exist_ok=True)
-                    d_seriesTables["seriesBaseDir"]["exists"] = os.path.isdir(
-                        d_seriesTables["seriesBaseDir"]["name"]
-                    )
-                except Exception as e:
-                    d_seriesTables["error"] = (
-                        "Some error occured in output dir creation."
-                    )
-                    d_seriesTables["status"] = False
             if d_seriesTables["series-meta"]["exists"]:
-                with open(d_seriesTables["series-meta"]["name"]) as fj:
-                    self.json_read(fj, self.d_seriesMeta)
-                fj.close()
+                self.d_seriesMeta.update(
+                    self.store.read(d_seriesTables["series-meta"]["name"])
+                )
             else:
                 d_seriesTables["status"] = False
             d_seriesTables["outputFile"] = str_outputFile
             return d_seriesTables
 
-        def seriesData_singleImageFile_init(d_seriesTables) -> dict:
-            """
-            Initialize some data within a single JSON image file.
-            """
-            str_seriesInstanceUID: str = self.d_DICOM["SeriesInstanceUID"]
-
-            self.d_seriesImage.clear()
-
-            if d_seriesTables["series-image"]["exists"]:
-                with open(d_seriesTables["series-image"]["name"]) as fj:
-                    self.json_read(fj, self.d_seriesImage)
-                fj.close()
-
-            if str_seriesInstanceUID not in self.d_seriesImage.keys():
-                try:
-                    self.d_seriesImage[str_seriesInstanceUID] = self.d_seriesMeta[
-                        str_seriesInstanceUID
-                    ].copy()
-                    self.d_seriesImage[str_seriesInstanceUID]["outputFile"] = (
-                        d_seriesTables["outputFile"]
-                    )
-                    if "imageObj" not in self.d_seriesImage[str_seriesInstanceUID]:
-                        self.d_seriesImage[str_seriesInstanceUID]["imageObj"] = {}
-                except Exception as e:
-                    print("An error occurred with the seriesMeta data")
-                    print("self.d_seriesMeta = %s" % self.d_seriesMeta)
-
-            return d_seriesTables
-
-        def seriesData_singleImageFile_update(d_seriesTables) -> dict:
+        def seriesData_imageLog_update(d_seriesTables) -> dict:
             """
-            Update data specific to *this* image file, only if this output
-            file is not already present in the JSON dictionary.
+            Append a record of *this* image file to the image log of the
+            series, only if this output file is not already recorded.
 
-            Return False if no updates made, else True
+            The returned 'image' is the record in the structure of a
+            (legacy) per-image JSON table.
             """
             b_updatesMade: bool = False
             b_status: bool = False
+            str_seriesInstanceUID: str = self.d_DICOM["SeriesInstanceUID"]
+            d_images: dict = None
             try:
-                if (
-                    self.d_seriesImage[self.d_DICOM["SeriesInstanceUID"]]["outputFile"]
-                    not in self.d_seriesImage[self.d_DICOM["SeriesInstanceUID"]][
-                        "imageObj"
-                    ].keys()
-                ):
-                    ofs = os.stat("%s/%s" % (str_outputDir, str_outputFile))
-                    self.d_seriesImage[self.d_DICOM["SeriesInstanceUID"]]["imageObj"][
-                        str_outputFile
-                    ] = {
-                        k.replace("st_", ""): (
-                            "%s" % datetime.datetime.fromtimestamp(getattr(ofs, k))
-                            if "time" in k and not "ns" in k
-                            else getattr(ofs, k)
-                        )
-                        for k in dir(ofs)
-                        if "st" in k and not "ns" in k and not "__" in k
-                    }
-                    self.d_seriesImage[self.d_DICOM["SeriesInstanceUID"]]["imageObj"][
-                        str_outputFile
-                    ]["FSlocation"] = "%s/%s" % (str_outputDir, str_outputFile)
+                if not self.series_imageRecorded(str_seriesInstanceUID, str_outputFile):
+                    d_record: dict = image_record(
+                        "%s/%s" % (str_outputDir, str_outputFile)
+                    )
+                    self.store.logAppend(
+                        self.seriesImageLog_name(str_seriesInstanceUID), d_record
+                    )
+                    d_images = {str_outputFile: d_record}
                     b_updatesMade = True
-                else:
-                    self.d_seriesModel = self.d_seriesImage[
-                        self.d_DICOM["SeriesInstanceUID"]
-                    ]
+                self.d_seriesImage = self.series_imageObjGet(
+                    str_seriesInstanceUID, [str_outputFile], d_images
+                )
                 b_status = True
-            except:
-                # pudb.set_trace()
-                b_updatesMade = False
-                b_status = False
+            except Exception as e:
+                d_seriesTables["error"] = "%s" % e
             return {
                 "status": b_status,
                 "updatesMade": b_updatesMade,
                 "image": self.d_seriesImage,
             }
 
-        def seriesData_singleImageFile_save(d_update) -> dict:
-            """
-            Save the updated dictionary.
-            """
-            nonlocal d_seriesTables
-            if d_update["status"]:
-                with open(d_seriesTables["series-image"]["name"], "w") as fj:
-                    self.json_write(d_update["image"], fj)
-                fj.close()
-            return {"status": d_update["status"], "update": d_update}
-
         str_outputDir: str = self.str_outputDir
         str_outputFile: str = self.str_outputFile
         d_seriesMeta: dict = {}
         d_seriesTables: dict = {}
         d_seriesInfo: dict = {}
-        d_ret: dict = {}
+        d_update: dict = {}
 
         for k, v in kwargs.items():
             if k == "outputDir":
@@ -1357,23 +1540,18 @@ class SMDB:
         self.seriesModel_init()
 
         # Write the seriesModel data to the series meta file --
-        # This is a potential bottleneck/collision as mulitple
-        # processes might attempt to write to the same file, so
-        # we place in a while/backoff/timeout
-        d_seriesInfo["status"] = False
-        while not d_seriesInfo["status"]:
-            d_seriesInfo = self.seriesData(
-                "meta", self.d_DICOM["SeriesInstanceUID"], self.d_seriesModel
-            )
-
-        # Now create, for each image file, a series map entry
-        d_ret = seriesData_singleImageFile_save(
-            seriesData_singleImageFile_update(
-                seriesData_singleImageFile_init(seriesTables_get(str_outputFile))
-            )
+        # Mulitple processes might attempt to write to the same file,
+        # the write blocks on the lock of the table until it is free
+        d_seriesInfo = self.seriesData(
+            "meta", self.d_DICOM["SeriesInstanceUID"], self.d_seriesModel
         )
+        if not d_seriesInfo["status"]:
+            return {"status": False, "error": d_seriesInfo["error"], "update": {}}
 
-        return d_ret
+        # Now record each image file in the image log of the series
+        d_update = seriesData_imageLog_update(seriesTables_get(str_outputFile))
+
+        return {"status": d_update["status"], "update": d_update}
 
     def mapsUpdateForFile(self, str_file):
         """
@@ -1387,8 +1565,8 @@ class SMDB:
                 avoid collisions writing to the same file! This is somewhat
                 mitigated by the _process() routines only writing to a file
                 if it does not already exist. Nonetheless, collisions might
-                still occur, and an extra layer in the JSON file writing is
-                used with a @retry decorator and backoff on the write.
+                still occur, and the JSON table writes hold an flock() on
+                the table (see smdblock.py) across each read-modify-write.
 
             *   Due also to the highly parallel nature of storescp handling,
                 maps _might_ not be complete -- particularly on less powerful
@@ -1468,40 +1646,30 @@ class SMDB:
             self.str_patientDataDir,
             astr_PatientID,
         )
-        str_imageFile: str = ""
-        str_imageObj: str = ""
-        str_imageLocation: str = ""
-        str_imageDataDir: str = ""
-        str_imageDir: str = ""
+        d_imageDir: dict = {}
         seriesCount: int = 0
 
-        if os.path.isfile(str_patientDataFile):
-            with open(str_patientDataFile) as fp:
-                self.json_read(fp, d_patientData)
-            fp.close()
+        if self.store.exists(str_patientDataFile):
+            d_patientData.update(self.store.read(str_patientDataFile))
             l_studies = d_patientData[astr_PatientID]["StudyList"]
             for study in l_studies:
                 d_series[study] = [
                     os.path.splitext(f)[0].rsplit("-", 1)[0]
-                    for f in os.listdir("%s/%s-series" % (self.str_studyDataDir, study))
+                    for f in self.store.listdir(
+                        "%s/%s-series" % (self.str_studyDataDir, study)
+                    )
                 ]
                 d_imageDirs[study] = []
                 seriesCount = 0
                 for series in d_series[study]:
                     series = series.rsplit("-", 1)[0]
-                    str_imageDataDir = "%s/%s-img" % (self.str_seriesDataDir, series)
-                    str_imageFile = os.listdir(str_imageDataDir)[0]
-                    if os.path.isfile("%s/%s" % (str_imageDataDir, str_imageFile)):
-                        with open("%s/%s" % (str_imageDataDir, str_imageFile)) as fp:
-                            self.json_read(fp, d_imageInfo)
-                        fp.close()
+                    d_imageDir = self.imageDirs_getOnSeriesInstanceUID(series)
+                    if d_imageDir["status"]:
+                        d_imageInfo = self.series_imageObjGet(
+                            series, [d_imageDir["outputFile"]]
+                        )
                         d_series[study][seriesCount] = d_imageInfo
-                        str_imageObj = os.path.splitext(str_imageFile)[0]
-                        str_imageLocation = d_imageInfo[series]["imageObj"][
-                            str_imageObj
-                        ]["FSlocation"]
-                        str_imageDir = os.path.dirname(str_imageLocation)
-                        d_imageDirs[study].append(str_imageDir)
+                        d_imageDirs[study].append(d_imageDir[series])
                         seriesCount += 1
                 b_status = True
 
@@ -1513,52 +1681,71 @@ class SMDB:
         }
         return d_ret
 
-    def imageDirs_getOnSeriesInstanceUID(self, astr_SeriesInstanceUID) -> dict:
+    def imageDirs_getOnSeriesInstanceUID(
+        self, astr_SeriesInstanceUID, ad_images=None
+    ) -> dict:
         """
-        Return a structure that contains a list of all directories containing
-        DICOM files for a given SeriesInstanceUID
+        Return a structure that contains the directory containing the
+        DICOM files for a given SeriesInstanceUID (and the 'outputFile'
+        of the image it was found from). The already known images of
+        series_imagesGet() can optionally be passed.
         """
         d_ret: dict = {}
         b_status: bool = False
-        d_imageInfo: dict = {}
-        l_filesInDir: list = []
-        str_imageFile: str = ""
-        str_imageObj: str = ""
-        str_imageLocation: str = ""
-        str_imageDataDir: str = ""
+        d_record: dict = {}
+        str_outputFile: str = ""
         str_imageDir: str = ""
-        str_error: str = "Non-existant image JSON directory"
-        str_imageDataDir = "%s/%s-img" % (
-            self.str_seriesDataDir,
-            astr_SeriesInstanceUID,
-        )
-        str_imageDir += str_imageDataDir
-        if os.path.isdir(str_imageDataDir):
-            l_filesInDir = os.listdir(str_imageDataDir)
-            if len(l_filesInDir):
-                str_imageFile = l_filesInDir[0]
-                try:
-                    if os.path.isfile("%s/%s" % (str_imageDataDir, str_imageFile)):
-                        with open("%s/%s" % (str_imageDataDir, str_imageFile)) as fp:
-                            self.json_read(fp, d_imageInfo)
-                        fp.close()
-                        str_imageObj = os.path.splitext(str_imageFile)[0]
-                        str_imageLocation = d_imageInfo[astr_SeriesInstanceUID][
-                            "imageObj"
-                        ][str_imageObj]["FSlocation"]
-                        str_imageDir = os.path.dirname(str_imageLocation)
-                        b_status = True
-                except Exception as e:
-                    str_error = "%s" % e
+        str_error: str = "No images recorded for the series"
+        if ad_images is None:
+            ad_images = self.series_imagesGet(astr_SeriesInstanceUID)
+        if len(ad_images):
+            str_outputFile = next(iter(ad_images))
+            try:
+                d_record = self.image_recordResolve(
+                    astr_SeriesInstanceUID, ad_images[str_outputFile]
+                )
+                if len(d_record["location"]):
+                    str_imageDir = os.path.dirname(d_record["location"])
+                    b_status = True
+                else:
+                    str_error = "No location recorded for %s" % str_outputFile
+            except Exception as e:
+                str_error = "%s" % e
         if b_status:
             str_error = ""
         d_ret = {
             "status": b_status,
             "error": str_error,
+            "outputFile": str_outputFile,
             astr_SeriesInstanceUID: str_imageDir,
         }
         return d_ret
 
+    def mapsUpdateForSeries(self, d_DICOM, l_record) -> dict:
+        """
+        Catalog the images <l_record> (image log records, see
+        image_record()) of one series described by the header <d_DICOM>,
+        with a single update of each of the patient, study and series
+        tables, and a single append to the image log.
+        """
+        str_SeriesInstanceUID: str = d_DICOM["SeriesInstanceUID"]
+        self.DICOMobj_set(d_DICOM)
+        self.str_outputDir = os.path.dirname(l_record[0]["location"])
+        self.str_outputFile = l_record[0]["file"]
+        self.patientData_process()
+        self.studyData_process()
+        self.seriesModel_init()
+        d_seriesInfo: dict = self.seriesData(
+            "meta", str_SeriesInstanceUID, self.d_seriesModel
+        )
+        if not d_seriesInfo["status"]:
+            return {"status": False, "error": d_seriesInfo["error"], "added": 0}
+        d_images: dict = self.series_imagesGet(str_SeriesInstanceUID)
+        l_new: list = [d for d in l_record if d["file"] not in d_images]
+        self.store.logExtend(self.seriesImageLog_name(str_SeriesInstanceUID), l_new)
+        d_images.update({d["file"]: d for d in l_new})
+        return {"status": True, "error": "", "added": len(l_new)}
+
     def mapsUpdateForPatient_do(self, astr_PatientID) -> dict:
         """
         Update all the DB data for a given PatientID.
@@ -1574,28 +1761,81 @@ class SMDB:
         individual image cataloging here and there.
 
         This method redoes the cataloguing for a Patient to refresh
-        all the internal tracking.
+        all the internal tracking. The DICOM headers of all the images
+        are read in parallel (in --jobs processes) and grouped by series,
+        and then each patient, study and series table is written once
+        per series. The seconds spent in each stage are returned in
+        'timings'.
         """
         b_status: bool = False
         d_ret: dict = {}
         d_imageInfo: dict = {}
-        l_studies: list = []
-        l_seriesFiles: list = []
-        str_seriesDir: str = ""
+        d_timings: dict = {}
+        d_header: dict = {}
+        d_seriesRecords: dict = {}
+        d_series: dict = {}
+        l_files: list = []
+        l_error: list = []
+        jobs: int = getattr(self.args, "jobs", 0) or os.cpu_count() or 1
 
+        t_start: float = time.perf_counter()
+        t_stage: float = t_start
         d_imageInfo = self.imageDirs_getOnPatientID(astr_PatientID)
         d_ret["d_imageInfo"] = d_imageInfo
         b_status = d_imageInfo["status"]
-        d_ret["status"] = b_status
         if b_status:
-            l_studies = list(d_imageInfo["d_imageDirs"].keys())
-            for study in l_studies:
+            for study in d_imageInfo["d_imageDirs"]:
                 for str_seriesDir in d_imageInfo["d_imageDirs"][study]:
-                    l_images = [
-                        "%s/%s" % (str_seriesDir, f) for f in os.listdir(str_seriesDir)
-                    ]
-                    for self.args.str_xcrdirfile in l_images:
-                        d_ret[self.args.str_xcrdirfile] = self.mapsUpdateForFile_do()
+                    l_files.extend(
+                        "%s/%s" % (str_seriesDir, f)
+                        for f in sorted(os.listdir(str_seriesDir))
+                    )
+        d_timings["list"] = time.perf_counter() - t_stage
+
+        # Read the headers -- only the first header of each series is
+        # kept, the other images only contribute their image record
+        t_stage = time.perf_counter()
+        if jobs > 1 and len(l_files) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                it_read = executor.map(
+                    image_headerRead,
+                    l_files,
+                    chunksize=max(1, min(64, len(l_files) // (4 * jobs))),
+                )
+                l_read: list = list(it_read)
+        else:
+            l_read = [image_headerRead(str_file) for str_file in l_files]
+        for d_read in l_read:
+            if not d_read["status"]:
+                l_error.append({"file": d_read["file"], "error": d_read["error"]})
+                continue
+            str_SeriesInstanceUID: str = d_read["d_DICOM"].get("SeriesInstanceUID", "")
+            if str_SeriesInstanceUID not in d_header:
+                d_header[str_SeriesInstanceUID] = d_read["d_DICOM"]
+                d_seriesRecords[str_SeriesInstanceUID] = []
+            d_seriesRecords[str_SeriesInstanceUID].append(d_read["record"])
+        d_timings["read"] = time.perf_counter() - t_stage
+
+        t_stage = time.perf_counter()
+        for str_SeriesInstanceUID, l_record in d_seriesRecords.items():
+            d_series[str_SeriesInstanceUID] = self.mapsUpdateForSeries(
+                d_header[str_SeriesInstanceUID], l_record
+            )
+            d_series[str_SeriesInstanceUID]["images"] = len(l_record)
+            b_status = b_status and d_series[str_SeriesInstanceUID]["status"]
+        d_timings["write"] = time.perf_counter() - t_stage
+        d_timings["total"] = time.perf_counter() - t_start
+
+        d_ret.update(
+            {
+                "status": b_status and not len(l_error),
+                "files": len(l_files),
+                "jobs": jobs,
+                "series": d_series,
+                "error": l_error,
+                "timings": d_timings,
+            }
+        )
         return d_ret
 
     def service_keyAccess(self, astr_service) -> dict:
@@ -1697,10 +1937,7 @@ class SMDB:
             if len(self.args.str_actionArgs):
                 try:
                     d_update = json.loads(self.args.str_actionArgs)
-                    d_service.update(d_update)
-                    with open(str_service, "w") as fj:
-                        self.json_write(d_service, fj)
-                    fj.close()
+                    d_service = smdblock.jsonFile_fieldsSet(str_service, d_update)
                     d_ret[astr_service] = d_service
                     d_ret["status"] = True
                 except:
@@ -1713,7 +1950,8 @@ class SMDB:
         # pudb.set_trace()
         if self.fileSpec_process():
             d_DICOMread = repack.Process.DICOMfile_read(
-                file="%s/%s" % (self.args.str_xcrdir, self.args.str_xcrfile)
+                file="%s/%s" % (self.args.str_xcrdir, self.args.str_xcrfile),
+                headerOnly=True,
             )
             if d_DICOMread["status"]:
                 self.DICOMobj_set(d_DICOMread["d_DICOM"]["d_dicomSimple"])
@@ -1746,7 +1984,8 @@ class SMDB:
             nonlocal d_run
             if self.fileSpec_process():
                 d_DICOMread = repack.Process.DICOMfile_read(
-                    file="%s/%s" % (self.args.str_xcrdir, self.args.str_xcrfile)
+                    file="%s/%s" % (self.args.str_xcrdir, self.args.str_xcrfile),
+                    headerOnly=True,
                 )
                 if d_DICOMread["status"]:
                     self.DICOMobj_set(d_DICOMread["d_DICOM"]["d_dicomSimple"])
@@ -1790,6 +2029,8 @@ class SMDB:
             d_run = self.service_keyAccess("CUBE")
         if "PACS" in self.args.str_action:
             d_run = self.service_keyAccess("PACS")
+        if "migrateToSQLite" in self.args.str_action:
+            d_run = smdbstore.JSONtree_migrate(self.args.str_logDir)
 
         if not d_run["status"]:
             d_run["error"] = (
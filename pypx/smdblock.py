@@ -0,0 +1,247 @@
+"""
+Advisory file locks and atomic writes for the smdb JSON "tables".
+
+A table <file>.json is guarded by an flock() on the companion lock file
+<file>.lock, which the holder removes again when it unlocks. Since the
+kernel releases an flock() when its holder exits (or crashes), a lock
+file left behind on disk is harmless -- it never stalls later writers,
+the next one simply takes it over.
+
+Writes go to a temporary file in the same directory that os.replace()
+then swaps in for the table, so that a reader sees either the old or
+the new table, and never a partially written one. The read-modify-write
+helpers
+
+    jsonFile_update(<file>, <function>)
+    jsonFile_fieldsSet(<file>, <d_fields>)
+
+hold the lock across the read and the (atomic) write, so concurrent
+updates of the same table from several processes are never lost.
+
+The time spent waiting for locks is accumulated in process-wide metrics,
+see metrics_get().
+"""
+
+import os
+import json
+import time
+import fcntl
+import tempfile
+import threading
+
+from pathlib import Path
+
+# Seconds to wait for a table lock before giving up
+lockTimeout: float = 30.0
+
+
+class LockTimeout(Exception):
+    """
+    Raised if a lock could not be acquired within the timeout.
+    """
+
+
+class Metrics:
+    """
+    Process-wide counters of the lock acquisitions and the time spent
+    waiting for them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.acquired: int = 0
+        self.contended: int = 0
+        self.timeouts: int = 0
+        self.waitTotal: float = 0.0
+        self.waitMax: float = 0.0
+
+    def record(self, wait: float, b_contended: bool, b_acquired: bool) -> None:
+        with self.lock:
+            if b_acquired:
+                self.acquired += 1
+            else:
+                self.timeouts += 1
+            if b_contended:
+                self.contended += 1
+            self.waitTotal += wait
+            self.waitMax = max(self.waitMax, wait)
+
+    def get(self) -> dict:
+        with self.lock:
+            return {
+                "acquired": self.acquired,
+                "contended": self.contended,
+                "timeouts": self.timeouts,
+                "waitTotal": self.waitTotal,
+                "waitMax": self.waitMax,
+                "waitMean": self.waitTotal / max(self.acquired + self.timeouts, 1),
+            }
+
+
+metrics: Metrics = Metrics()
+
+
+def metrics_get() -> dict:
+    """
+    Return the lock metrics of this process:
+
+        {
+            'acquired':     <locks acquired>,
+            'contended':    <acquisitions that had to wait>,
+            'timeouts':     <acquisitions that timed out>,
+            'waitTotal':    <seconds spent waiting>,
+            'waitMax':      <longest wait in seconds>,
+            'waitMean':     <mean wait in seconds>
+        }
+    """
+    return metrics.get()
+
+
+def metrics_reset() -> None:
+    metrics.reset()
+
+
+class FileLock:
+    """
+    A context manager that holds an exclusive flock() on the lock file
+    of the table <str_file>:
+
+        with FileLock(str_file):
+            ...
+
+    The acquire blocks for at most <timeout> seconds (the module
+    lockTimeout if None, forever if negative) and raises a LockTimeout
+    if the lock could not be had. Each lock opens its own file
+    description, so a FileLock also excludes the other threads of the
+    same process.
+    """
+
+    def __init__(self, str_file: str, timeout: float = None):
+        self.str_lockFile: str = str(Path(str_file).with_suffix(".lock"))
+        self.timeout: float = lockTimeout if timeout is None else timeout
+        self.fd: int = -1
+
+    def locked(self, fd: int) -> bool:
+        """
+        Try to flock() the open lock file <fd>. The lock only counts if
+        <fd> is still the lock file on disk, i.e. the previous holder
+        did not remove it in the meantime.
+        """
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            st = os.stat(self.str_lockFile)
+        except FileNotFoundError:
+            return False
+        fst = os.fstat(fd)
+        return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+    def acquire(self) -> None:
+        t_start: float = time.monotonic()
+        b_contended: bool = False
+        delay: float = 0.001
+        while True:
+            fd: int = os.open(self.str_lockFile, os.O_RDWR | os.O_CREAT, 0o644)
+            if self.locked(fd):
+                break
+            os.close(fd)
+            b_contended = True
+            wait: float = time.monotonic() - t_start
+            if 0 <= self.timeout <= wait:
+                metrics.record(wait, b_contended, False)
+                raise LockTimeout(
+                    "Could not lock %s within %ss" % (self.str_lockFile, self.timeout)
+                )
+            if self.timeout >= 0:
+                delay = min(delay, self.timeout - wait)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        metrics.record(time.monotonic() - t_start, b_contended, True)
+        self.fd = fd
+
+    def release(self) -> None:
+        """
+        Remove the lock file (while still holding it) and unlock.
+        """
+        if self.fd >= 0:
+            try:
+                os.unlink(self.str_lockFile)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def file_writeAtomic(str_file: str, d_obj: dict) -> None:
+    """
+    Write <d_obj> as JSON to a temporary file next to <str_file> and
+    atomically replace <str_file> with it. The file keeps its mode.
+    """
+    try:
+        mode: int = os.stat(str_file).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o644
+    fd, str_tmp = tempfile.mkstemp(
+        dir=os.path.dirname(str_file) or ".",
+        prefix=".%s." % os.path.basename(str_file),
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "w") as fj:
+            json.dump(d_obj, fj, indent=4)
+        os.chmod(str_tmp, mode)
+        os.replace(str_tmp, str_file)
+    except:
+        if os.path.exists(str_tmp):
+            os.remove(str_tmp)
+        raise
+
+
+def jsonFile_read(str_file: str) -> dict:
+    """
+    Return the contents of the JSON <str_file>, or an empty dictionary
+    if the file does not exist or cannot be parsed.
+    """
+    try:
+        with open(str_file) as fj:
+            return json.load(fj)
+    except:
+        return {}
+
+
+def jsonFile_update(str_file: str, f_update, timeout: float = None) -> dict:
+    """
+    Under the lock of <str_file>, read its contents, pass them to
+    f_update() and atomically write the (dictionary) result back.
+    The written contents are returned.
+    """
+    with FileLock(str_file, timeout):
+        d_obj: dict = f_update(jsonFile_read(str_file))
+        file_writeAtomic(str_file, d_obj)
+    return d_obj
+
+
+def jsonFile_fieldsSet(str_file: str, d_fields: dict, timeout: float = None) -> dict:
+    """
+    Under the lock of <str_file>, set all the <d_fields> in it.
+    The written contents are returned.
+    """
+
+    def fields_set(d_obj: dict) -> dict:
+        d_obj.update(d_fields)
+        return d_obj
+
+    return jsonFile_update(str_file, fields_set, timeout)
@@ -0,0 +1,686 @@
+"""
+Storage backends for the smdb "tables".
+
+The smdb addresses each of its tables by a file name below its log
+directory, i.e.
+
+    <logDir>/patientData/<PatientID>.json
+    <logDir>/studyData/<StudyInstanceUID>-meta.json
+    <logDir>/studyData/<StudyInstanceUID>-series/<SeriesInstanceUID>-meta.json
+    <logDir>/seriesData/<SeriesInstanceUID>-<table>.json
+    <logDir>/seriesData/<SeriesInstanceUID>-images.log
+
+and a backend simply provides the read/write/list operations on these
+names, as well as append/read operations on the image "logs" of the
+series. (Older trees have a <logDir>/seriesData/<SeriesInstanceUID>-img/
+directory with a <imageFile>.json table per image instead of the log.)
+Next to a log, the JSON backend keeps a <SeriesInstanceUID>-images.count
+file that grows by a byte per record, so that the images of a series are
+counted without a read of its log. The count of a log of an older tree
+is created (from the log) on the next append to it; until then the log
+is read to count it. A log that is edited by hand needs its count
+removed.
+Two backends exist:
+
+    * JSONstore:    the names are real JSON files on the filesystem (the
+                    legacy layout);
+
+    * SQLitestore:  the names are mapped onto indexed patient, study,
+                    studySeries, series, and image tables in a single
+                    SQLite database (in WAL mode) in the log directory.
+
+Since SQLite serializes writers and offers transactions, multiple
+concurrent repack processes no longer collide on the same table, and
+counting the images of a series is a single indexed SELECT.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import tempfile
+import contextlib
+
+from pypx import smdblock
+
+
+class JSONstore:
+    """
+    The legacy backend -- each table is a JSON file on the filesystem.
+    """
+
+    def __init__(self, str_logDir: str):
+        self.__name__: str = "JSONstore"
+        self.str_logDir: str = str_logDir
+
+    def exists(self, str_file: str) -> bool:
+        return os.path.isfile(str_file)
+
+    def isdir(self, str_dir: str) -> bool:
+        return os.path.isdir(str_dir)
+
+    def makedirs(self, str_dir: str) -> None:
+        os.makedirs(str_dir, exist_ok=True)
+
+    def read(self, str_file: str) -> dict:
+        """
+        Return the contents of <str_file>, or an empty dictionary if
+        the file does not exist or cannot be parsed.
+        """
+        return smdblock.jsonFile_read(str_file)
+
+    def write(self, str_file: str, d_obj: dict) -> None:
+        """
+        Atomically replace the table <str_file> with <d_obj>, under
+        the lock of the table.
+        """
+        with smdblock.FileLock(str_file):
+            smdblock.file_writeAtomic(str_file, d_obj)
+
+    def fieldSet(self, str_file: str, str_field: str, value) -> dict:
+        """
+        Set a single <str_field> in the table <str_file> to <value>.
+        """
+        return self.fieldsSet(str_file, {str_field: value})
+
+    def fieldsSet(self, str_file: str, d_fields: dict) -> dict:
+        """
+        Set all the <d_fields> in the table <str_file> in one write.
+
+        The read-modify-write holds the (flock) lock of the table, and
+        blocks until any other writer is done -- up to the lock
+        timeout, after which the returned 'status' is False.
+        """
+        try:
+            smdblock.jsonFile_fieldsSet(str_file, d_fields)
+        except Exception as e:
+            return {"status": False, "error": "%s" % e}
+        return {"status": True, "error": ""}
+
+    def update(self, str_file: str, f_update) -> dict:
+        """
+        Read the table <str_file>, pass it to f_update() and write the
+        result back, all under the lock of the table. The written table
+        is returned.
+        """
+        return smdblock.jsonFile_update(str_file, f_update)
+
+    def listdir(self, str_dir: str) -> list:
+        if not os.path.isdir(str_dir):
+            return []
+        return os.listdir(str_dir)
+
+    def count(self, str_dir: str) -> int:
+        if not os.path.isdir(str_dir):
+            return 0
+        return len(
+            [f for f in os.listdir(str_dir) if os.path.isfile(os.path.join(str_dir, f))]
+        )
+
+    def logAppend(self, str_file: str, d_record: dict) -> None:
+        """
+        Append the <d_record> as a JSON line to the log <str_file>.
+
+        The line is written in a single write() to a file opened with
+        O_APPEND, so that the records of concurrent appenders do not
+        interleave -- without the need for a lock file.
+        """
+        self.logExtend(str_file, [d_record])
+
+    def logExtend(self, str_file: str, l_records: list) -> None:
+        """
+        Append all the <l_records> to the log <str_file> in a single
+        write().
+        """
+        if not len(l_records):
+            return
+        # The count of a log is a byte per record, appended (before the
+        # records) in the same way
+        str_count: str = self.logCount_name(str_file)
+        if not os.path.exists(str_count):
+            self.logCount_create(str_file)
+        self.bytes_append(str_count, b"." * len(l_records))
+        self.bytes_append(
+            str_file,
+            "".join(
+                json.dumps(d, separators=(",", ":")) + "\n" for d in l_records
+            ).encode(),
+        )
+
+    def bytes_append(self, str_file: str, data: bytes) -> None:
+        """
+        Append the <data> to <str_file> in a single O_APPEND write().
+        """
+        fd: int = os.open(str_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def logCount_name(self, str_file: str) -> str:
+        return "%s.count" % os.path.splitext(str_file)[0]
+
+    def logCount_create(self, str_file: str) -> None:
+        """
+        Create the count of the log <str_file>, for the records the log
+        (of an older tree) already has. The count is created under a lock
+        and swapped in whole, so that of concurrent appenders only one
+        creates it. The others find it in place once they have the lock,
+        and since each appends to the count before it appends to the log,
+        no record is appended to the log while it is counted here.
+        """
+        str_count: str = self.logCount_name(str_file)
+        with smdblock.FileLock(str_count):
+            if os.path.exists(str_count):
+                return
+            try:
+                with open(str_file, "rb") as fp:
+                    records: int = fp.read().count(b"\n")
+            except FileNotFoundError:
+                records = 0
+            fd, str_tmp = tempfile.mkstemp(
+                dir=os.path.dirname(str_count) or ".",
+                prefix=".%s." % os.path.basename(str_count),
+                suffix=".tmp",
+            )
+            try:
+                with os.fdopen(fd, "wb") as fp:
+                    fp.write(b"." * records)
+                os.chmod(str_tmp, 0o644)
+                os.replace(str_tmp, str_count)
+            except:
+                if os.path.exists(str_tmp):
+                    os.remove(str_tmp)
+                raise
+
+    def logCount(self, str_file: str) -> int:
+        """
+        Return the number of records of the log <str_file> -- the size
+        of its count -- or -1 for a log (of an older tree) without one.
+        """
+        try:
+            return os.stat(self.logCount_name(str_file)).st_size
+        except FileNotFoundError:
+            return -1 if os.path.exists(str_file) else 0
+
+    def logContains(self, str_file: str, str_key: str) -> bool:
+        """
+        Check if the log <str_file> holds a record with the 'file'
+        <str_key>, by a search of the raw log (without parsing it).
+        """
+        try:
+            with open(str_file, "rb") as fp:
+                data: bytes = fp.read()
+        except FileNotFoundError:
+            return False
+        return b'"file":%s' % json.dumps(str_key).encode() in data
+
+    def logRead(self, str_file: str, offset: int = 0) -> dict:
+        """
+        Return the records of the log <str_file> from the <offset> on,
+        and the offset to read any later records from. A last line that
+        is still being written is left for the next read.
+        """
+        l_records: list = []
+        try:
+            with open(str_file, "rb") as fp:
+                fp.seek(offset)
+                data: bytes = fp.read()
+        except FileNotFoundError:
+            return {"records": l_records, "offset": offset}
+        end: int = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                l_records.append(json.loads(line))
+            except:
+                pass
+        return {"records": l_records, "offset": offset + end}
+
+    def legacyImagesList(self, str_dir: str) -> list:
+        """
+        Return the per-image JSON tables of an older tree in the
+        image dir <str_dir> of a series.
+        """
+        return self.listdir(str_dir)
+
+    def transaction(self):
+        return contextlib.nullcontext()
+
+
+class SQLitestore:
+    """
+    A SQLite backend -- table names are parsed into the keys of a set
+    of indexed tables in <logDir>/smdb.sqlite.
+    """
+
+    str_dbFileName: str = "smdb.sqlite"
+
+    str_schema: str = """
+        CREATE TABLE IF NOT EXISTS patient (
+            PatientID           TEXT PRIMARY KEY,
+            data                TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS study (
+            StudyInstanceUID    TEXT PRIMARY KEY,
+            PatientID           TEXT,
+            data                TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS study_PatientID ON study (PatientID);
+        CREATE TABLE IF NOT EXISTS studySeries (
+            StudyInstanceUID    TEXT NOT NULL,
+            SeriesInstanceUID   TEXT NOT NULL,
+            data                TEXT NOT NULL,
+            PRIMARY KEY (StudyInstanceUID, SeriesInstanceUID)
+        );
+        CREATE INDEX IF NOT EXISTS studySeries_SeriesInstanceUID
+            ON studySeries (SeriesInstanceUID);
+        CREATE TABLE IF NOT EXISTS series (
+            SeriesInstanceUID   TEXT NOT NULL,
+            tableName           TEXT NOT NULL,
+            data                TEXT NOT NULL,
+            PRIMARY KEY (SeriesInstanceUID, tableName)
+        );
+        CREATE TABLE IF NOT EXISTS image (
+            SeriesInstanceUID   TEXT NOT NULL,
+            outputFile          TEXT NOT NULL,
+            data                TEXT NOT NULL,
+            PRIMARY KEY (SeriesInstanceUID, outputFile)
+        );
+    """
+
+    # Map the table file names (relative to the log dir) to a table
+    # and its key columns
+    l_fileMap: list = [
+        (re.compile(r"^patientData/(?P<PatientID>[^/]+)\.json$"), "patient"),
+        (re.compile(r"^studyData/(?P<StudyInstanceUID>[^/]+)-meta\.json$"), "study"),
+        (
+            re.compile(
+                r"^studyData/(?P<StudyInstanceUID>[^/]+)-series/"
+                r"(?P<SeriesInstanceUID>[^/]+)-meta\.json$"
+            ),
+            "studySeries",
+        ),
+        (
+            re.compile(
+                r"^seriesData/(?P<SeriesInstanceUID>[^/]+)-img/"
+                r"(?P<outputFile>[^/]+)\.json$"
+            ),
+            "image",
+        ),
+        (
+            re.compile(
+                r"^seriesData/(?P<SeriesInstanceUID>[^/]+)-"
+                r"(?P<tableName>meta|retrieve|pack|push|register)\.json$"
+            ),
+            "series",
+        ),
+    ]
+
+    # ... and the "directory" names to the table that holds their entries
+    l_dirMap: list = [
+        (
+            re.compile(r"^studyData/(?P<StudyInstanceUID>[^/]+)-series/?$"),
+            "studySeries",
+            "SeriesInstanceUID",
+            "%s-meta.json",
+        ),
+        (
+            re.compile(r"^seriesData/(?P<SeriesInstanceUID>[^/]+)-img/?$"),
+            "image",
+            "outputFile",
+            "%s.json",
+        ),
+    ]
+
+    # The image "log" of a series is the rows of the series in the image
+    # table
+    re_imageLog = re.compile(r"^seriesData/(?P<SeriesInstanceUID>[^/]+)-images\.log$")
+
+    def __init__(self, str_logDir: str, str_dbFile: str = ""):
+        self.__name__: str = "SQLitestore"
+        self.str_logDir: str = str_logDir
+        self.str_dbFile: str = str_dbFile or os.path.join(
+            str_logDir, self.str_dbFileName
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(self.str_dbFile)), exist_ok=True)
+        self.db = sqlite3.connect(self.str_dbFile, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.str_schema)
+        self.transactionDepth: int = 0
+
+    def path_relative(self, str_path: str) -> str:
+        if not str_path:
+            return ""
+        return os.path.relpath(str_path, self.str_logDir).replace(os.sep, "/")
+
+    def file_parse(self, str_file: str):
+        """
+        Return the (table, {keyColumn: value}) for a table file name, or
+        (None, {}) if the name is not one of the smdb tables.
+        """
+        str_rel: str = self.path_relative(str_file)
+        for pattern, str_table in self.l_fileMap:
+            match = pattern.match(str_rel)
+            if match:
+                return str_table, match.groupdict()
+        return None, {}
+
+    def dir_parse(self, str_dir: str):
+        """
+        Return the (table, {keyColumn: value}, entryColumn, entryFormat)
+        for a table directory name, or (None, {}, "", "").
+        """
+        str_rel: str = self.path_relative(str_dir)
+        for pattern, str_table, str_column, str_format in self.l_dirMap:
+            match = pattern.match(str_rel)
+            if match:
+                return str_table, match.groupdict(), str_column, str_format
+        return None, {}, "", ""
+
+    def where(self, d_keys: dict) -> str:
+        return " AND ".join(["%s = ?" % k for k in d_keys.keys()])
+
+    def exists(self, str_file: str) -> bool:
+        str_table, d_keys = self.file_parse(str_file)
+        if not str_table:
+            return False
+        return (
+            self.db.execute(
+                "SELECT 1 FROM %s WHERE %s" % (str_table, self.where(d_keys)),
+                tuple(d_keys.values()),
+            ).fetchone()
+            is not None
+        )
+
+    def isdir(self, str_dir: str) -> bool:
+        return self.count(str_dir) > 0
+
+    def makedirs(self, str_dir: str) -> None:
+        pass
+
+    def read(self, str_file: str) -> dict:
+        str_table, d_keys = self.file_parse(str_file)
+        if not str_table:
+            return {}
+        row = self.db.execute(
+            "SELECT data FROM %s WHERE %s" % (str_table, self.where(d_keys)),
+            tuple(d_keys.values()),
+        ).fetchone()
+        if row is None:
+            return {}
+        return json.loads(row[0])
+
+    def write(self, str_file: str, d_obj: dict) -> None:
+        str_table, d_keys = self.file_parse(str_file)
+        if not str_table:
+            raise ValueError("'%s' is not an smdb table" % str_file)
+        d_columns: dict = dict(d_keys)
+        if str_table == "study":
+            for d_study in d_obj.values():
+                if isinstance(d_study, dict) and "PatientID" in d_study:
+                    d_columns["PatientID"] = d_study["PatientID"]
+        d_columns["data"] = json.dumps(d_obj)
+        self.db.execute(
+            "INSERT OR REPLACE INTO %s (%s) VALUES (%s)"
+            % (
+                str_table,
+                ", ".join(d_columns.keys()),
+                ", ".join(["?"] * len(d_columns)),
+            ),
+            tuple(d_columns.values()),
+        )
+
+    def fieldSet(self, str_file: str, str_field: str, value) -> dict:
+        """
+        Set a single <str_field> in the table <str_file> to <value> in
+        one atomic read-modify-write.
+        """
+        return self.fieldsSet(str_file, {str_field: value})
+
+    def fieldsSet(self, str_file: str, d_fields: dict) -> dict:
+        """
+        Set all the <d_fields> in the table <str_file> in one atomic
+        read-modify-write.
+        """
+        with self.transaction():
+            d_obj: dict = self.read(str_file)
+            d_obj.update(d_fields)
+            self.write(str_file, d_obj)
+        return {"status": True, "error": ""}
+
+    def update(self, str_file: str, f_update) -> dict:
+        """
+        Read the table <str_file>, pass it to f_update() and write the
+        result back, all in one transaction. The written table is
+        returned.
+        """
+        with self.transaction():
+            d_obj: dict = f_update(self.read(str_file))
+            self.write(str_file, d_obj)
+        return d_obj
+
+    def listdir(self, str_dir: str) -> list:
+        str_table, d_keys, str_column, str_format = self.dir_parse(str_dir)
+        if not str_table:
+            return []
+        return [
+            str_format % row[0]
+            for row in self.db.execute(
+                "SELECT %s FROM %s WHERE %s ORDER BY rowid"
+                % (str_column, str_table, self.where(d_keys)),
+                tuple(d_keys.values()),
+            )
+        ]
+
+    def count(self, str_dir: str) -> int:
+        str_table, d_keys, str_column, str_format = self.dir_parse(str_dir)
+        if not str_table:
+            return 0
+        return self.db.execute(
+            "SELECT COUNT(*) FROM %s WHERE %s" % (str_table, self.where(d_keys)),
+            tuple(d_keys.values()),
+        ).fetchone()[0]
+
+    def imageLog_parse(self, str_file: str) -> str:
+        """
+        Return the SeriesInstanceUID of the image log <str_file>.
+        """
+        match = self.re_imageLog.match(self.path_relative(str_file))
+        if not match:
+            raise ValueError("'%s' is not an smdb image log" % str_file)
+        return match.group("SeriesInstanceUID")
+
+    def logAppend(self, str_file: str, d_record: dict) -> None:
+        """
+        Add the <d_record> (keyed on its 'file') to the image log of
+        a series.
+        """
+        self.logExtend(str_file, [d_record])
+
+    def logExtend(self, str_file: str, l_records: list) -> None:
+        """
+        Add all the <l_records> to the image log of a series in one
+        transaction.
+        """
+        str_SeriesInstanceUID: str = self.imageLog_parse(str_file)
+        with self.transaction():
+            self.db.executemany(
+                "INSERT OR REPLACE INTO image (SeriesInstanceUID, outputFile, data)"
+                " VALUES (?, ?, ?)",
+                [(str_SeriesInstanceUID, d["file"], json.dumps(d)) for d in l_records],
+            )
+
+    def logRead(self, str_file: str, offset: int = 0) -> dict:
+        """
+        Return the image records of a series added after the (rowid)
+        <offset>, and the offset to read any later records from. The
+        'file' of a record is its outputFile (rows imported from an
+        older tree hold the per-image JSON table as data).
+        """
+        l_records: list = []
+        for rowid, str_outputFile, str_data in self.db.execute(
+            "SELECT rowid, outputFile, data FROM image"
+            " WHERE SeriesInstanceUID = ? AND rowid > ? ORDER BY rowid",
+            (self.imageLog_parse(str_file), offset),
+        ):
+            l_records.append(dict(json.loads(str_data), file=str_outputFile))
+            offset = rowid
+        return {"records": l_records, "offset": offset}
+
+    def logCount_create(self, str_file: str) -> None:
+        """
+        Create the count of the log <str_file>, for the records the log
+        (of an older tree) already has. The count is created under a lock
+        and swapped in whole, so that of concurrent appenders only one
+        creates it. The others find it in place once they have the lock,
+        and since each appends to the count before it appends to the log,
+        no record is appended to the log while it is counted here.
+        """
+        str_count: str = self.logCount_name(str_file)
+        with smdblock.FileLock(str_count):
+            if os.path.exists(str_count):
+                return
+            try:
+                with open(str_file, "rb") as fp:
+                    records: int = fp.read().count(b"\n")
+            except FileNotFoundError:
+                records = 0
+            fd, str_tmp = tempfile.mkstemp(
+                dir=os.path.dirname(str_count) or ".",
+                prefix=".%s." % os.path.basename(str_count),
+                suffix=".tmp",
+            )
+            try:
+                with os.fdopen(fd, "wb") as fp:
+                    fp.write(b"." * records)
+                os.chmod(str_tmp, 0o644)
+                os.replace(str_tmp, str_count)
+            except:
+                if os.path.exists(str_tmp):
+                    os.remove(str_tmp)
+                raise
+
+    def logCount(self, str_file: str) -> int:
+        """
+        Return the number of images in the image log of a series.
+        """
+        return self.db.execute(
+            "SELECT COUNT(*) FROM image WHERE SeriesInstanceUID = ?",
+            (self.imageLog_parse(str_file),),
+        ).fetchone()[0]
+
+    def logContains(self, str_file: str, str_key: str) -> bool:
+        """
+        Check if the image log of a series holds the outputFile <str_key>.
+        """
+        return (
+            self.db.execute(
+                "SELECT 1 FROM image WHERE SeriesInstanceUID = ? AND outputFile = ?",
+                (self.imageLog_parse(str_file), str_key),
+            ).fetchone()
+            is not None
+        )
+
+    def legacyImagesList(self, str_dir: str) -> list:
+        """
+        The image table rows are all returned by logRead().
+        """
+        return []
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        A (reentrant) write transaction. BEGIN IMMEDIATE takes the
+        write lock up front so that concurrent read-modify-writes
+        from other processes are serialized.
+        """
+        if self.transactionDepth:
+            self.transactionDepth += 1
+            try:
+                yield self
+            finally:
+                self.transactionDepth -= 1
+            return
+        self.db.execute("BEGIN IMMEDIATE")
+        self.transactionDepth = 1
+        try:
+            yield self
+        except:
+            self.transactionDepth = 0
+            self.db.execute("ROLLBACK")
+            raise
+        self.transactionDepth = 0
+        self.db.execute("COMMIT")
+
+
+def store_create(args, str_logDir: str):
+    """
+    Return the storage backend for <str_logDir>. The backend is chosen
+    by <args.str_dbType> ('json' or 'sqlite'); if not specified, then
+    'sqlite' is used if a database already exists in the <str_logDir>,
+    else 'json'.
+    """
+    str_dbType: str = getattr(args, "str_dbType", "") or ""
+    if not str_dbType:
+        str_dbType = (
+            "sqlite"
+            if os.path.isfile(os.path.join(str_logDir, SQLitestore.str_dbFileName))
+            else "json"
+        )
+    if str_dbType.lower() == "sqlite":
+        return SQLitestore(str_logDir)
+    return JSONstore(str_logDir)
+
+
+def JSONtree_migrate(str_logDir: str, str_dbFile: str = "") -> dict:
+    """
+    Import an existing JSON smdb tree in <str_logDir> into a SQLite
+    database (by default <str_logDir>/smdb.sqlite). Existing entries
+    in the database are replaced by those read from the tree.
+
+    The JSON tree itself is not touched.
+    """
+    store: SQLitestore = SQLitestore(str_logDir, str_dbFile)
+    source: JSONstore = JSONstore(str_logDir)
+    d_count: dict = {
+        "patient": 0,
+        "study": 0,
+        "studySeries": 0,
+        "series": 0,
+        "image": 0,
+    }
+    l_skipped: list = []
+    l_error: list = []
+
+    with store.transaction():
+        for str_tree in ["patientData", "studyData", "seriesData"]:
+            for str_root, l_dirs, l_files in os.walk(
+                os.path.join(str_logDir, str_tree)
+            ):
+                for str_file in sorted(l_files):
+                    str_path: str = os.path.join(str_root, str_file)
+                    if str_file.endswith("-images.log"):
+                        for d_record in source.logRead(str_path)["records"]:
+                            store.logAppend(str_path, d_record)
+                            d_count["image"] += 1
+                        continue
+                    str_table, d_keys = store.file_parse(str_path)
+                    if not str_table:
+                        if not str_file.endswith((".lock", ".count")):
+                            l_skipped.append(str_path)
+                        continue
+                    d_obj: dict = source.read(str_path)
+                    if not d_obj:
+                        l_error.append(str_path)
+                        continue
+                    store.write(str_path, d_obj)
+                    d_count[str_table] += 1
+
+    return {
+        "status": not len(l_error),
+        "dbFile": store.str_dbFile,
+        "imported": d_count,
+        "skipped": l_skipped,
+        "error": l_error,
+    }
@@ -1,6 +1,5 @@
 # Global modules
 import subprocess
-import pudb
 import json
 import pfmisc
 from pfmisc._colors import Colors
@@ -22,6 +21,12 @@ class Status(Base):
 
     Unlike the other pypx classes, status events are fully serviced by
     the smdb module.
+
+    If no SeriesInstanceUID is given, the status of all the series of
+    the study is returned. In either case the smdb tables of the study
+    and its series are read only once, into an in-memory index (see
+    smdb.study_seriesIndexGet()) from which the status of each series
+    is then answered.
     """
 
     def __init__(self, arg):
@@ -59,26 +64,61 @@ class Status(Base):
         }
         return d_status
 
-    def run(self, opt={}) -> dict:
-        # pudb.set_trace()
+    def index_get(self, str_StudyInstanceUID, l_SeriesInstanceUID=None) -> dict:
+        """
+        Return the status index of a study and (by default all) its series.
+        """
+        return self.db.study_seriesIndexGet(str_StudyInstanceUID, l_SeriesInstanceUID)
+
+    def series_statusGet(
+        self, d_index, str_StudyInstanceUID, str_SeriesInstanceUID, b_verify
+    ) -> dict:
+        """
+        Return the status of a single series as answered from the
+        study <d_index>.
+        """
         d_status: dict = self.status_init()
         d_status.update(
             self.db.study_seriesContainsVerify(
-                opt["StudyInstanceUID"],
-                opt["SeriesInstanceUID"],
-                opt["verifySeriesInStudy"],
+                str_StudyInstanceUID, str_SeriesInstanceUID, b_verify, d_index
             )
         )
         d_status["state"]["study"] = d_status["study"]["state"]
-        if opt["verifySeriesInStudy"]:
+        if b_verify:
             if "seriesListInStudy" in d_status["study"].keys():
                 if not d_status["study"]["seriesListInStudy"]["status"]:
                     d_status["state"]["series"] = "SeriesNotInStudy"
                     return d_status
         if d_status["status"]:
-            d_status["images"] = self.db.series_receivedAndRequested(
-                opt["SeriesInstanceUID"]
-            )
+            if str_SeriesInstanceUID in d_index["series"]:
+                d_status["images"] = d_index["series"][str_SeriesInstanceUID]["images"]
+            else:
+                d_status["images"] = self.db.series_receivedAndRequested(
+                    str_SeriesInstanceUID
+                )
             d_status["state"]["series"] = d_status["series"]["state"]
             d_status["state"]["images"] = d_status["images"]["state"]
         return d_status
+
+    def run(self, opt={}) -> dict:
+        # pudb.set_trace()
+        str_StudyInstanceUID: str = opt["StudyInstanceUID"]
+        str_SeriesInstanceUID: str = opt["SeriesInstanceUID"]
+        if len(str_SeriesInstanceUID):
+            return self.series_statusGet(
+                self.index_get(str_StudyInstanceUID, [str_SeriesInstanceUID]),
+                str_StudyInstanceUID,
+                str_SeriesInstanceUID,
+                opt["verifySeriesInStudy"],
+            )
+        d_index: dict = self.index_get(str_StudyInstanceUID)
+        d_status: dict = {
+            "status": d_index["study"]["status"],
+            "study": d_index["study"],
+            "series": {},
+        }
+        for str_uid in d_index["series"]:
+            d_status["series"][str_uid] = self.series_statusGet(
+                d_index, str_StudyInstanceUID, str_uid, opt["verifySeriesInStudy"]
+            )
+        return d_status
@@ -0,0 +1,108 @@
+"""
+The line delimited JSON (NDJSON) stream of a px-find query result, as
+written by `px-find --stream` and read by px-do and px-report:
+
+    {"pypxStream": "header", "status": ..., "command": ..., "args": {...}}
+    {"pypxStream": "study", "study": {... "series": [...]}}
+    ...
+    {"pypxStream": "end", "status": ..., "studies": <N>}
+
+The header carries the fields of the JSON report except its "data",
+and each study line one entry of that "data" -- emitted as soon as the
+SERIES query of the study completes, so that a downstream process can
+start on the first studies while the later ones are still queried.
+A query that fails at the STUDY level is a header and an end line (that
+then also carries the "command") without any studies.
+Note the studies arrive in the order their queries complete, which is
+not necessarily the order of the STUDY query.
+"""
+
+import sys
+import json
+import asyncio
+
+# The key that marks a line of the stream
+str_key: str = "pypxStream"
+
+
+def line_write(str_type: str, d_fields: dict, fp=None) -> None:
+    """
+    Write (and flush) a single line of the <str_type> with <d_fields>.
+    """
+    fp = fp or sys.stdout
+    fp.write(json.dumps({str_key: str_type, **d_fields}) + "\n")
+    fp.flush()
+
+
+def reportData_read(fp) -> tuple:
+    """
+    Read the start of a report from <fp>, which is either a stream or a
+    (possibly pretty printed) JSON report, and return the tuple
+
+        (<d_reportData>, <b_stream>)
+
+    For a stream, the <d_reportData> is the header with an empty "data"
+    list, and the studies are to be read from <fp> with studies_read()
+    or studies_readAsync(). Otherwise it is the complete report. An
+    empty input (e.g. of an upstream process that failed) is an error
+    report without any data.
+    """
+    str_first: str = fp.readline()
+    if not str_first.strip():
+        str_first += fp.read()
+        if not str_first.strip():
+            return {
+                "status": "error",
+                "error": "no report data on input",
+                "command": "",
+                "data": [],
+            }, False
+    try:
+        d_header: dict = json.loads(str_first)
+    except json.JSONDecodeError:
+        d_header = {}
+    if isinstance(d_header, dict) and d_header.get(str_key) == "header":
+        del d_header[str_key]
+        d_header["data"] = []
+        return d_header, True
+    return json.loads(str_first + fp.read()), False
+
+
+def line_interpret(str_line: str, d_reportData: dict) -> dict:
+    """
+    Return the study of a study line, or None. The "end" line updates
+    the status of the <d_reportData>.
+    """
+    if not str_line.strip():
+        return None
+    d_line: dict = json.loads(str_line)
+    if d_line.get(str_key) == "study":
+        return d_line["study"]
+    if d_line.get(str_key) == "end":
+        d_reportData["status"] = d_line["status"]
+        if "command" in d_line:
+            d_reportData["command"] = d_line["command"]
+    return None
+
+
+def studies_read(fp, d_reportData: dict):
+    """
+    Yield the studies of the stream <fp> as they are read.
+    """
+    for str_line in fp:
+        study: dict = line_interpret(str_line, d_reportData)
+        if study is not None:
+            yield study
+
+
+async def studies_readAsync(fp, d_reportData: dict):
+    """
+    Yield the studies of the stream <fp> as they are read. The (blocking)
+    reads are done in a worker thread, so that the event loop is free to
+    run what was scheduled for the previous studies in the meantime.
+    """
+    loop = asyncio.get_running_loop()
+    while str_line := await loop.run_in_executor(None, fp.readline):
+        study: dict = line_interpret(str_line, d_reportData)
+        if study is not None:
+            yield study
@@ -0,0 +1,155 @@
+import asyncio
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+from pypx.do import Do, RetrieveScheduler
+from pypx.report import Report
+
+
+class TestRetrieveScheduler(TestCase):
+    def series_run(self, scheduler, l_images, f_pending=None):
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.l_started = []
+
+        def move_create(str_seriesUID):
+            def move_do():
+                with self.lock:
+                    self.inFlight += 1
+                    self.maxInFlight = max(self.maxInFlight, self.inFlight)
+                    self.l_started.append(str_seriesUID)
+                time.sleep(0.02)
+                with self.lock:
+                    self.inFlight -= 1
+                return {"status": "success", "series": str_seriesUID}
+
+            return move_do
+
+        async def run():
+            return await asyncio.gather(
+                *[
+                    scheduler.series_retrieve(
+                        "1.%d" % i, images, move_create("1.%d" % i)
+                    )
+                    for i, images in enumerate(l_images)
+                ]
+            )
+
+        return asyncio.run(run())
+
+    def test_series_bounded(self):
+        l_ret = self.series_run(RetrieveScheduler(maxSeries=3), [10] * 9)
+        self.assertEqual(self.maxInFlight, 3)
+        self.assertEqual([d["series"] for d in l_ret], ["1.%d" % i for i in range(9)])
+
+    def test_backpressure(self):
+        # Every series is 'repacked' 0.1s after it is first polled
+        d_started: dict = {}
+        l_outstanding: list = []
+
+        def f_pending(str_seriesUID) -> int:
+            d_started.setdefault(str_seriesUID, time.monotonic())
+            if time.monotonic() - d_started[str_seriesUID] > 0.1:
+                return 0
+            return 6
+
+        scheduler = RetrieveScheduler(
+            maxSeries=4, maxImages=12, f_pending=f_pending, pollInterval=0.01
+        )
+        f_admit = scheduler.admit
+
+        def admit(images) -> bool:
+            b_admit = f_admit(images)
+            if b_admit:
+                l_outstanding.append(scheduler.outstanding_update() + images)
+            return b_admit
+
+        scheduler.admit = admit
+        self.series_run(scheduler, [6] * 6)
+        self.assertEqual(len(l_outstanding), 6)
+        self.assertLessEqual(max(l_outstanding), 12)
+        self.assertLessEqual(self.maxInFlight, 2)
+
+
+def study_create(i: int, series: int = 2) -> dict:
+    return {
+        "StudyInstanceUID": {"value": "1.%d" % i},
+        "StudyDescription": {"value": "study %d" % i},
+        "series": [
+            {
+                "SeriesInstanceUID": {"value": "1.%d.%d" % (i, j)},
+                "SeriesDescription": {"value": "series %d" % j},
+                "InstanceNumber": {"value": "1"},
+                "NumberOfSeriesRelatedInstances": {"value": "3"},
+            }
+            for j in range(series)
+        ],
+    }
+
+
+class TestDoStream(TestCase):
+    def test_studies_streamed(self):
+        l_event: list = []
+
+        async def studies_get():
+            for i in range(3):
+                l_event.append(("study", i))
+                yield study_create(i)
+                await asyncio.sleep(0)
+
+        def seriesReport_print(self, **kwargs) -> str:
+            l_event.append(("report", kwargs["studyIndex"], kwargs["seriesIndex"]))
+            return ""
+
+        with tempfile.TemporaryDirectory() as str_dir:
+            do = Do(
+                {
+                    "withFeedBack": False,
+                    "then": "report,report",
+                    "thenArgs": "",
+                    "dblogbasepath": str_dir,
+                    "verbosity": 0,
+                    "reportData": {
+                        "status": "success",
+                        "command": "findscu",
+                        "args": {},
+                        "data": [],
+                    },
+                }
+            )
+            with mock.patch.object(Report, "seriesReport_print", seriesReport_print):
+                d_do: dict = asyncio.run(do.run({"studies": studies_get()}))
+        # Each study is worked on as it arrives, and the later 'then'
+        # operations go over the collected studies
+        l_report: list = [("report", i, j) for i in range(3) for j in range(2)]
+        self.assertEqual(
+            l_event,
+            [("study", 0)]
+            + l_report[0:2]
+            + [("study", 1)]
+            + l_report[2:4]
+            + [("study", 2)]
+            + l_report[4:6]
+            + l_report,
+        )
+        self.assertEqual(len(do.arg["reportData"]["data"]), 3)
+        self.assertEqual(
+            [list(d) for d in d_do["01-report"]["study"]], [["1.0"], ["1.1"], ["1.2"]]
+        )
+
+    def test_report_study_add(self):
+        l_study: list = [study_create(i, i + 1) for i in range(3)]
+        d_reportData: dict = {"status": "success", "command": "findscu", "data": []}
+        report = Report({"reportData": d_reportData, "verbosity": 0})
+        report.run()
+        for study in l_study:
+            report.study_add(study)
+        self.assertEqual(
+            report.d_report,
+            Report(
+                {"reportData": {**d_reportData, "data": l_study}, "verbosity": 0}
+            ).report_generate(),
+        )
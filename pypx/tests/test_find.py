@@ -1,6 +1,18 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
 from unittest import TestCase
 
 import pypx
+from pypx import stream
+
+async def aiter_list(l):
+    for item in l:
+        yield item
+
 
 class TestFind(TestCase):
     def test_find_command(self):
@@ -35,3 +47,240 @@ class TestFind(TestCase):
 #         self.maxDiff = None
 #         self.assertEqual(output['command'], command)
         self.assertEqual(1, 1)
+
+
+class TestFindConcurrentSeries(TestCase):
+    def find_create(self, maxConcurrentQueries):
+        find = pypx.Find(
+            {
+                "StudyOnly": False,
+                "then": "",
+                "withFeedBack": False,
+                "maxConcurrentQueries": maxConcurrentQueries,
+                "verbosity": 0,
+            }
+        )
+        self.inFlight = 0
+        self.maxInFlight = 0
+
+        async def systemlevel_runasync(opt, d_params, f_record=None):
+            if d_params["QueryRetrieveLevel"] == "STUDY":
+                return {
+                    "status": "success",
+                    "command": "findscu STUDY",
+                    "data": [
+                        {"StudyInstanceUID": {"value": "1.%d" % i}} for i in range(6)
+                    ],
+                }
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+            # Later studies answer first
+            await asyncio.sleep(0.01 * (10 - int(d_params["StudyInstanceUID"][2:])))
+            self.inFlight -= 1
+            return {
+                "status": "success",
+                "command": "findscu SERIES",
+                "data": [
+                    {
+                        "SeriesInstanceUID": {
+                            "value": d_params["StudyInstanceUID"] + ".1"
+                        }
+                    }
+                ],
+            }
+
+        find.systemlevel_runasync = systemlevel_runasync
+        return find
+
+    def test_series_queries_bounded_and_ordered(self):
+        find = self.find_create(2)
+        d_find = asyncio.run(find.run({"SeriesInstanceUID": ""}))
+        self.assertEqual(self.maxInFlight, 2)
+        self.assertEqual(
+            [
+                study["series"][0]["SeriesInstanceUID"]["value"]
+                for study in d_find["data"]
+            ],
+            ["1.%d.1" % i for i in range(6)],
+        )
+
+    def test_stream(self):
+        find = self.find_create(6)
+        find.stream = True
+        with contextlib.redirect_stdout(io.StringIO()) as fp:
+            d_find = asyncio.run(find.run({"SeriesInstanceUID": ""}))
+        fp.seek(0)
+        d_reportData, b_stream = stream.reportData_read(fp)
+        self.assertTrue(b_stream)
+        self.assertEqual(d_reportData["command"], "findscu STUDY")
+        # The studies are streamed as their SERIES queries complete
+        self.assertEqual(
+            [
+                study["StudyInstanceUID"]["value"]
+                for study in stream.studies_read(fp, d_reportData)
+            ],
+            ["1.%d" % i for i in reversed(range(6))],
+        )
+        self.assertEqual(d_reportData["status"], "success")
+        # while the result keeps the STUDY order
+        self.assertEqual(
+            [study["StudyInstanceUID"]["value"] for study in d_find["data"]],
+            ["1.%d" % i for i in range(6)],
+        )
+
+    def test_then_in_study_order(self):
+        for b_stream in [False, True]:
+            find = self.find_create(6)
+            find.stream = b_stream
+            find.arg["then"] = "report"
+            l_then = []
+
+            async def then_run(opt):
+                if "studies" in opt:
+                    studies = opt["studies"]
+                else:
+                    studies = opt["reportData"]["data"]
+                    # there are no SERIES queries left to wait for
+                    self.assertEqual(self.inFlight, 0)
+                async for study in studies if b_stream else aiter_list(studies):
+                    # the first studies arrive while the others are queried
+                    l_then.append((study["StudyInstanceUID"]["value"], self.inFlight))
+                return {}
+
+            find.then.run = then_run
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(find.run({"SeriesInstanceUID": ""}))
+            if b_stream:
+                self.assertEqual(
+                    [uid for uid, inFlight in l_then],
+                    ["1.%d" % i for i in reversed(range(6))],
+                )
+                # (the exact counts depend on how soon 'then' gets to run)
+                self.assertGreater(l_then[0][1], 0)
+            else:
+                self.assertEqual(l_then, [("1.%d" % i, 0) for i in range(6)])
+
+    def test_ndjson_status(self):
+        find = self.find_create(6)
+        find.ndjson = True
+        f_run = find.systemlevel_runasync
+
+        async def systemlevel_runasync(opt, d_params, f_record=None):
+            d_ret = await f_run(opt, d_params, f_record)
+            for record in d_ret["data"]:
+                f_record(record)
+            if d_params.get("StudyInstanceUID") == "1.2":
+                # a record was printed before its query failed
+                d_ret = {**d_ret, "status": "error"}
+            return d_ret
+
+        find.systemlevel_runasync = systemlevel_runasync
+        with contextlib.redirect_stdout(io.StringIO()) as fp:
+            d_find = asyncio.run(find.run({"SeriesInstanceUID": ""}))
+        l_line = [json.loads(str_line) for str_line in fp.getvalue().splitlines()]
+        self.assertEqual(
+            [d for d in l_line if "record" not in d and "studies" not in d][0],
+            {
+                "QueryRetrieveLevel": "STUDY",
+                "status": "success",
+                "command": "findscu STUDY",
+            },
+        )
+        self.assertIn(
+            {
+                "QueryRetrieveLevel": "SERIES",
+                "StudyInstanceUID": "1.2",
+                "status": "error",
+                "command": "findscu SERIES",
+            },
+            l_line,
+        )
+        # the run ends in its final status
+        self.assertEqual(
+            l_line[-1],
+            {"studies": 6, "status": "success", "command": "findscu STUDY"},
+        )
+        self.assertEqual(len(d_find["data"]), 6)
+
+    def test_stream_study_query_error(self):
+        find = self.find_create(6)
+        find.stream = True
+
+        async def systemlevel_runasync(opt, d_params, f_record=None):
+            return {
+                "status": "error",
+                "command": "findscu STUDY",
+                "data": "F: cannot connect",
+            }
+
+        find.systemlevel_runasync = systemlevel_runasync
+        with contextlib.redirect_stdout(io.StringIO()) as fp:
+            asyncio.run(find.run({"SeriesInstanceUID": ""}))
+        fp.seek(0)
+        d_reportData, b_stream = stream.reportData_read(fp)
+        self.assertTrue(b_stream)
+        self.assertEqual(list(stream.studies_read(fp, d_reportData)), [])
+        self.assertEqual(d_reportData["status"], "error")
+        self.assertEqual(d_reportData["command"], "findscu STUDY")
+
+    def test_stream_empty_input(self):
+        d_reportData, b_stream = stream.reportData_read(io.StringIO(""))
+        self.assertFalse(b_stream)
+        self.assertEqual(d_reportData["status"], "error")
+        self.assertEqual(d_reportData["data"], [])
+
+str_findscuOutput = """I: Requesting Association
+I: Association Accepted (Max Send PDV: 16372)
+I: Sending Find Request (MsgID 1)
+I: ---------------------------
+I: Find Response: 1 (Pending)
+I:
+I: # Dicom-Data-Set
+I: # Used TransferSyntax: Little Endian Explicit
+I: (0008,0052) CS [STUDY ]                                #   6, 1 QueryRetrieveLevel
+I: (0008,1030) LO (no value available)                     #   0, 0 StudyDescription
+I: (0020,000d) UI [1.2.3.4]                               #   8, 1 StudyInstanceUID
+I:
+I: ---------------------------
+I: Find Response: 2 (Pending)
+I:
+I: (0008,0052) CS [STUDY ]                                #   6, 1 QueryRetrieveLevel
+I: (0020,000d) UI [1.2.3.5]                               #   8, 1 StudyInstanceUID
+I:
+I: Received Final Find Response (Success)
+I: Releasing Association
+"""
+
+
+class TestResponseParser(TestCase):
+    def test_parseResponse(self):
+        find = pypx.Find({"withFeedBack": False})
+        l_data = find.parseResponse(str_findscuOutput)
+        self.assertEqual(len(l_data), 2)
+        self.assertEqual(l_data[1]["uid"]["value"], 1)
+        self.assertEqual(l_data[0]["StudyInstanceUID"]["value"], "1.2.3.4")
+        self.assertEqual(l_data[0]["StudyInstanceUID"]["tag"], "0020,000d")
+        self.assertEqual(
+            l_data[0]["StudyDescription"]["value"],
+            "no value provided for 0008,1030",
+        )
+        self.assertEqual(find.checkResponse(str_findscuOutput), "success")
+
+    def test_systemlevel_runasync_streams_records(self):
+        find = pypx.Find({"withFeedBack": False})
+        with tempfile.TemporaryDirectory() as str_dir:
+            str_file = os.path.join(str_dir, "findscu.txt")
+            with open(str_file, "w") as f:
+                f.write(str_findscuOutput)
+            l_streamed = []
+            d_ret = asyncio.run(
+                find.systemlevel_runasync(
+                    {},
+                    {"f_commandGen": lambda opt: "cat %s" % str_file},
+                    l_streamed.append,
+                )
+            )
+        self.assertEqual(d_ret["status"], "success")
+        self.assertEqual(d_ret["returncode"], 0)
+        self.assertEqual(d_ret["data"], find.parseResponse(str_findscuOutput))
+        self.assertEqual(l_streamed, d_ret["data"])
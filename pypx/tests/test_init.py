@@ -0,0 +1,49 @@
+import json
+import subprocess
+import sys
+from unittest import TestCase
+
+
+def modules_loaded(str_code: str) -> dict:
+    """
+    Run <str_code> in a fresh interpreter, and return the JSON it
+    printed last.
+    """
+    str_out: str = subprocess.run(
+        [sys.executable, "-c", str_code], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(str_out.splitlines()[-1])
+
+
+class TestLazyImport(TestCase):
+    def test_import_is_lazy(self):
+        d_loaded: dict = modules_loaded(
+            "import sys, json, pypx\n"
+            "print(json.dumps({m: m in sys.modules for m in "
+            "['pypx.find', 'pypx.pfstorage', 'aiohttp', 'pudb', 'dask']}))"
+        )
+        self.assertEqual(set(d_loaded.values()), {False})
+
+    def test_repack_is_lean(self):
+        # (pfmisc, which repack needs, itself imports pudb)
+        d_loaded: dict = modules_loaded(
+            "import sys, json, pypx.repack\n"
+            "print(json.dumps({m: m in sys.modules for m in "
+            "['aiohttp', 'dask', 'swiftclient']}))"
+        )
+        self.assertEqual(set(d_loaded.values()), {False})
+
+    def test_names_resolve(self):
+        d_loaded: dict = modules_loaded(
+            "import json, types, pypx\n"
+            "import pypx.find, pypx.do\n"
+            "from pypx import find, Find, Status\n"
+            "print(json.dumps({\n"
+            "    'find': isinstance(find, types.FunctionType),\n"
+            "    'do': isinstance(pypx.do, types.FunctionType),\n"
+            "    'Find': Find is pypx.find.__globals__['Find'],\n"
+            "    'Status': Status.__module__ == 'pypx.nxstatus',\n"
+            "    'dir': 'Register' in dir(pypx),\n"
+            "}))"
+        )
+        self.assertEqual(set(d_loaded.values()), {True})
@@ -0,0 +1,46 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from pypx.listen import Listen
+
+
+class TestImagesPlace(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.listen = Listen.__new__(Listen)
+        self.str_error = os.path.join(self.tmp.name, "err.txt")
+        self.l_tmp = []
+        for i in range(3):
+            str_tmp = os.path.join(self.tmp.name, "received%d" % i)
+            with open(str_tmp, "wb") as fp:
+                fp.write(b"%d" % i)
+            self.l_tmp.append(str_tmp)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def image_read(self, str_image: str) -> bytes:
+        with open(str_image, "rb") as fp:
+            return fp.read()
+
+    def test_existing_image_kept(self):
+        str_series = os.path.join(self.tmp.name, "series")
+        os.makedirs(str_series)
+        str_existing = os.path.join(str_series, "1.dcm")
+        with open(str_existing, "wb") as fp:
+            fp.write(b"old")
+        str_new = os.path.join(str_series, "2.dcm")
+        # a resent SOP instance: two files of the association to one image
+        self.listen.imagesPlace(
+            [
+                (self.l_tmp[0], str_existing),
+                (self.l_tmp[1], str_new),
+                (self.l_tmp[2], str_new),
+            ],
+            self.str_error,
+        )
+        self.assertEqual(self.image_read(str_existing), b"old")
+        self.assertEqual(self.image_read(str_new), b"1")
+        self.assertEqual(sorted(os.listdir(str_series)), ["1.dcm", "2.dcm"])
+        self.assertFalse(os.path.exists(self.str_error))
@@ -0,0 +1,241 @@
+import asyncio
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, skipUnless
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ImplicitVRLittleEndian, generate_uid
+
+import pypx
+
+try:
+    from pynetdicom import AE, evt
+    from pynetdicom.sop_class import (
+        MRImageStorage,
+        Verification,
+        StudyRootQueryRetrieveInformationModelFind,
+        StudyRootQueryRetrieveInformationModelMove,
+    )
+    from pypx import netdicom
+except ImportError:
+    netdicom = None
+
+
+class PACS:
+    """
+    A minimal pynetdicom SCP stand-in for a PACS with two studies
+    of two series each, that answers each C-FIND after <delay> seconds,
+    and moves the (two) images of a series to the move destinations of
+    its <d_destination>.
+    """
+
+    def __init__(self, delay: float = 0):
+        self.l_series: list = []
+        for study in range(2):
+            for series in range(2):
+                ds = Dataset()
+                ds.PatientID = "1234567"
+                ds.PatientName = "Doe^John"
+                ds.StudyInstanceUID = "1.2.3.%d" % study
+                ds.StudyDescription = "Study %d" % study
+                ds.SeriesInstanceUID = "1.2.3.%d.%d" % (study, series)
+                ds.SeriesDescription = "Series %d" % series
+                ds.Modality = "MR"
+                ds.NumberOfSeriesRelatedInstances = 10
+                self.l_series.append(ds)
+        self.associations: int = 0
+        self.delay: float = delay
+        self.inFlight: int = 0
+        self.maxInFlight: int = 0
+        self.lock = threading.Lock()
+        self.d_destination: dict = {}
+
+        self.ae = AE(ae_title="TESTPACS")
+        self.ae.add_requested_context(MRImageStorage, ImplicitVRLittleEndian)
+        for context in [
+            Verification,
+            StudyRootQueryRetrieveInformationModelFind,
+            StudyRootQueryRetrieveInformationModelMove,
+        ]:
+            self.ae.add_supported_context(context)
+        self.server = self.ae.start_server(
+            ("127.0.0.1", 0),
+            block=False,
+            evt_handlers=[
+                (evt.EVT_C_FIND, self.find_handle),
+                (evt.EVT_C_MOVE, self.move_handle),
+                (evt.EVT_ACCEPTED, self.accepted_handle),
+            ],
+        )
+        self.port: int = self.server.server_address[1]
+
+    def accepted_handle(self, event):
+        self.associations += 1
+
+    def find_handle(self, event):
+        with self.lock:
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.inFlight -= 1
+        query = event.identifier
+        l_seen: list = []
+        for ds in self.l_series:
+            if query.get("StudyInstanceUID", "") not in ("", ds.StudyInstanceUID):
+                continue
+            if query.QueryRetrieveLevel == "STUDY":
+                if ds.StudyInstanceUID in l_seen:
+                    continue
+                l_seen.append(ds.StudyInstanceUID)
+            response = Dataset()
+            response.QueryRetrieveLevel = query.QueryRetrieveLevel
+            for elem in query:
+                if elem.keyword in ds and elem.keyword != "QueryRetrieveLevel":
+                    if query.QueryRetrieveLevel == "STUDY" and "Series" in elem.keyword:
+                        continue
+                    setattr(response, elem.keyword, ds[elem.keyword].value)
+            yield 0xFF00, response
+
+    def move_handle(self, event):
+        str_destination: str = str(event.move_destination).strip()
+        if str_destination not in self.d_destination:
+            # Unknown move destination
+            yield None, None
+            return
+        yield self.d_destination[str_destination]
+        yield 2
+        for i in range(2):
+            ds = Dataset()
+            ds.file_meta = FileMetaDataset()
+            ds.file_meta.TransferSyntaxUID = ImplicitVRLittleEndian
+            ds.SOPClassUID = MRImageStorage
+            ds.SOPInstanceUID = generate_uid()
+            ds.SeriesInstanceUID = event.identifier.SeriesInstanceUID
+            yield 0xFF00, ds
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+@skipUnless(netdicom, "the optional pynetdicom package is not installed")
+class TestNetDICOM(TestCase):
+    def setUp(self):
+        self.pacs = PACS()
+        self.arg: dict = {
+            "aet": "CHRIS",
+            "aec": "TESTPACS",
+            "serverIP": "127.0.0.1",
+            "serverPort": str(self.pacs.port),
+            "engine": "pynetdicom",
+            "StudyOnly": False,
+            "then": "",
+            "withFeedBack": False,
+            "verbosity": 0,
+            "SeriesInstanceUID": "",
+        }
+
+    def tearDown(self):
+        netdicom.engines_release()
+        self.pacs.shutdown()
+
+    def test_find_reuses_association(self):
+        d_find = asyncio.run(pypx.find(self.arg))
+        self.assertEqual(d_find["status"], "success")
+        self.assertEqual(len(d_find["data"]), 2)
+        study = d_find["data"][1]
+        self.assertEqual(study["StudyInstanceUID"]["value"], "1.2.3.1")
+        self.assertEqual(study["StudyInstanceUID"]["tag"], "0020,000d")
+        self.assertEqual(study["PatientName"]["value"], "Doe^John")
+        self.assertEqual(
+            [series["SeriesInstanceUID"]["value"] for series in study["series"]],
+            ["1.2.3.1.0", "1.2.3.1.1"],
+        )
+        self.assertEqual(
+            study["series"][0]["NumberOfSeriesRelatedInstances"]["value"], "10"
+        )
+        # The STUDY query and two concurrent SERIES queries on at most
+        # two associations, all of them reused by a next find
+        self.assertLessEqual(self.pacs.associations, 2)
+        associations: int = self.pacs.associations
+        self.assertEqual(asyncio.run(pypx.find(self.arg))["status"], "success")
+        self.assertEqual(self.pacs.associations, associations)
+
+    def test_concurrent_requests(self):
+        self.pacs.delay = 0.2
+        engine = netdicom.engine_get("CHRIS", "TESTPACS", "127.0.0.1", self.pacs.port)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            l_find = list(
+                executor.map(
+                    lambda i: engine.find(
+                        {"QueryRetrieveLevel": "STUDY", "StudyInstanceUID": ""}
+                    ),
+                    range(6),
+                )
+            )
+        self.assertEqual([d["status"] for d in l_find], ["success"] * 6)
+        # in parallel, on no more than the associations of the pool
+        self.assertEqual(self.pacs.maxInFlight, netdicom.associationsMax)
+        self.assertEqual(self.pacs.associations, netdicom.associationsMax)
+
+    def test_associations_opened(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port: int = sock.getsockname()[1]
+        # (nothing listens on the port)
+        engine = netdicom.Engine("CHRIS", "TESTPACS", "127.0.0.1", port)
+        self.assertEqual(engine.echo()["status"], "error")
+        self.assertEqual(engine.associations, 0)
+        engine = netdicom.Engine("CHRIS", "TESTPACS", "127.0.0.1", self.pacs.port)
+        self.assertEqual(engine.echo()["status"], "success")
+        self.assertEqual(engine.echo()["status"], "success")
+        self.assertEqual(engine.associations, 1)
+        engine.release()
+
+    def test_echo_and_move(self):
+        self.assertEqual(pypx.echo(self.arg)["status"], "success")
+        d_move = pypx.move(
+            {
+                **self.arg,
+                "StudyInstanceUID": "1.2.3.0",
+                "SeriesInstanceUID": "1.2.3.0.0",
+            }
+        )
+        self.assertEqual(d_move["status"], "error")
+        self.assertEqual(pypx.echo(self.arg)["status"], "success")
+        self.assertEqual(self.pacs.associations, 1)
+
+    def test_move(self):
+        l_stored: list = []
+
+        def store_handle(event):
+            l_stored.append(event.dataset.SOPInstanceUID)
+            return 0x0000
+
+        store = AE(ae_title="CHRIS")
+        store.add_supported_context(MRImageStorage, ImplicitVRLittleEndian)
+        server = store.start_server(
+            ("127.0.0.1", 0),
+            block=False,
+            evt_handlers=[(evt.EVT_C_STORE, store_handle)],
+        )
+        self.pacs.d_destination["CHRIS"] = ("127.0.0.1", server.server_address[1])
+        try:
+            d_move = pypx.move(
+                {
+                    **self.arg,
+                    "StudyInstanceUID": "1.2.3.0",
+                    "SeriesInstanceUID": "1.2.3.0.0",
+                }
+            )
+        finally:
+            server.shutdown()
+        self.assertEqual(d_move["status"], "success")
+        self.assertEqual(len(l_stored), 2)
+        d_count: dict = d_move["data"][0]
+        self.assertEqual(d_count["NumberOfCompletedSuboperations"]["value"], "2")
+        self.assertEqual(d_count["NumberOfCompletedSuboperations"]["tag"], "0000,1021")
+        self.assertEqual(d_count["NumberOfFailedSuboperations"]["value"], "0")
+        self.assertEqual(d_count["NumberOfWarningSuboperations"]["value"], "0")
@@ -0,0 +1,302 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+from unittest import TestCase, mock
+
+from pypx import nxstatus, smdb
+
+
+class CUBE(ThreadingHTTPServer):
+    """
+    A stand-in for the CUBE API that serves the <l_pacsfile> records
+    (dictionaries of the PACS file fields) as a paginated pacsfiles
+    search in the collection+json format, and counts the connections
+    and concurrent requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, l_pacsfile: list = [], delay: float = 0):
+        super().__init__(("127.0.0.1", 0), CUBEHandler)
+        self.l_pacsfile = l_pacsfile
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.url = "http://127.0.0.1:%d/api/v1/" % self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def search(self, str_path: str) -> dict:
+        url = urlparse(str_path)
+        d_query: dict = dict(parse_qsl(url.query))
+        limit: int = int(d_query.pop("limit", 10))
+        offset: int = int(d_query.pop("offset", 0))
+        l_hit: list = [
+            d
+            for d in self.l_pacsfile
+            if all(str(d.get(k, "")) == v for k, v in d_query.items())
+        ]
+        d_collection: dict = {
+            "total": len(l_hit),
+            "items": [
+                {
+                    "href": "%spacsfiles/%d/" % (self.url, id(d)),
+                    "data": [{"name": k, "value": v} for k, v in d.items()],
+                }
+                for d in l_hit[offset : offset + limit]
+            ],
+            "links": [],
+        }
+        if offset + limit < len(l_hit):
+            d_collection["links"].append(
+                {
+                    "rel": "next",
+                    "href": "%s?%s"
+                    % (
+                        url.path,
+                        urlencode(
+                            {**d_query, "limit": limit, "offset": offset + limit}
+                        ),
+                    ),
+                }
+            )
+        return {"collection": d_collection}
+
+
+class CUBEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        cube = self.server
+        with cube.lock:
+            cube.requests += 1
+            cube.inFlight += 1
+            cube.maxInFlight = max(cube.maxInFlight, cube.inFlight)
+        time.sleep(cube.delay)
+        with cube.lock:
+            cube.inFlight -= 1
+        if self.headers.get("Authorization", "") != "Basic Y2hyaXM6Y2hyaXMxMjM0":
+            code, body = 401, b"{}"
+        elif not urlparse(self.path).path.endswith("/pacsfiles/search/"):
+            code, body = 404, b"{}"
+        else:
+            code, body = 200, json.dumps(cube.search(self.path)).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/vnd.collection+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def pacsfiles_create(str_StudyInstanceUID: str, l_images: list) -> list:
+    """
+    Return the PACS file records of a study whose series "1.2.3.<i>"
+    has <l_images>[i] images, and the oxidicom records of the
+    number of images of each series.
+    """
+    l_pacsfile: list = []
+    for i, images in enumerate(l_images):
+        d_series: dict = {
+            "StudyInstanceUID": str_StudyInstanceUID,
+            "SeriesInstanceUID": "1.2.3.%d" % i,
+        }
+        l_pacsfile += [
+            {**d_series, "pacs_identifier": "PACSDCM", "InstanceNumber": n}
+            for n in range(images)
+        ]
+        l_pacsfile.append(
+            {
+                **d_series,
+                "pacs_identifier": "org.fnndsc.oxidicom",
+                "ProtocolName": "NumberOfSeriesRelatedInstances",
+                "SeriesDescription": str(images),
+            }
+        )
+    return l_pacsfile
+
+
+class TestCUBEclient(TestCase):
+    def setUp(self):
+        self.cube = CUBE(pacsfiles_create("1.2.3", [3] * 20), delay=0.05)
+        self.tmp = tempfile.TemporaryDirectory()
+        str_servicesDir = os.path.join(self.tmp.name, "services")
+        os.makedirs(str_servicesDir)
+        with open(os.path.join(str_servicesDir, "cube.json"), "w") as fj:
+            json.dump(
+                {
+                    "local": {
+                        "url": self.cube.url,
+                        "username": "chris",
+                        "password": "chris1234",
+                    }
+                },
+                fj,
+            )
+        nxstatus.d_CUBEinfo.clear()
+
+    def tearDown(self):
+        self.cube.shutdown()
+        self.cube.server_close()
+        self.tmp.cleanup()
+
+    def status_create(self, i: int, **kwargs) -> nxstatus.Status:
+        return nxstatus.Status(
+            {
+                "dblogbasepath": os.path.join(self.tmp.name, "log"),
+                "CUBE": "local",
+                "SeriesInstanceUID": "1.2.3.%d" % i,
+                "maxConcurrentCUBEqueries": 4,
+                "verbosity": 0,
+                **kwargs,
+            }
+        )
+
+    def test_shared_client(self):
+        l_status: list = [self.status_create(i) for i in range(20)]
+
+        async def registered_get() -> list:
+            try:
+                return await asyncio.gather(
+                    *[status.registeredDICOMcount_getFromCUBE() for status in l_status]
+                )
+            finally:
+                await nxstatus.CUBEclients_close()
+
+        with mock.patch.object(
+            smdb.SMDB,
+            "service_keyAccess",
+            autospec=True,
+            side_effect=smdb.SMDB.service_keyAccess,
+        ) as service_keyAccess:
+            l_registered: list = asyncio.run(registered_get())
+        self.assertEqual(l_registered, [3] * 20)
+        self.assertEqual(self.cube.requests, 20)
+        # the requests went out concurrently, but never more than the limit,
+        # and over kept-alive connections
+        self.assertGreater(self.cube.maxInFlight, 1)
+        self.assertLessEqual(self.cube.maxInFlight, 4)
+        self.assertLessEqual(self.cube.connections, 4)
+        # the credentials were read once
+        self.assertEqual(service_keyAccess.call_count, 1)
+        self.assertEqual(nxstatus.d_CUBEclient, {})
+
+    def test_study_counts(self):
+        l_images: list = [1, 5, 2, 0, 7, 4]
+        self.cube.l_pacsfile = pacsfiles_create("9.8.7", l_images)
+        status: nxstatus.Status = self.status_create(1, CUBEpageLimit=4)
+
+        async def study_get() -> dict:
+            try:
+                return await status.CUBEstudy_get("9.8.7")
+            finally:
+                await nxstatus.CUBEclients_close()
+
+        d_study: dict = asyncio.run(study_get())
+        self.assertTrue(d_study["status"])
+        self.assertEqual(
+            d_study["registered"],
+            {"1.2.3.%d" % i: n for i, n in enumerate(l_images) if n},
+        )
+        self.assertEqual(
+            d_study["requested"], {"1.2.3.%d" % i: n for i, n in enumerate(l_images)}
+        )
+        # 19 files in pages of 4, and the 6 oxidicom records in 2 pages --
+        # instead of 2 searches per series
+        self.assertEqual(self.cube.requests, 5 + 2)
+
+        # The series status picks its counts from the study
+        requests: int = self.cube.requests
+        with mock.patch.object(
+            status, "registeredDICOMcount_getFromFS", return_value=5
+        ):
+            d_status: dict = asyncio.run(
+                status.run(
+                    {
+                        "SeriesInstanceUID": "1.2.3.1",
+                        "StudyInstanceUID": "9.8.7",
+                        "series": {},
+                        "CUBEstudy": d_study,
+                    }
+                )
+            )
+        self.assertTrue(d_status["status"])
+        self.assertEqual(d_status["images"]["requested"]["count"], 5)
+        self.assertEqual(self.cube.requests, requests)
+
+
+class TestDirCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.str_studyDir = os.path.join(self.tmp.name, "study")
+        self.str_seriesDir = os.path.join(self.str_studyDir, "00003-T1-1a2b3c")
+        os.makedirs(self.str_seriesDir)
+        for i in range(3):
+            open(os.path.join(self.str_seriesDir, "%d.dcm" % i), "w").close()
+        self.dirs_age()
+        self.cache = nxstatus.DirCache()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def dirs_age(self, str_dir: str = None):
+        # Directories that changed just now are not cached
+        for str_dir in (
+            [str_dir] if str_dir else [self.str_studyDir, self.str_seriesDir]
+        ):
+            os.utime(str_dir, (time.time() - 60, time.time() - 60))
+
+    def test_count(self):
+        with mock.patch("os.listdir", side_effect=os.listdir) as listdir:
+            self.assertEqual(self.cache.count(self.str_seriesDir), 3)
+            self.assertEqual(self.cache.count(self.str_seriesDir), 3)
+            self.assertEqual(listdir.call_count, 1)
+            # a new file changes the mtime of the directory
+            open(os.path.join(self.str_seriesDir, "3.dcm"), "w").close()
+            self.assertEqual(self.cache.count(self.str_seriesDir), 4)
+            self.assertEqual(self.cache.count(self.str_seriesDir), 4)
+            self.assertEqual(listdir.call_count, 3)
+            self.dirs_age(self.str_seriesDir)
+            self.assertEqual(self.cache.count(self.str_seriesDir), 4)
+            self.assertEqual(self.cache.count(self.str_seriesDir), 4)
+            self.assertEqual(listdir.call_count, 4)
+        self.assertEqual(self.cache.count(os.path.join(self.tmp.name, "none")), 0)
+
+    def test_invalidate(self):
+        self.assertEqual(self.cache.count(self.str_seriesDir), 3)
+        # a change that leaves the mtime of the directory as it was
+        mtime: int = os.stat(self.str_seriesDir).st_mtime_ns
+        open(os.path.join(self.str_seriesDir, "3.dcm"), "w").close()
+        os.utime(self.str_seriesDir, ns=(mtime, mtime))
+        self.assertEqual(self.cache.count(self.str_seriesDir), 3)
+        self.cache.invalidate(self.str_seriesDir)
+        self.assertEqual(self.cache.count(self.str_seriesDir), 4)
+
+    def test_resolveSeriesDir(self):
+        with mock.patch.object(nxstatus, "dirCache", self.cache):
+            status = nxstatus.Status(
+                {"dblogbasepath": os.path.join(self.tmp.name, "log"), "verbosity": 0}
+            )
+            with mock.patch("os.listdir", side_effect=os.listdir) as listdir:
+                for i in range(3):
+                    self.assertEqual(
+                        status.resolveSeriesDir(Path(self.str_studyDir) / "T1-1a2b3c"),
+                        Path(self.str_seriesDir),
+                    )
+                self.assertEqual(listdir.call_count, 1)
+        self.assertEqual(self.cache.hits, 2)
@@ -0,0 +1,509 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.parse import parse_qsl, unquote, urlparse
+
+from pypx import pfstorage
+from pypx.pfstorage import fileStorage, swiftStorage
+
+
+class Swift(ThreadingHTTPServer):
+    """
+    A stand-in for a swift (auth v1.0) object store that keeps the
+    objects put in memory, and counts authentications, concurrent
+    requests, and the requests of each method (and listings). Each
+    authentication issues a new token, which is valid until
+    tokens_expire().
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay: float = 0):
+        super().__init__(("127.0.0.1", 0), SwiftHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.d_object = {}
+        self.auths = 0
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.d_requests = {}
+        self.s_token = set()
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def tokens_expire(self):
+        with self.lock:
+            self.s_token.clear()
+
+
+class SwiftHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code: int, d_headers: dict = {}, body: bytes = b""):
+        self.send_response(code)
+        for k, v in d_headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def request_count(self, str_request: str) -> None:
+        swift = self.server
+        with swift.lock:
+            swift.d_requests[str_request] = swift.d_requests.get(str_request, 0) + 1
+
+    def object_name(self) -> str:
+        return unquote(urlparse(self.path).path.split("/", 3)[-1])
+
+    def listing(self) -> bytes:
+        d_query: dict = dict(parse_qsl(urlparse(self.path).query))
+        with self.server.lock:
+            l_name: list = sorted(self.server.d_object)
+        l_name = [
+            str_name.split("/", 1)[1]
+            for str_name in l_name
+            if str_name.split("/", 1)[1].startswith(d_query.get("prefix", ""))
+            and str_name.split("/", 1)[1] > d_query.get("marker", "")
+        ][: int(d_query.get("limit", 10000))]
+        return json.dumps(
+            [
+                {
+                    "name": str_name,
+                    "bytes": len(self.server.d_object["users/" + str_name]),
+                    "hash": hashlib.md5(
+                        self.server.d_object["users/" + str_name]
+                    ).hexdigest(),
+                    "last_modified": "",
+                    "content_type": "application/octet-stream",
+                }
+                for str_name in l_name
+            ]
+        ).encode()
+
+    def authorized(self) -> bool:
+        if self.headers.get("X-Auth-Token") in self.server.s_token:
+            return True
+        if "Content-Length" in self.headers:
+            self.rfile.read(int(self.headers["Content-Length"]))
+        self.close_connection = True
+        self.reply(401)
+        return False
+
+    def do_GET(self):
+        swift = self.server
+        if self.path.startswith("/auth/v1.0"):
+            with swift.lock:
+                swift.auths += 1
+                str_token = "token-%d" % swift.auths
+                swift.s_token.add(str_token)
+            self.reply(
+                200,
+                {
+                    "X-Storage-Url": "http://127.0.0.1:%d/v1/AUTH_test" % swift.port,
+                    "X-Auth-Token": str_token,
+                },
+            )
+        elif not self.authorized():
+            return
+        elif self.object_name() == "users":
+            self.request_count("LIST")
+            self.reply(200, {"Content-Type": "application/json"}, self.listing())
+        elif self.object_name() in swift.d_object:
+            self.request_count("GET")
+            with swift.lock:
+                swift.inFlight += 1
+                swift.maxInFlight = max(swift.maxInFlight, swift.inFlight)
+            time.sleep(swift.delay)
+            with swift.lock:
+                swift.inFlight -= 1
+            body: bytes = swift.d_object[self.object_name()]
+            str_etag: str = hashlib.md5(body).hexdigest()
+            if self.headers.get("Range", "").startswith("bytes="):
+                offset = int(self.headers["Range"][6:].rstrip("-"))
+                self.reply(
+                    206,
+                    {
+                        "Etag": str_etag,
+                        "Content-Range": "bytes %d-%d/%d"
+                        % (offset, len(body) - 1, len(body)),
+                    },
+                    body[offset:],
+                )
+            else:
+                self.reply(200, {"Etag": str_etag}, body)
+        else:
+            self.reply(404)
+
+    def do_HEAD(self):
+        if not self.authorized():
+            return
+        self.request_count("HEAD")
+        if self.object_name() in self.server.d_object:
+            self.reply(200, {"Etag": ""})
+        else:
+            self.reply(404)
+
+    def do_DELETE(self):
+        if not self.authorized():
+            return
+        self.request_count("DELETE")
+        with self.server.lock:
+            body = self.server.d_object.pop(self.object_name(), None)
+        self.reply(204 if body is not None else 404)
+
+    def do_PUT(self):
+        swift = self.server
+        if self.headers.get("X-Auth-Token") not in swift.s_token:
+            self.close_connection = True
+            self.reply(401)
+            return
+        if "Content-Length" in self.headers:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        else:
+            body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if not size:
+                    break
+                body += chunk
+        with swift.lock:
+            swift.inFlight += 1
+            swift.maxInFlight = max(swift.maxInFlight, swift.inFlight)
+        time.sleep(swift.delay)
+        with swift.lock:
+            swift.inFlight -= 1
+            swift.d_object[self.object_name()] = body
+        self.reply(201, {"Etag": ""})
+
+
+def swiftStorage_create(swift: Swift, **kwargs) -> swiftStorage:
+    return swiftStorage(
+        {
+            "str_swiftIP": "127.0.0.1",
+            "str_swiftPort": str(swift.port),
+            "str_swiftLogin": "test:tester",
+            "str_storeBaseLocation": "",
+            "verbosity": 0,
+            **kwargs,
+        }
+    )
+
+
+class TestObjPut(TestCase):
+    def setUp(self):
+        self.swift = Swift(delay=0.05)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.l_file = []
+        for i in range(8):
+            str_file = os.path.join(self.tmp.name, "file%d" % i)
+            with open(str_file, "wb") as fp:
+                fp.write(os.urandom(1000 * (i + 1)))
+            self.l_file.append(str_file)
+
+    def tearDown(self):
+        self.swift.shutdown()
+        self.swift.server_close()
+        self.tmp.cleanup()
+
+    def test_objPut_concurrent(self):
+        store = swiftStorage_create(self.swift, swiftThreads=3)
+        d_put = store.objPut(
+            fileList=self.l_file,
+            toLocation="SERVICES/PACS/test",
+            mapLocationOver=self.tmp.name,
+        )
+        self.assertTrue(d_put["status"])
+        self.assertEqual(d_put["localFileList"], self.l_file)
+        self.assertEqual(
+            d_put["objectFileList"],
+            ["SERVICES/PACS/test/file%d" % i for i in range(8)],
+        )
+        for str_file, str_object in zip(self.l_file, d_put["objectFileList"]):
+            with open(str_file, "rb") as fp:
+                self.assertEqual(self.swift.d_object["users/" + str_object], fp.read())
+        self.assertEqual(self.swift.maxInFlight, 3)
+        # one connection per worker thread, all on the same token
+        self.assertEqual(self.swift.auths, 1)
+
+    def test_pooled_auth(self):
+        d_before: dict = pfstorage.swiftPool.metrics_get()
+        # e.g. the pushes of several series
+        for i in range(3):
+            store = swiftStorage_create(self.swift, swiftThreads=2)
+            store.objPut(
+                fileList=self.l_file,
+                toLocation="SERVICES/PACS/%d" % i,
+                mapLocationOver=self.tmp.name,
+            )
+            self.assertTrue(store.objExists(path="SERVICES/PACS/%d/file0" % i))
+        self.assertEqual(self.swift.auths, 1)
+        d_after: dict = pfstorage.swiftPool.metrics_get()
+        self.assertEqual(d_after["auths"] - d_before["auths"], 1)
+        self.assertGreaterEqual(d_after["authsSaved"] - d_before["authsSaved"], 2)
+
+        # an expired token is replaced transparently, once for all threads
+        self.swift.tokens_expire()
+        d_put: dict = store.objPut(
+            fileList=self.l_file,
+            toLocation="SERVICES/PACS/expired",
+            mapLocationOver=self.tmp.name,
+        )
+        self.assertTrue(d_put["status"])
+        self.assertTrue(store.objExists(path="SERVICES/PACS/expired/file7"))
+        self.assertEqual(self.swift.auths, 2)
+
+
+class TestListing(TestCase):
+    def setUp(self):
+        self.swift = Swift()
+        self.swift.d_object = {
+            "users/SERVICES/PACS/%s/%02d.dcm" % (str_series, i): b"%d" % i
+            for str_series in ["s1", "s2"]
+            for i in range(12)
+        }
+        self.store = swiftStorage_create(self.swift)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.swift.shutdown()
+        self.swift.server_close()
+        self.tmp.cleanup()
+
+    def test_objExists(self):
+        self.assertTrue(self.store.objExists(path="SERVICES/PACS/s1/03.dcm"))
+        self.assertFalse(self.store.objExists(path="SERVICES/PACS/s1/03"))
+        self.assertFalse(self.store.objExists(path="SERVICES/PACS/s1"))
+        self.assertEqual(self.swift.d_requests, {"HEAD": 3})
+
+    def test_ls_paginated(self):
+        ls = self.store.ls_iter(path="SERVICES/PACS/s1", pageSize=5, retSpec=["name"])
+        # the listing is read lazily, page by page
+        self.assertEqual(next(ls), {"name": "SERVICES/PACS/s1/00.dcm"})
+        self.assertEqual(self.swift.d_requests, {"LIST": 1})
+        self.assertEqual(len(list(ls)), 11)
+        self.assertEqual(self.swift.d_requests, {"LIST": 3})
+
+        d_ls = self.store.ls(path="SERVICES/PACS", substr="1.dcm", pageSize=10)
+        self.assertTrue(d_ls["status"])
+        self.assertEqual(
+            d_ls["list_ls"],
+            ["SERVICES/PACS/s1/01.dcm", "SERVICES/PACS/s1/11.dcm"]
+            + ["SERVICES/PACS/s2/01.dcm", "SERVICES/PACS/s2/11.dcm"],
+        )
+
+    def test_objPull_rmtree(self):
+        self.store.lsPageSize = 5
+        d_pull = self.store.objPull(
+            fromLocation="SERVICES/PACS/s2", toLocation=self.tmp.name
+        )
+        self.assertTrue(d_pull["status"])
+        self.assertEqual(len(d_pull["localFileList"]), 12)
+        with open(os.path.join(self.tmp.name, "07.dcm"), "rb") as fp:
+            self.assertEqual(fp.read(), b"7")
+
+        d_rm = self.store.rmtree(path="SERVICES/PACS/s1")
+        self.assertTrue(d_rm["status"])
+        self.assertEqual(len(d_rm["dellist"]), 12)
+        self.assertEqual(
+            sorted(self.swift.d_object),
+            ["users/SERVICES/PACS/s2/%02d.dcm" % i for i in range(12)],
+        )
+
+
+class TestObjPull(TestCase):
+    def setUp(self):
+        self.swift = Swift(delay=0.02)
+        self.swift.d_object = {
+            "users/SERVICES/PACS/s/%02d.dcm" % i: os.urandom(5000 + i)
+            for i in range(12)
+        }
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = swiftStorage_create(self.swift, swiftThreads=3)
+        self.store.chunkSize = 1024
+
+    def tearDown(self):
+        self.swift.shutdown()
+        self.swift.server_close()
+        self.tmp.cleanup()
+
+    def objPull(self) -> dict:
+        return self.store.objPull(
+            fromLocation="SERVICES/PACS/s", toLocation=self.tmp.name
+        )
+
+    def local_read(self, i: int) -> bytes:
+        with open(os.path.join(self.tmp.name, "%02d.dcm" % i), "rb") as fp:
+            return fp.read()
+
+    def test_objPull(self):
+        d_pull: dict = self.objPull()
+        self.assertTrue(d_pull["status"])
+        self.assertEqual((d_pull["pulled"], d_pull["skipped"]), (12, 0))
+        self.assertEqual(
+            d_pull["objectFileList"],
+            ["SERVICES/PACS/s/%02d.dcm" % i for i in range(12)],
+        )
+        for i in range(12):
+            self.assertEqual(
+                self.local_read(i),
+                self.swift.d_object["users/SERVICES/PACS/s/%02d.dcm" % i],
+            )
+        self.assertEqual(self.swift.maxInFlight, 3)
+        self.assertEqual(
+            sorted(os.listdir(self.tmp.name)), sorted("%02d.dcm" % i for i in range(12))
+        )
+
+        # Pulling again only fetches what is missing or differs
+        os.remove(os.path.join(self.tmp.name, "03.dcm"))
+        with open(os.path.join(self.tmp.name, "05.dcm"), "r+b") as fp:
+            fp.write(b"corrupt")
+        self.swift.d_requests.clear()
+        d_pull = self.objPull()
+        self.assertEqual((d_pull["pulled"], d_pull["skipped"]), (2, 10))
+        self.assertEqual(self.swift.d_requests["GET"], 2)
+        self.assertEqual(
+            self.local_read(5), self.swift.d_object["users/SERVICES/PACS/s/05.dcm"]
+        )
+
+    def test_objPull_resume(self):
+        # An interrupted pull left part of an object behind
+        body: bytes = self.swift.d_object["users/SERVICES/PACS/s/07.dcm"]
+        with open(os.path.join(self.tmp.name, ".07.dcm.part"), "wb") as fp:
+            fp.write(body[:3000])
+        d_pull: dict = self.objPull()
+        self.assertTrue(d_pull["status"])
+        self.assertEqual(self.local_read(7), body)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, ".07.dcm.part")))
+
+
+class TestFileStorage(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.str_local = os.path.join(self.tmp.name, "local")
+        self.str_store = os.path.join(self.tmp.name, "store")
+        self.l_file = []
+        for i in range(8):
+            str_file = os.path.join(self.str_local, "dir%d" % (i % 3), "file%d" % i)
+            os.makedirs(os.path.dirname(str_file), exist_ok=True)
+            with open(str_file, "wb") as fp:
+                fp.write(os.urandom(1000 * (i + 1)))
+            self.l_file.append(str_file)
+        self.store = fileStorage(
+            {
+                "str_swiftIP": "",
+                "str_swiftPort": "",
+                "str_swiftLogin": "",
+                "str_storeBaseLocation": self.str_store,
+                "verbosity": 0,
+                "swiftThreads": 3,
+            }
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_objPut(self):
+        for skipped in [0, 8]:
+            d_put = self.store.objPut(
+                fileList=self.l_file,
+                toLocation="SERVICES/PACS/test",
+                mapLocationOver=self.str_local,
+            )
+            self.assertTrue(d_put["status"])
+            self.assertEqual(d_put["skipped"], skipped)
+        self.assertEqual(d_put["localFileList"], self.l_file)
+        for str_file, str_object in zip(self.l_file, d_put["objectFileList"]):
+            self.assertEqual(
+                str_object,
+                str_file.replace(
+                    self.str_local, self.str_store + "/SERVICES/PACS/test"
+                ),
+            )
+            with open(str_file, "rb") as fp, open(str_object, "rb") as fp_object:
+                self.assertEqual(fp_object.read(), fp.read())
+
+
+class TestFilesFind(TestCase):
+    def setUp(self):
+        self.swift = Swift()
+        self.store = swiftStorage_create(self.swift, swiftThreads=3)
+        self.tmp = tempfile.TemporaryDirectory()
+        for str_series in ["s1", "s2", "s3/echo"]:
+            os.makedirs(os.path.join(self.tmp.name, str_series))
+            for i in range(4):
+                with open(
+                    os.path.join(self.tmp.name, str_series, "%d.dcm" % i), "wb"
+                ) as fp:
+                    fp.write(b"%d" % i)
+        open(os.path.join(self.tmp.name, "s1", "series.info"), "w").close()
+        # like os.walk(), a link to a directory is listed but not followed
+        os.symlink(
+            os.path.join(self.tmp.name, "s1"), os.path.join(self.tmp.name, "link")
+        )
+
+    def tearDown(self):
+        self.swift.shutdown()
+        self.swift.server_close()
+        self.tmp.cleanup()
+
+    def test_filesFind(self):
+        l_file: list = []
+        l_dir: list = []
+        for str_root, l_dirs, l_files in os.walk(self.tmp.name):
+            l_file += [os.path.join(str_root, f) for f in l_files]
+            l_dir += [os.path.join(str_root, d) for d in l_dirs]
+        d_find = self.store.filesFind(root=self.tmp.name)
+        self.assertTrue(d_find["status"])
+        self.assertEqual(sorted(d_find["l_fileFS"]), sorted(l_file))
+        self.assertEqual(sorted(d_find["l_dirFS"]), sorted(l_dir))
+        self.assertEqual((d_find["numFiles"], d_find["numDirs"]), (13, 5))
+
+        d_find = self.store.filesFind(root=self.tmp.name, fileSubStr=".dcm")
+        self.assertEqual(d_find["numFiles"], 12)
+        d_find = self.store.filesFind(root=self.tmp.name, fileSubStr=".nii")
+        self.assertFalse(d_find["status"])
+
+    def test_objPut_process_streams(self):
+        l_event: list = []
+        filesFind_iter = self.store.filesFind_iter
+        file_put = self.store.file_put
+
+        def files_found(**kwargs):
+            for str_file in filesFind_iter(**kwargs):
+                l_event.append("found")
+                yield str_file
+
+        def file_recorded(str_localfilename, str_storagefilename):
+            d_put = file_put(str_localfilename, str_storagefilename)
+            l_event.append("put")
+            return d_put
+
+        self.store.filesFind_iter = files_found
+        self.store.file_put = file_recorded
+        d_put = self.store.objPut_process(
+            request={
+                "args": {
+                    "localpath": self.tmp.name,
+                    "toLocation": "SERVICES/PACS/test",
+                    "mapLocationOver": self.tmp.name,
+                    "threads": 1,
+                }
+            }
+        )
+        self.assertTrue(d_put["status"])
+        self.assertEqual(len(d_put["objectFileList"]), 13)
+        self.assertEqual(len(self.swift.d_object), 13)
+        # the first files are put before the last ones are found
+        self.assertLess(
+            l_event.index("put"), len(l_event) - 1 - l_event[::-1].index("found")
+        )
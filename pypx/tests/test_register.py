@@ -0,0 +1,159 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from pydicom.uid import generate_uid
+
+from pypx.register import Register, parser_interpret, parser_setup
+from pypx.tests.test_repack import DICOMfile_write
+
+
+class CUBE(ThreadingHTTPServer):
+    """
+    A stand-in for the CUBE 'pacsfiles/' API that records the registered
+    files and the number of concurrent requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), CUBEhandler)
+        self.lock = threading.Lock()
+        self.l_registered = []
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.url = "http://127.0.0.1:%d/api/v1/" % self.server_address[1]
+
+
+class CUBEhandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        cube = self.server
+        d_template = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        d_data = {d["name"]: d["value"] for d in d_template["template"]["data"]}
+        with cube.lock:
+            cube.inFlight += 1
+            cube.maxInFlight = max(cube.maxInFlight, cube.inFlight)
+        time.sleep(0.05)
+        with cube.lock:
+            cube.inFlight -= 1
+            cube.l_registered.append(d_data)
+            id = len(cube.l_registered)
+        str_href = "%spacsfiles/%d/" % (cube.url, id)
+        d_item = {
+            **d_data,
+            "id": id,
+            "creation_date": "2024-01-01T00:00:00Z",
+            "fname": d_data["path"],
+            "fsize": 0,
+        }
+        body = json.dumps(
+            {
+                "collection": {
+                    "version": "1.0",
+                    "href": str_href,
+                    "items": [
+                        {
+                            "href": str_href,
+                            "data": [
+                                {"name": k, "value": v} for k, v in d_item.items()
+                            ],
+                            "links": [],
+                        }
+                    ],
+                    "links": [],
+                }
+            }
+        ).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/vnd.collection+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestRegister(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.str_xcrDir = os.path.join(self.tmp.name, "series")
+        os.makedirs(self.str_xcrDir)
+        self.d_series: dict = {
+            "StudyInstanceUID": generate_uid(),
+            "SeriesInstanceUID": generate_uid(),
+        }
+        for i in range(6):
+            DICOMfile_write(
+                os.path.join(self.str_xcrDir, "image%d.dcm" % i),
+                InstanceNumber=i + 1,
+                **self.d_series,
+            )
+        self.cube = CUBE()
+        threading.Thread(target=self.cube.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.cube.shutdown()
+        self.cube.server_close()
+        self.tmp.cleanup()
+
+    def test_bulk_register(self):
+        args = parser_interpret(
+            parser_setup("test"),
+            [
+                "--xcrdir",
+                self.str_xcrDir,
+                "--parseAllFilesWithSubStr",
+                "dcm",
+                "--db",
+                os.path.join(self.tmp.name, "log"),
+                "--CUBEURL",
+                self.cube.url,
+                "--swiftServicesPACS",
+                "PACS",
+                "--threads",
+                "3",
+                "--checkpoint",
+                "4",
+                "--verbosity",
+                "0",
+            ],
+        )
+        registrar = Register(args)
+        l_writes: list = []
+        f_fieldsSet = registrar.smdb.store.fieldsSet
+        registrar.smdb.store.fieldsSet = lambda *a: l_writes.append(a) or f_fieldsSet(
+            *a
+        )
+        d_run = registrar.run({})
+
+        self.assertTrue(d_run["status"])
+        self.assertEqual(len(d_run["run"]), 6)
+        self.assertEqual(len(self.cube.l_registered), 6)
+        self.assertEqual(self.cube.maxInFlight, 3)
+        l_paths = [d["path"] for d in self.cube.l_registered]
+        self.assertEqual(len(set(l_paths)), 6)
+        self.assertTrue(all(p.startswith("SERVICES/PACS/PACS/") for p in l_paths))
+        self.assertTrue(
+            all(
+                d["SeriesInstanceUID"] == self.d_series["SeriesInstanceUID"]
+                for d in self.cube.l_registered
+            )
+        )
+        # One checkpoint and one final write of the register table
+        self.assertEqual(len(l_writes), 2)
+        registrar.smdb.d_DICOM = self.d_series
+        self.assertEqual(
+            registrar.smdb.seriesData("register", "objectCounter")["objectCounter"],
+            {"current": 6, "total": 6},
+        )
+        self.assertEqual(
+            registrar.smdb.series_dbFilesCount(
+                self.d_series["SeriesInstanceUID"], "register"
+            )["count"],
+            6,
+        )
@@ -0,0 +1,468 @@
+import os
+import tempfile
+from argparse import Namespace
+from unittest import TestCase, mock
+
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from pypx import repack
+
+
+def DICOMfile_write(str_file, rows=64, cols=64, **kwargs):
+    """
+    Write a small synthetic (but valid) DICOM image to <str_file>. Any
+    <kwargs> override the default tag values.
+    """
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.7"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(str_file, {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.PatientID = "1234567"
+    ds.PatientName = "Doe^John"
+    ds.PatientBirthDate = "20000101"
+    ds.StudyDate = "20200101"
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.SeriesDescription = "synthetic"
+    ds.Modality = "OT"
+    ds.InstanceNumber = 1
+    ds.Rows = rows
+    ds.Columns = cols
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.PixelData = bytes(rows * cols * 2)
+    for k, v in kwargs.items():
+        setattr(ds, k, v)
+    ds.save_as(str_file, enforce_file_format=True)
+    return str_file
+
+
+class TestDICOMfileRead(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.str_file = DICOMfile_write(os.path.join(self.tmp.name, "image.dcm"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_headerOnly_matches_full_read(self):
+        d_full = repack.Process.DICOMfile_read(file=self.str_file)
+        d_header = repack.Process.DICOMfile_read(file=self.str_file, headerOnly=True)
+        self.assertTrue(d_full["status"])
+        self.assertTrue(d_header["status"])
+        self.assertEqual(
+            d_full["d_DICOM"]["d_dicomSimple"], d_header["d_DICOM"]["d_dicomSimple"]
+        )
+        self.assertNotIn("PixelData", d_header["d_DICOM"]["dcm"])
+
+    def test_headerOnly_builds_representations_on_demand(self):
+        d_DICOM = repack.Process.DICOMfile_read(file=self.str_file, headerOnly=True)[
+            "d_DICOM"
+        ]
+        self.assertEqual(dict.__getitem__(d_DICOM, "str_raw"), "")
+        self.assertIn("Doe^John", d_DICOM["str_raw"])
+        self.assertIn("PatientID", d_DICOM["d_dicom"])
+        d_DICOM["d_dcm"] = "Not JSON serializable"
+        self.assertEqual(d_DICOM["d_dcm"], "Not JSON serializable")
+
+    def test_headerOnly_specific_tags(self):
+        d_DICOM = repack.Process.DICOMfile_read(
+            file=self.str_file,
+            headerOnly=True,
+            l_tagsToUse=["PatientID", "SeriesDescription"],
+        )["d_DICOM"]
+        self.assertEqual(
+            d_DICOM["d_dicomSimple"],
+            {"PatientID": "1234567", "SeriesDescription": "synthetic"},
+        )
+
+
+# The tags of a DICOM file, and two variants: without a PatientAge, and
+# with dashed dates and a SeriesDescription with runs of non-word characters
+d_tags: dict = {
+    "PatientID": "4412364",
+    "PatientName": "Doe^John",
+    "PatientBirthDate": "20100312",
+    "PatientAge": "012Y",
+    "StudyDate": "20220419",
+    "StudyDescription": "MRI Brain w/o contrast",
+    "StudyInstanceUID": "1.2.840.113619.2.5.1762583153.215519.978957063.78",
+    "AccessionNumber": "22681485",
+    "SeriesNumber": "7",
+    "SeriesDescription": "AX T2 FLAIR (fs) -- post",
+    "SeriesInstanceUID": "1.2.840.113619.2.5.1762583153.215519.978957063.79",
+    "SOPInstanceUID": "1.2.840.113619.2.5.1762583153.215519.978957063.80",
+    "InstanceNumber": "23",
+    "Modality": "MR",
+}
+d_tagsNoAge: dict = {k: v for k, v in d_tags.items() if k != "PatientAge"}
+d_tagsDashedDates: dict = {
+    **d_tags,
+    "PatientBirthDate": "2022-03-01",
+    "StudyDate": "2022-04-19",
+    "SeriesDescription": "  spaces\tand__under_scores  ",
+    "SeriesNumber": "12345678",
+}
+
+# (tags, template, result, PatientAge, AgeInDays) of tagsInString_process()
+l_golden: list = [
+    (
+        d_tags,
+        "%PatientID-%PatientName-%PatientBirthDate",
+        "4412364-Doe^John-20100312",
+        "012Y",
+        None,
+    ),
+    (
+        d_tags,
+        "%StudyDescription-%AccessionNumber-%StudyDate-%PatientAge-%AgeInDays",
+        "MRI Brain w/o contrast-22681485-20220419-012Y-004421d",
+        "012Y",
+        "004421d",
+    ),
+    (
+        d_tags,
+        "%_pad|5,0_SeriesNumber-%SeriesDescription-%_md5|7_SeriesInstanceUID",
+        "00007-AX T2 FLAIR (fs) -- post-11d3bf3",
+        "012Y",
+        None,
+    ),
+    (
+        d_tags,
+        "%_pad|4,0_InstanceNumber-%SOPInstanceUID.dcm",
+        "0023-1.2.840.113619.2.5.1762583153.215519.978957063.80.dcm",
+        "012Y",
+        None,
+    ),
+    (
+        d_tags,
+        "%PatientAge-%_md5|4_PatientID-output.txt",
+        "012Y-6203-output.txt",
+        "012Y",
+        None,
+    ),
+    (
+        d_tags,
+        "%_seahash|8_PatientID-%_seahash_StudyInstanceUID",
+        "4f4d0fef-87490816fa3356ec",
+        "012Y",
+        None,
+    ),
+    (d_tags, "%_md5_AccessionNumber", "2ad0cdd7b903f038b855751624bef732", "012Y", None),
+    (d_tags, "%_strmsk|**XX***_PatientID", "44XX364", "012Y", None),
+    (
+        d_tags,
+        "%_nospc|-_SeriesDescription/%_nospc_StudyDescription",
+        "AX-T2-FLAIR-fs-post/MRIBrainwocontrast",
+        "012Y",
+        None,
+    ),
+    (
+        d_tags,
+        "prefix-%Modality/%_pad|3,x_InstanceNumber_suffix",
+        "prefix-MR/x23_suffix",
+        "012Y",
+        None,
+    ),
+    (d_tags, "%PatientID%PatientName", "4412364Doe^John", "012Y", None),
+    (d_tags, "%Missing-%PatientID", "%Missing-4412364", "012Y", None),
+    (d_tags, "%AgeInDays", "004421d", "012Y", "004421d"),
+    (d_tags, "no tags at all", "no tags at all", "012Y", None),
+    (d_tags, "50% of %Modality", "50% of MR", "012Y", None),
+    (d_tags, "", "", "012Y", None),
+    (
+        d_tagsNoAge,
+        "%PatientID-%PatientName-%PatientBirthDate",
+        "4412364-Doe^John-20100312",
+        None,
+        None,
+    ),
+    (
+        d_tagsNoAge,
+        "%StudyDescription-%AccessionNumber-%StudyDate-%PatientAge-%AgeInDays",
+        "MRI Brain w/o contrast-22681485-20220419-012Y-004421d",
+        "012Y",
+        "004421d",
+    ),
+    (
+        d_tagsNoAge,
+        "%_pad|5,0_SeriesNumber-%SeriesDescription-%_md5|7_SeriesInstanceUID",
+        "00007-AX T2 FLAIR (fs) -- post-11d3bf3",
+        None,
+        None,
+    ),
+    (
+        d_tagsNoAge,
+        "%_pad|4,0_InstanceNumber-%SOPInstanceUID.dcm",
+        "0023-1.2.840.113619.2.5.1762583153.215519.978957063.80.dcm",
+        None,
+        None,
+    ),
+    (
+        d_tagsNoAge,
+        "%PatientAge-%_md5|4_PatientID-output.txt",
+        "012Y-6203-output.txt",
+        "012Y",
+        None,
+    ),
+    (
+        d_tagsNoAge,
+        "%_seahash|8_PatientID-%_seahash_StudyInstanceUID",
+        "4f4d0fef-87490816fa3356ec",
+        None,
+        None,
+    ),
+    (
+        d_tagsNoAge,
+        "%_md5_AccessionNumber",
+        "2ad0cdd7b903f038b855751624bef732",
+        None,
+        None,
+    ),
+    (d_tagsNoAge, "%_strmsk|**XX***_PatientID", "44XX364", None, None),
+    (
+        d_tagsNoAge,
+        "%_nospc|-_SeriesDescription/%_nospc_StudyDescription",
+        "AX-T2-FLAIR-fs-post/MRIBrainwocontrast",
+        None,
+        None,
+    ),
+    (
+        d_tagsNoAge,
+        "prefix-%Modality/%_pad|3,x_InstanceNumber_suffix",
+        "prefix-MR/x23_suffix",
+        None,
+        None,
+    ),
+    (d_tagsNoAge, "%PatientID%PatientName", "4412364Doe^John", None, None),
+    (d_tagsNoAge, "%Missing-%PatientID", "%Missing-4412364", None, None),
+    (d_tagsNoAge, "%AgeInDays", "004421d", None, "004421d"),
+    (d_tagsNoAge, "no tags at all", "no tags at all", None, None),
+    (d_tagsNoAge, "50% of %Modality", "50% of MR", None, None),
+    (d_tagsNoAge, "", "", None, None),
+    (
+        d_tagsDashedDates,
+        "%PatientID-%PatientName-%PatientBirthDate",
+        "4412364-Doe^John-2022-03-01",
+        "012Y",
+        None,
+    ),
+    (
+        d_tagsDashedDates,
+        "%StudyDescription-%AccessionNumber-%StudyDate-%PatientAge-%AgeInDays",
+        "MRI Brain w/o contrast-22681485-2022-04-19-012Y-000049d",
+        "012Y",
+        "000049d",
+    ),
+    (
+        d_tagsDashedDates,
+        "%_pad|5,0_SeriesNumber-%SeriesDescription-%_md5|7_SeriesInstanceUID",
+        "12345678-  spaces\tand__under_scores  -11d3bf3",
+        "012Y",
+        None,
+    ),
+    (
+        d_tagsDashedDates,
+        "%_pad|4,0_InstanceNumber-%SOPInstanceUID.dcm",
+        "0023-1.2.840.113619.2.5.1762583153.215519.978957063.80.dcm",
+        "012Y",
+        None,
+    ),
+    (
+        d_tagsDashedDates,
+        "%PatientAge-%_md5|4_PatientID-output.txt",
+        "012Y-6203-output.txt",
+        "012Y",
+        None,
+    ),
+    (
+        d_tagsDashedDates,
+        "%_seahash|8_PatientID-%_seahash_StudyInstanceUID",
+        "4f4d0fef-87490816fa3356ec",
+        "012Y",
+        None,
+    ),
+    (
+        d_tagsDashedDates,
+        "%_md5_AccessionNumber",
+        "2ad0cdd7b903f038b855751624bef732",
+        "012Y",
+        None,
+    ),
+    (d_tagsDashedDates, "%_strmsk|**XX***_PatientID", "44XX364", "012Y", None),
+    (
+        d_tagsDashedDates,
+        "%_nospc|-_SeriesDescription/%_nospc_StudyDescription",
+        "spaces-and__under_scores/MRIBrainwocontrast",
+        "012Y",
+        None,
+    ),
+    (
+        d_tagsDashedDates,
+        "prefix-%Modality/%_pad|3,x_InstanceNumber_suffix",
+        "prefix-MR/x23_suffix",
+        "012Y",
+        None,
+    ),
+    (d_tagsDashedDates, "%PatientID%PatientName", "4412364Doe^John", "012Y", None),
+    (d_tagsDashedDates, "%Missing-%PatientID", "%Missing-4412364", "012Y", None),
+    (d_tagsDashedDates, "%AgeInDays", "000049d", "012Y", "000049d"),
+    (d_tagsDashedDates, "no tags at all", "no tags at all", "012Y", None),
+    (d_tagsDashedDates, "50% of %Modality", "50% of MR", "012Y", None),
+    (d_tagsDashedDates, "", "", "012Y", None),
+]
+
+
+class TestTemplate(TestCase):
+    def test_golden(self):
+        for d_tagSet, str_template, str_result, str_age, str_ageInDays in l_golden:
+            d_DICOM = {"l_tagRaw": sorted(d_tagSet), "d_dicomSimple": dict(d_tagSet)}
+            d_process = repack.Process.tagsInString_process(None, d_DICOM, str_template)
+            self.assertEqual(d_process["str_result"], str_result, str_template)
+            self.assertEqual(
+                d_process["b_tagsFound"], str_template not in ["no tags at all", ""]
+            )
+            self.assertEqual(d_DICOM["d_dicomSimple"].get("PatientAge"), str_age)
+            self.assertEqual(d_DICOM["d_dicomSimple"].get("AgeInDays"), str_ageInDays)
+
+    def test_compiled_once(self):
+        str_template = "%_pad|5,0_SeriesNumber-%_md5|7_SeriesInstanceUID"
+        self.assertIs(
+            repack.template_compile(str_template), repack.template_compile(str_template)
+        )
+        self.assertEqual(
+            [part[0] for part in repack.template_compile(str_template).l_part],
+            ["SeriesNumber", "SeriesInstanceUID"],
+        )
+
+    def test_repeated_tag(self):
+        d_DICOM = {"l_tagRaw": sorted(d_tags), "d_dicomSimple": dict(d_tags)}
+        self.assertEqual(
+            repack.template_compile("%_pad_SeriesNumber-%_pad|2_SeriesNumber").evaluate(
+                d_DICOM
+            )["str_result"],
+            "7-07",
+        )
+
+
+class TestFilePlace(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.str_source = os.path.join(self.tmp.name, "received.dcm")
+        with open(self.str_source, "wb") as fp:
+            fp.write(b"DICM" * 1000)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_placements(self):
+        for str_placement in ["copy", "hardlink", "reflink"]:
+            str_destination = os.path.join(self.tmp.name, str_placement + ".dcm")
+            # placing twice replaces the earlier file
+            for attempt in range(2):
+                d_place = repack.file_place(
+                    self.str_source, str_destination, str_placement
+                )
+                self.assertTrue(d_place["status"], d_place["error"])
+            with open(str_destination, "rb") as fp:
+                self.assertEqual(fp.read(), b"DICM" * 1000)
+            self.assertEqual(
+                os.path.samefile(self.str_source, str_destination),
+                d_place["placement"] == "hardlink",
+            )
+        self.assertEqual(len(os.listdir(self.tmp.name)), 4)
+        d_place = repack.file_place(
+            self.str_source, os.path.join(self.tmp.name, "move.dcm"), "move"
+        )
+        self.assertEqual(d_place["placement"], "move")
+        self.assertFalse(os.path.exists(self.str_source))
+
+    def test_hardlink_fallback(self):
+        with mock.patch.object(
+            repack.os, "link", side_effect=OSError(repack.errno.EXDEV, "cross-device")
+        ):
+            d_place = repack.file_place(
+                self.str_source, os.path.join(self.tmp.name, "out.dcm"), "hardlink"
+            )
+        self.assertTrue(d_place["status"])
+        self.assertEqual(d_place["placement"], "copy")
+
+    def test_copy_fallback(self):
+        # e.g. a kernel without copy_file_range across these filesystems
+        str_destination = os.path.join(self.tmp.name, "out.dcm")
+        with mock.patch.object(
+            repack.os,
+            "copy_file_range",
+            side_effect=OSError(repack.errno.EXDEV, "cross-device"),
+        ):
+            repack.file_copy(self.str_source, str_destination)
+        with open(str_destination, "rb") as fp:
+            self.assertEqual(fp.read(), b"DICM" * 1000)
+        self.assertTrue(repack.file_matches(self.str_source, str_destination))
+
+    def test_files_place(self):
+        os.utime(self.str_source, (1000000000, 1000000000))
+        l_destination = [
+            os.path.join(self.tmp.name, "series%d" % (i % 2), "image%d.dcm" % i)
+            for i in range(6)
+        ]
+        l_place = repack.files_place(
+            [self.str_source] * 6, l_destination, "reflink", threads=3
+        )
+        self.assertEqual([d["status"] for d in l_place], [True] * 6)
+        self.assertEqual([d["path"] for d in l_place], l_destination)
+        for str_destination in l_destination:
+            self.assertEqual(os.stat(str_destination).st_mtime, 1000000000)
+
+        # a destination that is up to date is skipped
+        with open(l_destination[0], "r+b") as fp:
+            fp.write(b"XXXX")
+        os.utime(l_destination[0], (1000000000, 1000000000))
+        with open(l_destination[1], "ab") as fp:
+            fp.write(b"DICM")
+        l_place = repack.files_place([self.str_source] * 6, l_destination, "copy")
+        self.assertEqual(
+            [d["placement"] for d in l_place], ["skip", "copy"] + ["skip"] * 4
+        )
+        # unless the content is compared
+        l_place = repack.files_place(
+            [self.str_source] * 6, l_destination, "copy", str_match="hash"
+        )
+        self.assertEqual([d["placement"] for d in l_place], ["copy"] + ["skip"] * 5)
+        with open(l_destination[0], "rb") as fp:
+            self.assertEqual(fp.read(), b"DICM" * 1000)
+
+    def test_outputDir_created_once_per_series(self):
+        process = repack.Process.__new__(repack.Process)
+        process.args = repack.args_impedanceMatch(
+            Namespace(
+                str_dataDir=os.path.join(self.tmp.name, "data"),
+                str_placement="hardlink",
+            )
+        )
+        process.s_outputDir = set()
+        with mock.patch.object(repack.os, "makedirs", wraps=os.makedirs) as makedirs:
+            for i in range(3):
+                str_file = DICOMfile_write(
+                    os.path.join(self.tmp.name, "%d.dcm" % i),
+                    SeriesInstanceUID="1.2.3",
+                    InstanceNumber=i,
+                )
+                d_save = process.DICOMfile_save(
+                    repack.Process.DICOMfile_read(file=str_file, headerOnly=True)
+                )
+                self.assertTrue(d_save["status"], d_save["errorCopy"])
+                self.assertEqual(d_save["placement"], "hardlink")
+        # (os.makedirs() recursively calls itself for the parents)
+        self.assertEqual(
+            [c.args[0] for c in makedirs.call_args_list].count(d_save["outputDir"]), 1
+        )
+        self.assertEqual(len(os.listdir(d_save["outputDir"])), 3)
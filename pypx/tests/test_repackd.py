@@ -0,0 +1,116 @@
+import os
+import signal
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from pypx import repack
+from pypx import repackd
+from pypx.tests.test_repack import DICOMfile_write
+
+
+class TestRepackDaemon(TestCase):
+    def daemon_create(self, *l_extra):
+        self.tmp = tempfile.TemporaryDirectory()
+        str_watchDir = os.path.join(self.tmp.name, "incoming")
+        os.makedirs(str_watchDir)
+        args, unknown = repack.parser_interpret(
+            repack.parser_setup("test"),
+            [
+                "--daemon",
+                "--watchdir",
+                str_watchDir,
+                "--logdir",
+                os.path.join(self.tmp.name, "log"),
+                "--verbosity",
+                "0",
+                "--pollInterval",
+                "0.1",
+                *l_extra,
+            ],
+        )
+        return repackd.Daemon(args)
+
+    def queue_drain(self, daemon, timeout=3):
+        l_files = []
+        t_end = time.time() + timeout
+        while time.time() < t_end:
+            while not daemon.q_files.empty():
+                l_files.append(daemon.q_files.get())
+            if l_files:
+                break
+            time.sleep(0.05)
+        return l_files
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_poll_watch_queues_stable_files(self):
+        daemon = self.daemon_create("--poll", "--parseAllFilesWithSubStr", "dcm")
+        daemon.sources_start()
+        str_file = os.path.join(daemon.str_watchDir, "sub", "img.dcm")
+        os.makedirs(os.path.dirname(str_file))
+        with open(str_file, "w") as fp:
+            fp.write("data")
+        with open(os.path.join(daemon.str_watchDir, "ignored.txt"), "w") as fp:
+            fp.write("data")
+        l_files = self.queue_drain(daemon)
+        daemon.stop()
+        self.assertEqual(l_files, [str_file])
+
+    def test_fifo_queues_file_names(self):
+        str_fifo = os.path.join(tempfile.gettempdir(), "repackd-test-%d" % os.getpid())
+        daemon = self.daemon_create("--fifo", str_fifo)
+        daemon.fifo_read()
+        with open(str_fifo, "w") as fp:
+            fp.write("/some/dir/a.dcm\n/some/dir/b.dcm\n")
+        time.sleep(0.5)
+        l_files = self.queue_drain(daemon)
+        daemon.stop()
+        os.unlink(str_fifo)
+        self.assertEqual(l_files, ["/some/dir/a.dcm", "/some/dir/b.dcm"])
+
+    def test_run_repacks_files(self):
+        daemon = self.daemon_create(
+            "--poll", "--parseAllFilesWithSubStr", "dcm", "--workers", "2"
+        )
+        str_dataDir = os.path.join(self.tmp.name, "data")
+        daemon.args.str_dataDir = str_dataDir
+        for i in range(3):
+            DICOMfile_write(
+                os.path.join(daemon.str_watchDir, "%d.dcm" % i),
+                InstanceNumber=i + 1,
+                StudyInstanceUID="1.2.3",
+                SeriesInstanceUID="1.2.3.4",
+            )
+
+        def stop_whenDone():
+            # (or, at the latest, on the timer)
+            while not daemon.event_stop.wait(0.1):
+                if daemon.d_stats["repacked"] + daemon.d_stats["failed"] >= 3:
+                    daemon.stop()
+
+        timer = threading.Timer(30, daemon.stop)
+        timer.start()
+        threading.Thread(target=stop_whenDone, daemon=True).start()
+        l_handler = [signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)]
+        try:
+            d_run = daemon.run()
+        finally:
+            timer.cancel()
+            for sig, handler in zip((signal.SIGINT, signal.SIGTERM), l_handler):
+                signal.signal(sig, handler)
+
+        self.assertTrue(d_run["status"])
+        self.assertEqual(d_run["stats"]["received"], 3)
+        self.assertEqual(d_run["stats"]["repacked"], 3)
+        self.assertEqual(d_run["stats"]["failed"], 0)
+        l_packed = [
+            os.path.join(str_root, str_file)
+            for str_root, l_dirs, l_files in os.walk(str_dataDir)
+            for str_file in l_files
+            if str_file.endswith(".dcm")
+        ]
+        self.assertEqual(len(l_packed), 3)
+        self.assertEqual(len({os.path.dirname(f) for f in l_packed}), 1)
@@ -0,0 +1,274 @@
+import multiprocessing
+import os
+import tempfile
+from argparse import Namespace
+from unittest import TestCase
+
+from pydicom.uid import generate_uid
+
+from pypx import repack
+from pypx import smdb
+from pypx import smdbstore
+from pypx.status import Status
+from pypx.tests.test_repack import DICOMfile_write
+
+
+class TestSMDBstore(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.str_xcrDir = os.path.join(self.tmp.name, "incoming")
+        self.str_logDir = os.path.join(self.tmp.name, "log")
+        os.makedirs(self.str_xcrDir)
+        d_series: dict = {
+            "StudyInstanceUID": generate_uid(),
+            "SeriesInstanceUID": generate_uid(),
+        }
+        self.l_files = [
+            DICOMfile_write(
+                os.path.join(self.str_xcrDir, "image%d.dcm" % i),
+                InstanceNumber=i + 1,
+                **d_series,
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def repack_run(self, *l_extra) -> dict:
+        args, unknown = repack.parser_interpret(
+            repack.parser_setup("test"),
+            [
+                "--xcrdir",
+                self.str_xcrDir,
+                "--parseAllFilesWithSubStr",
+                "dcm",
+                "--logdir",
+                self.str_logDir,
+                "--datadir",
+                os.path.join(self.tmp.name, "data"),
+                "--verbosity",
+                "0",
+                *l_extra,
+            ],
+        )
+        return repack.Process(args).run()
+
+    def db_check(self, db, d_DICOM):
+        self.assertEqual(
+            db.series_receivedFilesCount(d_DICOM["SeriesInstanceUID"])["count"], 3
+        )
+        self.assertEqual(
+            db.series_packedFilesCount(d_DICOM["SeriesInstanceUID"])["count"], 3
+        )
+        self.assertTrue(db.series_statusGet(d_DICOM["SeriesInstanceUID"])["status"])
+        self.assertEqual(
+            db.study_seriesListGet(d_DICOM["StudyInstanceUID"])["seriesList"],
+            [d_DICOM["SeriesInstanceUID"]],
+        )
+        db.DICOMobj_set(d_DICOM)
+        self.assertTrue(db.seriesData("pack", "seriesPack")["seriesPack"])
+        self.assertIn(
+            d_DICOM["StudyInstanceUID"],
+            db.imageDirs_getOnPatientID(d_DICOM["PatientID"])["d_imageDirs"],
+        )
+
+    def DICOM_get(self, d_run) -> dict:
+        return d_run["run"][0]["d_DICOMfile_save"]["d_DICOMfile_read"]["d_DICOM"][
+            "d_dicomSimple"
+        ]
+
+    def test_sqlite_backend(self):
+        d_run = self.repack_run("--dbtype", "sqlite")
+        self.assertTrue(d_run["status"])
+        self.assertTrue(os.path.isfile(os.path.join(self.str_logDir, "smdb.sqlite")))
+        self.assertFalse(os.listdir(os.path.join(self.str_logDir, "seriesData")))
+        # The backend is detected from the log dir
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir))
+        self.assertIsInstance(db.store, smdbstore.SQLitestore)
+        self.db_check(db, self.DICOM_get(d_run))
+
+    def test_migrate_JSON_tree(self):
+        d_run = self.repack_run()
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir))
+        self.assertIsInstance(db.store, smdbstore.JSONstore)
+        self.db_check(db, self.DICOM_get(d_run))
+
+        d_migrate = smdbstore.JSONtree_migrate(self.str_logDir)
+        self.assertTrue(d_migrate["status"])
+        self.assertEqual(d_migrate["imported"]["image"], 3)
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir))
+        self.assertIsInstance(db.store, smdbstore.SQLitestore)
+        self.db_check(db, self.DICOM_get(d_run))
+
+    def test_image_log(self):
+        d_DICOM = self.DICOM_get(self.repack_run())
+        str_seriesUID: str = d_DICOM["SeriesInstanceUID"]
+        str_seriesDataDir: str = os.path.join(self.str_logDir, "seriesData")
+        self.assertEqual(
+            sorted(os.listdir(str_seriesDataDir)),
+            sorted(
+                [
+                    "%s-%s" % (str_seriesUID, str_table)
+                    for str_table in [
+                        "meta.json",
+                        "pack.json",
+                        "images.log",
+                        "images.count",
+                    ]
+                ]
+            ),
+        )
+        # repacking the same files again does not record them twice
+        self.repack_run()
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir))
+        self.assertEqual(db.series_receivedFilesCount(str_seriesUID)["count"], 3)
+        # ... and the count is read without a read of the log
+        self.assertNotIn(str_seriesUID, db.d_seriesImages)
+        d_imageObj: dict = db.series_imageObjGet(str_seriesUID)[str_seriesUID][
+            "imageObj"
+        ]
+        self.assertEqual(len(d_imageObj), 3)
+        for d_image in d_imageObj.values():
+            self.assertEqual(os.path.getsize(d_image["FSlocation"]), d_image["size"])
+
+    def test_legacy_image_tables(self):
+        d_DICOM = self.DICOM_get(self.repack_run())
+        str_seriesUID: str = d_DICOM["SeriesInstanceUID"]
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir))
+        d_imageObj: dict = db.series_imageObjGet(str_seriesUID)
+        # Rewrite the catalog as an older tree with a JSON table per image
+        str_imageDir: str = os.path.join(
+            self.str_logDir, "seriesData", str_seriesUID + "-img"
+        )
+        os.makedirs(str_imageDir)
+        os.remove(db.seriesImageLog_name(str_seriesUID))
+        for str_outputFile in d_imageObj[str_seriesUID]["imageObj"]:
+            db.store.write(
+                "%s/%s.json" % (str_imageDir, str_outputFile),
+                db.series_imageObjGet(str_seriesUID, [str_outputFile]),
+            )
+
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir))
+        self.db_check(db, d_DICOM)
+        self.assertEqual(
+            db.series_imageObjGet(str_seriesUID)[str_seriesUID]["imageObj"],
+            d_imageObj[str_seriesUID]["imageObj"],
+        )
+
+    def test_mapsUpdateForPatient(self):
+        d_DICOM = self.DICOM_get(self.repack_run())
+        str_seriesUID: str = d_DICOM["SeriesInstanceUID"]
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir))
+        str_log: str = db.seriesImageLog_name(str_seriesUID)
+        # Lose all but the first image of the series from the catalog (and
+        # its count, so that the series is counted from its log)
+        with open(str_log) as fp:
+            str_first: str = fp.readline()
+        with open(str_log, "w") as fp:
+            fp.write(str_first)
+        os.remove(db.store.logCount_name(str_log))
+        self.assertEqual(db.series_receivedFilesCount(str_seriesUID)["count"], 1)
+
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir, jobs=2))
+        d_update: dict = db.mapsUpdateForPatient_do(d_DICOM["PatientID"])
+        self.assertTrue(d_update["status"])
+        self.assertEqual(d_update["files"], 3)
+        self.assertEqual(d_update["series"][str_seriesUID]["added"], 2)
+        self.assertEqual(
+            sorted(d_update["timings"]), ["list", "read", "total", "write"]
+        )
+        with open(str_log) as fp:
+            self.assertEqual(len(fp.readlines()), 3)
+        self.db_check(smdb.SMDB(Namespace(str_logDir=self.str_logDir)), d_DICOM)
+
+    def test_study_status_index(self):
+        d_DICOM = self.DICOM_get(self.repack_run())
+        str_seriesUID: str = d_DICOM["SeriesInstanceUID"]
+        db = smdb.SMDB(Namespace(str_logDir=self.str_logDir))
+        db.DICOMobj_set(d_DICOM)
+        db.seriesData("retrieve", "NumberOfSeriesRelatedInstances", 3)
+
+        d_index = db.study_seriesIndexGet(d_DICOM["StudyInstanceUID"])
+        self.assertEqual(list(d_index["series"].keys()), [str_seriesUID])
+        d_images = d_index["series"][str_seriesUID]["images"]
+        self.assertEqual(d_images, db.series_receivedAndRequested(str_seriesUID))
+        self.assertEqual(d_images["state"], "ImagesAllReceivedOK")
+        for str_count in ["received", "requested", "packed"]:
+            self.assertEqual(d_images[str_count]["count"], 3)
+
+        d_args: dict = {
+            "dblogbasepath": self.str_logDir,
+            "StudyInstanceUID": d_DICOM["StudyInstanceUID"],
+            "verifySeriesInStudy": True,
+            "verbosity": 0,
+        }
+        d_study = Status(d_args).run({**d_args, "SeriesInstanceUID": ""})
+        d_series = Status(d_args).run({**d_args, "SeriesInstanceUID": str_seriesUID})
+        self.assertEqual(d_study["series"][str_seriesUID]["state"], d_series["state"])
+        self.assertEqual(d_series["state"]["study"], "StudyContainsSeriesOK")
+        self.assertEqual(d_series["state"]["images"], "ImagesAllReceivedOK")
+
+
+def log_append(str_log: str, worker: int, records: int) -> None:
+    store = smdbstore.JSONstore(os.path.dirname(str_log))
+    for i in range(records):
+        store.logAppend(
+            str_log, {"file": "%d-%d.dcm" % (worker, i), "location": "x" * 200}
+        )
+
+
+class TestImageLog(TestCase):
+    def logs_hammer(self, l_log: list, workers: int, records: int) -> None:
+        """
+        Append <records> records to each of the logs of <l_log> from
+        each of <workers> processes at once.
+        """
+        l_process: list = [
+            multiprocessing.Process(target=log_append, args=(str_log, worker, records))
+            for worker in range(workers)
+            for str_log in l_log
+        ]
+        for process in l_process:
+            process.start()
+        for process in l_process:
+            process.join()
+
+    def test_concurrent_appends(self):
+        with tempfile.TemporaryDirectory() as str_dir:
+            str_log: str = os.path.join(str_dir, "series-images.log")
+            self.logs_hammer([str_log], 4, 250)
+            store = smdbstore.JSONstore(str_dir)
+            d_read: dict = store.logRead(str_log)
+            self.assertEqual(len(d_read["records"]), 1000)
+            self.assertEqual(store.logCount(str_log), 1000)
+            self.assertTrue(store.logContains(str_log, "3-249.dcm"))
+            self.assertFalse(store.logContains(str_log, "3-250.dcm"))
+            self.assertEqual(len({d["file"] for d in d_read["records"]}), 1000)
+            self.assertEqual(d_read["offset"], os.path.getsize(str_log))
+
+    def test_concurrent_counts(self):
+        with tempfile.TemporaryDirectory() as str_dir:
+            store = smdbstore.JSONstore(str_dir)
+            # many fresh logs, whose first records race each other, and a
+            # log of an older tree without a count
+            l_log: list = [os.path.join(str_dir, "%d-images.log" % i) for i in range(8)]
+            with open(l_log[0], "w") as fp:
+                for i in range(10):
+                    fp.write('{"file":"old-%d.dcm"}\n' % i)
+            self.assertEqual(store.logCount(l_log[0]), -1)
+            self.logs_hammer(l_log, 6, 5)
+            for str_log in l_log:
+                self.assertEqual(
+                    store.logCount(str_log), len(store.logRead(str_log)["records"])
+                )
+            self.assertEqual(store.logCount(l_log[0]), 40)
+            # neither lock nor temporary files are left behind
+            self.assertEqual(
+                sorted(os.listdir(str_dir)),
+                sorted(
+                    "%d-images.%s" % (i, str_suffix)
+                    for i in range(8)
+                    for str_suffix in ["log", "count"]
+                ),
+            )
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from pypx import smdblock, smdbstore
+
+
+def table_hammer(str_table: str, worker: int, updates: int) -> None:
+    """
+    Increment the 'count' of the <str_table> and set a field of
+    its own, <updates> times.
+    """
+
+    def count_increment(d_table: dict) -> dict:
+        d_table["count"] = d_table.get("count", 0) + 1
+        return d_table
+
+    store = smdbstore.JSONstore(os.path.dirname(str_table))
+    for i in range(updates):
+        store.update(str_table, count_increment)
+        store.fieldsSet(str_table, {"%d-%d" % (worker, i): i})
+
+
+class TestLock(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.str_table = os.path.join(self.tmp.name, "1.2.3-meta.json")
+        smdblock.metrics_reset()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_no_lost_updates(self):
+        workers, updates = 6, 50
+        l_process: list = [
+            multiprocessing.Process(
+                target=table_hammer, args=(self.str_table, worker, updates)
+            )
+            for worker in range(workers)
+        ]
+        for process in l_process:
+            process.start()
+        for process in l_process:
+            process.join()
+        d_table: dict = smdblock.jsonFile_read(self.str_table)
+        self.assertEqual(d_table["count"], workers * updates)
+        self.assertEqual(len(d_table), 1 + workers * updates)
+        # neither lock nor temporary files are left behind
+        self.assertEqual(os.listdir(self.tmp.name), ["1.2.3-meta.json"])
+
+    def test_stale_lock_file(self):
+        # a lock file left by a crashed writer does not hold anyone up
+        open(os.path.join(self.tmp.name, "1.2.3-meta.lock"), "w").close()
+        t_start: float = time.monotonic()
+        d_set: dict = smdbstore.JSONstore(self.tmp.name).fieldsSet(
+            self.str_table, {"a": 1}
+        )
+        self.assertTrue(d_set["status"])
+        self.assertLess(time.monotonic() - t_start, 0.5)
+        self.assertEqual(smdblock.jsonFile_read(self.str_table), {"a": 1})
+
+    def test_timeout(self):
+        with smdblock.FileLock(self.str_table):
+            with self.assertRaises(smdblock.LockTimeout):
+                smdblock.FileLock(self.str_table, timeout=0.1).acquire()
+            with mock.patch.object(smdblock, "lockTimeout", 0.1):
+                d_set: dict = smdbstore.JSONstore(self.tmp.name).fieldsSet(
+                    self.str_table, {"a": 1}
+                )
+            self.assertFalse(d_set["status"])
+            self.assertIn("Could not lock", d_set["error"])
+        d_metrics: dict = smdblock.metrics_get()
+        self.assertEqual(d_metrics["acquired"], 1)
+        self.assertEqual(d_metrics["timeouts"], 2)
+        self.assertGreaterEqual(d_metrics["waitMax"], 0.1)
@@ -33,6 +33,9 @@ setup(
         "aiohttp",
         "python-chrisclient",
     ],
+    extras_require={
+        "netdicom": ["pynetdicom"],
+    },
     test_suite="nose.collector",
     tests_require=["nose"],
     scripts=[
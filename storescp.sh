@@ -11,7 +11,8 @@ SYNPOSIS
 
   storescp.sh           [-p <port>]                                         \\
                         [-E <execRootPath>]                                 \\
-                        [-D <dataRootPath>]
+                        [-D <dataRootPath>]                                 \\
+                        [-F <repackFIFO>]
 
 DESC
 
@@ -20,20 +21,31 @@ DESC
   command in an xinet.d service file, an alternate solution is
   to place a simpler script in the service file. This script in
   turn launches the actual listener.
+
+  If a <repackFIFO> is specified, each received file is not repacked
+  by a new 'px-repack' process, but its name is written to the FIFO
+  on which a long lived 'px-repack --daemon --fifo <repackFIFO>' is
+  expected to be listening.
 "
 
 PORT=10402
 EXECROOTPATH="/usr/local/bin"
 DATAROOTPATH="/home/dicom"
 TMPINCOMINGDATA=/tmp/data
+REPACKFIFO=""
 
-while getopts "p:E:D:t:" opt; do
+while getopts "p:E:D:t:F:" opt; do
     case $opt in
         t) TMPINCOMINGDATA=$OPTARG              ;;
         p) PORT=$OPTARG                         ;;
         E) EXECROOTPATH=$OPTARG                 ;;
         D) DATAROOTPATH=$OPTARG                 ;;
+        F) REPACKFIFO=$OPTARG                   ;;
     esac
 done
 mkdir $TMPINCOMINGDATA
+if [[ -n $REPACKFIFO ]] ; then
+    eval storescp -od $TMPINCOMINGDATA -pm -sp -xcr \"echo \#p/\#f \> $REPACKFIFO\" $PORT
+    exit
+fi
 eval storescp -od $TMPINCOMINGDATA -pm -sp -xcr \"$EXECROOTPATH/px-repack --xcrdir \#p --xcrfile \#f --verbosity 0 --logdir $DATAROOTPATH/log --datadir $DATAROOTPATH/data --cleanup\" $PORT